@@ -3,25 +3,53 @@
 # Made with ♥ by GPT-5 Thinking & You
 #
 # Features:
-# - 4-line staff, 42 bars, 4 beats/bar
+# - 4-line staff, 42 bars, 4 beats/bar; 480 ticks per beat with 8th/16th/triplet snap
 # - Tools: full, half, combo, rest, erase
 # - Two customizable clefs (left/right)
-# - Visual metronome with BPM
+# - Visual metronome with BPM, plus a tempo map (changes and ramps at any bar)
 # - Timeline controls: Play/Pause/Stop + Scrub to any beat
+# - A/B loop region, pre-rendered into one buffer and played back gaplessly
 # - Simple built-in synth sampler (sine/square/saw) per symbol; pitch comes from lane (4 lines + 4 gaps = 8 lanes)
 # - Optional mic recording, if 'sounddevice' is installed (falls back gracefully if not)
-# - No extra files; everything lives in this single script
+# - Multi-sample instrument banks (JSON + WAV files), memory-mapped, with velocity layers
+# - WAV import (any bit depth, rate and channel count), streamed in the background
+# - Tunings: 12-TET or just intonation around any tonic and reference pitch, or Scala .scl/.kbm files
+# - Per-track insert effects (filter, delay, reverb) and a master chain, the same live and offline
+# - Optional audio engine in its own process, fed through a shared-memory ring
+# - Audio profiles (sample rate, block size, quality) for slow or fast machines; `profiles` measures them
+# - Transport sync between instances over UDP multicast: tempo, phase and start/stop
+# - Audio-to-notes transcription from the mic or a WAV (`python sheet42.py transcribe`)
+# - Every edit is journalled: undo/redo, and the sheet comes back after a crash
+# - Projects save to .s42 (JSON); `python sheet42.py render PROJECTS...` bounces them to WAV headlessly
+# - SHEET42_AUDIO=null or capture:PATH.wav runs without a sound card
+# - The code is this single script; at run time it keeps rendered notes, imported WAVs,
+#   audio.json and the journal under ~/.cache/sheet42, and reads the .s42 projects,
+#   instrument banks and tuning files you open
 
-import tkinter as tk
-from tkinter import ttk, font, messagebox
-import sys, math, time, struct, io, shutil, tempfile, subprocess
+try:
+    import tkinter as tk
+    from tkinter import ttk, font, messagebox, filedialog
+except ImportError:  # headless installs can still batch render
+    tk = None
+import sys, math, time, struct, io, os, re, json, bisect, hashlib, mmap, operator, random, shutil, socket, tempfile, subprocess, threading
+import wave
+import multiprocessing
+from multiprocessing import shared_memory
+from array import array
+from collections import deque
 
 APP_TITLE = "Four-Line Sheet — 42 Bars (Sampler)"
 BARS = 42
 BEATS_PER_BAR = 4
+PPQ = 480  # ticks per beat (quarter note)
+TICKS_PER_BAR = PPQ * BEATS_PER_BAR
+TOTAL_TICKS = TICKS_PER_BAR * BARS
 STAFF_LINES = 4
 LANES = 8  # 4 lines + 4 gaps
-BAR_W = 80
+BAR_W = 80  # default zoom, pixels per bar
+ZOOM_BAR_W = (10, 20, 40, 80, 160, 320)  # sheet zoom levels, pixels per bar
+LOD_BLOCKS_BELOW = 40  # narrower bars draw as density blocks instead of note glyphs
+SAMPLE_RATE = 44100
 MARGIN_X = 60
 MARGIN_Y = 30
 LINE_SPACING = 22
@@ -31,6 +59,20 @@ BG = "#f7f3e8"
 INK = "#2b2b2b"
 ACCENT = "#645cff"
 SUBTLE = "#b1a89f"
+MINIMAP_BAR_W = 8   # overview strip: pixels per bar
+MINIMAP_H = 26
+MINIMAP_TROUGH = "#e9e2d3"
+WAVE_VIEW_W = 860   # sample waveform viewer
+WAVE_VIEW_H = 180
+WAVE_SELECTION = "#e4e0ff"
+
+# Snap grid and note lengths, in ticks
+SNAPS = {"1/4": PPQ, "1/8": PPQ // 2, "1/16": PPQ // 4, "1/8T": PPQ // 3, "1/16T": PPQ // 6}
+NOTE_LENGTHS = {"auto": None, "1/16": PPQ // 4, "1/8T": PPQ // 3, "1/8": PPQ // 2, "1/4": PPQ,
+                "1/2": PPQ * 2, "1 bar": TICKS_PER_BAR}
+DRAG_FRAME_MS = 16  # motion events are coalesced and applied once per frame
+DEFAULT_VEL = 100  # velocity of newly placed notes (1..127); gain is vel / DEFAULT_VEL
+KIND_TICKS = {"full": PPQ, "half": PPQ // 2, "combo": PPQ, "rest": PPQ}  # "auto" lengths
 
 NOTE_COLORS = {
     "full": "#00a6a6",
@@ -44,6 +86,16 @@ try:
 except Exception:
     winsound = None
 
+# File locks, so instances never share a journal (one of the two exists)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
 # Optional sound recording (mic) support
 try:
     import sounddevice as sd
@@ -51,46 +103,295 @@ try:
 except Exception:
     HAVE_SD = False
 
-# -------------- Tiny synth & audio utils --------------
+# -------------- Tuning --------------
+
+NOTE_RE = re.compile(r"([A-Ga-g])([#b]*)(-?\d+)(?:([+-]\d+(?:\.\d+)?)c)?")
+NOTE_STEPS = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+NOTE_NAMES = ("C", "C#", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B")
+JUST_RATIOS = (16/15, 9/8, 6/5, 5/4, 4/3, 45/32, 3/2, 8/5, 5/3, 9/5, 15/8, 2.0)  # 5-limit, from the tonic
+TUNING_SYSTEMS = ("12-TET", "Just", "Scala")
+TUNING_DEFAULT = {"system": "12-TET", "ref_hz": 440.0, "tonic": "C", "scl": None, "kbm": None}
+
+class TuningError(ValueError):
+    """A note, scale or keyboard map the tuning cannot use. `lanes` maps each
+    offending lane to its message when the error comes from a lane table."""
+    def __init__(self, msg, lanes=None):
+        super().__init__(msg)
+        self.lanes = lanes or {}
 
-def hz(note_str):
-    """Very tiny note-to-hz helper for a few common notes (G-centric).
-       Accepts strings like 'G3','G#3','A3','A#3','B3','C4','C#4','D4'.
-       Defaults to A4=440 tuning."""
-    semis = {"C": -9, "C#": -8, "Db": -8, "D": -7, "D#": -6, "Eb": -6, "E": -5, "F": -4, "F#": -3, "Gb": -3,
-             "G": -2, "G#": -1, "Ab": -1, "A": 0, "A#": 1, "Bb": 1, "B": 2}
+def parse_note(text):
+    """MIDI key for a lane entry: a note name ('C4' = 60, 'F#3', 'Bb-1'), optionally
+    detuned in cents ('A4+14c', 'E4-31.2c'), or a bare key number ('61'), which
+    is how Scala scales with no note names are addressed. May be fractional."""
+    s = text.strip()
+    if s.isdigit():
+        return float(s)
+    m = NOTE_RE.fullmatch(s)
+    if not m:
+        raise TuningError(f"'{s}' is not a note (try C4, F#3, Bb2, A4+14c or a key number)")
+    letter, acc, octave, cents = m.groups()
+    key = 12 * (int(octave) + 1) + NOTE_STEPS[letter.upper()] + acc.count("#") - acc.count("b")
+    return key + (float(cents) / 100 if cents else 0.0)
+
+def _scala_lines(text):
+    return [line.strip() for line in text.splitlines() if not line.startswith("!")]
+
+def parse_scl(text):
+    """(description, ratios) from Scala .scl text. Ratios run from degree 1 up to
+    the period (usually 2/1); degree 0 is the implied 1/1."""
+    lines = _scala_lines(text)
+    if len(lines) < 2:
+        raise TuningError(".scl: missing the description or note count")
+    try:
+        count = int(lines[1].split()[0])
+    except (IndexError, ValueError):
+        raise TuningError(f".scl: bad note count '{lines[1]}'") from None
+    pitches = [line.split()[0] for line in lines[2:] if line][:count]
+    if count < 1 or len(pitches) < count:
+        raise TuningError(f".scl: expected {count} pitches, found {len(pitches)}")
+    ratios = []
+    for p in pitches:
+        try:
+            if "." in p:
+                r = 2.0 ** (float(p) / 1200)
+            else:
+                num, _, den = p.partition("/")
+                r = int(num) / int(den or 1)
+        except (ValueError, ZeroDivisionError):
+            raise TuningError(f".scl: bad pitch '{p}'") from None
+        if r <= 0:
+            raise TuningError(f".scl: pitch '{p}' is not above zero")
+        ratios.append(r)
+    return lines[0], ratios
+
+def parse_kbm(text):
+    """Keyword arguments for Tuning from Scala .kbm text: the mapped key range,
+    middle and reference keys, reference Hz, formal octave degree and mapping
+    (None for an unmapped 'x' key; None overall for the linear size-0 map)."""
+    vals = [line.split()[0] for line in _scala_lines(text) if line]
+    if len(vals) < 7:
+        raise TuningError(".kbm: needs map size, first/last/middle/reference keys, frequency and octave degree")
     try:
-        if len(note_str) == 2:
-            n, o = note_str[0], int(note_str[1])
-            acc = ""
-        elif len(note_str) == 3:
-            n, acc, o = note_str[0], note_str[1], int(note_str[2])
-            n = n+acc
-        else:
-            return 440.0
-        # relative to A4 (o=4, 'A')
-        semi = semis.get(n, 0) + (o - 4) * 12
-        return 440.0 * (2.0 ** (semi / 12.0))
-    except Exception:
-        return 440.0
+        size, first, last, middle, ref_key = (int(v) for v in vals[:5])
+        ref_hz, octave_degree = float(vals[5]), int(vals[6])
+        mapping = [None if v.lower() == "x" else int(v) for v in vals[7:7 + size]]
+    except ValueError as e:
+        raise TuningError(f".kbm: {e}") from None
+    if size < 0 or ref_hz <= 0:
+        raise TuningError(".kbm: map size and reference frequency must be positive")
+    mapping += [None] * (size - len(mapping))  # a short map leaves the rest unmapped
+    return dict(first=first, last=last, middle=middle, ref_key=ref_key, ref_hz=ref_hz,
+                octave_degree=octave_degree, mapping=mapping or None)
+
+class Tuning:
+    """Key -> Hz for a repeating scale under a Scala-style keyboard map.
+
+    12-TET, just intonation and Scala files are all one of these: `ratios` are
+    degrees 1..N of the scale, the last being its period, and `ref_key` sounds at
+    `ref_hz`. Keys outside first..last, or mapped to 'x', have no pitch.
+    """
+    def __init__(self, ratios, middle=60, ref_key=69, ref_hz=440.0, mapping=None, octave_degree=0,
+                 first=0, last=127, name=""):
+        self.ratios = (1.0,) + tuple(ratios)
+        self.mapping = mapping
+        self.octave_degree = octave_degree or (len(mapping) if mapping else len(ratios))
+        self.first, self.last, self.middle = first, last, middle
+        self.name = name
+        degree = self._degree(ref_key)
+        if degree is None:
+            raise TuningError(f"reference key {ref_key} is not mapped")
+        self.base = ref_hz / self._ratio(degree)  # Hz of scale degree 0
+
+    @classmethod
+    def from_spec(cls, spec):
+        """The tuning a project's "tuning" settings describe (see TUNING_DEFAULT)."""
+        spec = dict(TUNING_DEFAULT, **(spec or {}))
+        try:
+            ref_hz = float(spec["ref_hz"])
+        except (TypeError, ValueError):
+            raise TuningError(f"reference pitch '{spec['ref_hz']}' is not a number") from None
+        if not 100 <= ref_hz <= 1000:
+            raise TuningError("reference pitch must be between 100 and 1000 Hz")
+        tet = cls([2 ** (i / 12) for i in range(1, 13)], ref_hz=ref_hz, name=f"12-TET, A4 = {ref_hz:g} Hz")
+        system = spec["system"]
+        if system == "12-TET":
+            return tet
+        if system == "Just":
+            tonic = round(parse_note(f"{spec['tonic']}4"))  # degree 0 sits in octave 4
+            return cls(JUST_RATIOS, middle=tonic, ref_key=tonic, ref_hz=tet.key_hz(tonic),
+                       name=f"just intonation on {spec['tonic']}")
+        if system == "Scala":
+            if not spec["scl"]:
+                raise TuningError("Scala tuning needs a .scl file")
+            desc, ratios = parse_scl(spec["scl"])
+            kbm = parse_kbm(spec["kbm"]) if spec["kbm"] else {"ref_hz": ref_hz}
+            return cls(ratios, name=desc or "Scala scale", **kbm)
+        raise TuningError(f"unknown tuning system '{system}'")
+
+    def _degree(self, key):
+        if not self.first <= key <= self.last:
+            return None
+        if self.mapping is None:
+            return key - self.middle
+        octave, i = divmod(key - self.middle, len(self.mapping))
+        d = self.mapping[i]
+        return None if d is None else octave * self.octave_degree + d
+
+    def _ratio(self, degree):
+        period, i = divmod(degree, len(self.ratios) - 1)
+        return self.ratios[-1] ** period * self.ratios[i]
+
+    def key_hz(self, key):
+        """Hz of a (possibly fractional) key; the fraction detunes in 12-TET cents."""
+        k = round(key)
+        degree = self._degree(k)
+        if degree is None:
+            raise TuningError(f"key {k} has no pitch in {self.name or 'this tuning'}")
+        return self.base * self._ratio(degree) * 2 ** ((key - k) / 12)
+
+    def note_hz(self, text):
+        return self.key_hz(parse_note(text))
+
+    def lane_hz(self, notes):
+        """(Hz per lane with None where a note failed, {lane: message})."""
+        freqs, errors = [], {}
+        for lane, text in enumerate(notes):
+            try:
+                freqs.append(self.note_hz(text))
+            except TuningError as e:
+                freqs.append(None)
+                errors[lane] = str(e)
+        return freqs, errors
+
+    def table(self, notes):
+        """The frequency table renders index by lane, parsed once; TuningError
+        names every lane that cannot be placed."""
+        freqs, errors = self.lane_hz(notes)
+        if errors:
+            raise TuningError("; ".join(f"lane {lane + 1}: {msg}" for lane, msg in errors.items()), errors)
+        return tuple(freqs)
 
 DEFAULT_LANE_NOTES = ["G3","G#3","A3","A#3","B3","C4","C#4","D4"]  # 8 lanes, low->high
+DEFAULT_TUNING = Tuning.from_spec(TUNING_DEFAULT)
+DEFAULT_LANE_HZ = DEFAULT_TUNING.table(DEFAULT_LANE_NOTES)
+
+def lane_to_hz(lane_idx, lane_hz=None):
+    """Hz of a lane from a table built by Tuning.table (default: the stock lanes)."""
+    return (lane_hz or DEFAULT_LANE_HZ)[max(0, min(LANES-1, lane_idx))]
+
+# -------------- Audio profile --------------
+
+BLOCK_SIZE = 512  # default frames per effects/stream block, live and offline alike
+SAMPLE_RATES = (22050, 32000, 44100, 48000)
+BLOCK_SIZES = (128, 256, 512, 1024, 2048)
+QUALITIES = ("fast", "standard", "high")  # interpolation nearest/linear/cubic; high band-limits oscillators
+AUDIO_PROFILES = {  # named presets; any combination can be set
+    "Kiosk": {"sr": 22050, "block": 1024, "quality": "fast"},
+    "Light": {"sr": 32000, "block": 1024, "quality": "standard"},
+    "Standard": {"sr": SAMPLE_RATE, "block": BLOCK_SIZE, "quality": "standard"},
+    "Studio": {"sr": 48000, "block": 256, "quality": "high"},
+}
+
+class AudioConfig:
+    """Output rate, block size and quality tier. Generators, resamplers, effects,
+    streams and render-cache keys take these from the one module instance,
+    AUDIO, whenever a caller does not pass its own; the app rebuilds whatever
+    holds the old rate after configure()."""
+    def __init__(self, sr=SAMPLE_RATE, block=BLOCK_SIZE, quality="standard"):
+        self.sr, self.block, self.quality = sr, block, quality
+
+    def configure(self, sr=None, block=None, quality=None):
+        sr, block = int(sr or self.sr), int(block or self.block)
+        quality = quality or self.quality
+        if sr not in SAMPLE_RATES or block not in BLOCK_SIZES or quality not in QUALITIES:
+            raise ValueError(f"unsupported audio profile: {sr} Hz, {block} frames, {quality}")
+        self.sr, self.block, self.quality = sr, block, quality
+
+    def settings(self):
+        return {"sr": self.sr, "block": self.block, "quality": self.quality}
+
+    def name(self):
+        return next((k for k, v in AUDIO_PROFILES.items() if v == self.settings()), "Custom")
 
-def lane_to_hz(lane_idx, custom_map=None):
-    arr = custom_map if custom_map else DEFAULT_LANE_NOTES
-    lane_idx = max(0, min(LANES-1, lane_idx))
-    return hz(arr[lane_idx])
+AUDIO = AudioConfig()
 
-def synth_wave(waveform, freq_hz, secs, sr=44100, amp=0.25, attack=0.005, release=0.02):
-    """Generate mono PCM16 samples (bytes) of a simple waveform with tiny AR envelope."""
+def audio_prefs_path():
+    return os.path.join(os.path.dirname(default_cache_dir()), "audio.json")
+
+def load_audio_prefs(path=None):
+    """Apply the saved profile, if any; a missing or bad file keeps the defaults."""
+    try:
+        with open(path or audio_prefs_path(), encoding="utf-8") as f:
+            AUDIO.configure(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        pass
+
+def save_audio_prefs(path=None):
+    path = path or audio_prefs_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(AUDIO.settings(), f)
+    except OSError:
+        pass  # the profile just won't stick
+
+def profile_cpu(sr, block, quality, secs=2.0):
+    """CPU seconds per second of audio for a profile, from a fixed uncached
+    workload shaped like playback: a synth note per lane per beat in every
+    waveform, a recording pitched through the resampler, and the mix run through
+    an effects rack (filter and reverb on) in blocks."""
+    beat = sr // 2  # 120 BPM
+    beats = max(1, int(secs * 2))
+    rec = synth_f32("sine", 220.0, 0.5, sr, quality=quality)  # stands in for a mic sample
+    rack = EffectsRack(sr)
+    rack.configure({"master": {"filter": {"enabled": True}, "reverb": {"enabled": True}}})
+    t0 = time.process_time()
+    mix = array("f")
+    for b in range(beats):
+        for lane, f in enumerate(DEFAULT_LANE_HZ):
+            add_at(mix, b * beat, synth_f32(("sine", "square", "saw")[lane % 3], f, 0.25, sr, amp=0.28,
+                                            quality=quality))
+        add_at(mix, b * beat, resample_f32(rec, DEFAULT_LANE_HZ[b % LANES] / 220.0, quality))
+    run_blocks(rack, lambda pos, n: {"full": mix[pos:pos + n]}, len(mix), block)
+    return (time.process_time() - t0) / (len(mix) / sr)
+
+# -------------- Tiny synth & audio utils --------------
+
+def synth_wave(waveform, freq_hz, secs, sr=None, amp=0.25, attack=0.005, release=0.02, dither=False):
+    """Generate a mono PCM16 WAV (bytes) of a simple waveform with tiny AR envelope."""
+    sr = sr or AUDIO.sr
+    samples = synth_f32(waveform, freq_hz, secs, sr, amp, attack, release)
+    # Wrap as a minimal WAV (PCM16, mono)
+    return pcm16_to_wav(quantize_pcm16(samples, dither), sr, channels=1)
+
+def _blep(t, dt):
+    """PolyBLEP residual at phase t for a step at phase 0; dt is the phase step per sample."""
+    if t < dt:
+        t /= dt
+        return t + t - t*t - 1.0
+    if t > 1.0 - dt:
+        t = (t - 1.0) / dt
+        return t*t + t + t + 1.0
+    return 0.0
+
+def synth_f32(waveform, freq_hz, secs, sr=None, amp=0.25, attack=0.005, release=0.02, quality=None):
+    """Float32 samples (array('f'), not clipped) for synth_wave. At "high"
+    quality square and saw are band-limited (PolyBLEP) instead of naive."""
+    sr = sr or AUDIO.sr
+    blep = (quality or AUDIO.quality) == "high"
+    dt = freq_hz / sr
     n = int(secs * sr)
-    out = io.BytesIO()
-    # We'll build raw pcm16 first
     samples = []
     for i in range(n):
         t = i / sr
         # base wave
-        if waveform == "square":
+        if blep and waveform in ("square", "saw"):
+            frac = (t * freq_hz) % 1.0
+            if waveform == "saw":
+                val = 2.0*frac - 1.0 - _blep(frac, dt)
+            else:
+                val = (1.0 if frac < 0.5 else -1.0) + _blep(frac, dt) - _blep((frac + 0.5) % 1.0, dt)
+        elif waveform == "square":
             val = 1.0 if (math.sin(2*math.pi*freq_hz*t) >= 0) else -1.0
         elif waveform == "saw":
             # simple saw
@@ -106,17 +407,43 @@ def synth_wave(waveform, freq_hz, secs, sr=44100, amp=0.25, attack=0.005, releas
             env = max(0.0, (secs - t) / release)
         else:
             env = 1.0
-        s = int(max(-1.0, min(1.0, val * env * amp)) * 32767)
-        samples.append(struct.pack("<h", s))
-    pcm = b"".join(samples)
-    # Wrap as a minimal WAV (PCM16, mono)
-    return pcm16_to_wav(pcm, sr, channels=1)
+        samples.append(val * env * amp)
+    return array("f", samples)
 
-def pcm16_to_wav(pcm_bytes, sr, channels=1):
-    """Wrap raw pcm16 little-endian into a WAV container and return bytes."""
+def quantize_pcm16(samples, dither=False):
+    """The single float -> PCM16 step at the output: scale, optional TPDF dither,
+    clip. Everything upstream stays float so summed voices are only clipped here."""
+    out = array("h", [0]) * len(samples)
+    rnd = random.random
+    for i, v in enumerate(samples):
+        v *= 32767.0
+        if dither:
+            v += rnd() - rnd()  # triangular, +-1 LSB
+        q = int(v + 0.5) if v >= 0 else -int(0.5 - v)
+        out[i] = -32768 if q < -32768 else 32767 if q > 32767 else q
+    if sys.byteorder != "little":
+        out.byteswap()
+    return out.tobytes()
+
+def pcm16_to_f32(data):
+    """Little-endian PCM16 bytes -> float32 samples in [-1, 1)."""
+    ints = array("h")
+    ints.frombytes(data[:len(data) - len(data) % 2])
+    if sys.byteorder != "little":
+        ints.byteswap()
+    scale = 1.0 / 32768.0
+    return array("f", [v * scale for v in ints])
+
+def resample_f32(samples, ratio, quality=None):
+    """Pitch-shift by resampling: ratio 2.0 is an octave up (and half as long)."""
+    if ratio <= 0:
+        return array("f", samples)
+    return StreamResampler(ratio, 1.0, quality).process(samples)
+
+def wav_header(data_size, sr, channels=1):
+    """44-byte header of a PCM16 WAV whose data chunk holds data_size bytes."""
     byte_rate = sr * channels * 2
     block_align = channels * 2
-    data_size = len(pcm_bytes)
     riff_size = 36 + data_size
     b = io.BytesIO()
     b.write(b"RIFF")
@@ -126,11 +453,21 @@ def pcm16_to_wav(pcm_bytes, sr, channels=1):
     b.write(struct.pack("<IHHIIHH", 16, 1, channels, sr, byte_rate, block_align, 16))
     b.write(b"data")
     b.write(struct.pack("<I", data_size))
-    b.write(pcm_bytes)
     return b.getvalue()
 
+def pcm16_to_wav(pcm_bytes, sr, channels=1):
+    """Wrap raw pcm16 little-endian into a WAV container and return bytes."""
+    return wav_header(len(pcm_bytes), sr, channels) + bytes(pcm_bytes)
+
+_PLAYERS = []  # system player processes still running, see stop_wav_playback
+
 def play_wav_bytes(wav_bytes):
-    """Attempt best-effort playback. Priority: winsound (Windows), else afplay/aplay/ffplay."""
+    """Attempt best-effort playback. Priority: the open sink, winsound (Windows),
+    else afplay/aplay/ffplay."""
+    if SINK is not None:
+        with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
+            SINK.play(wf.readframes(wf.getnframes()), wf.getframerate())
+        return True
     if winsound:
         try:
             winsound.PlaySound(wav_bytes, winsound.SND_MEMORY | winsound.SND_ASYNC)
@@ -144,252 +481,3388 @@ def play_wav_bytes(wav_bytes):
     for cmd in (["afplay", path], ["aplay", path], ["ffplay", "-nodisp", "-autoexit", path]):
         if shutil.which(cmd[0]):
             try:
-                subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                _PLAYERS[:] = [p for p in _PLAYERS if p.poll() is None]
+                _PLAYERS.append(subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
                 return True
             except Exception:
                 continue
     return False
 
-# -------------- App --------------
+def stop_wav_playback():
+    """Silence whatever play_wav_bytes started."""
+    if winsound:
+        try:
+            winsound.PlaySound(None, 0)
+        except Exception:
+            pass
+    for p in _PLAYERS:
+        if p.poll() is None:
+            try:
+                p.terminate()
+            except Exception:
+                pass
+    _PLAYERS[:] = []
+
+# -------------- Headless sinks --------------
+
+AUDIO_ENV = "SHEET42_AUDIO"  # "null" or "capture:PATH.wav" sends all output to a sink
+
+class NullSink:
+    """Discards what is played but timestamps it: `log` holds (secs since start,
+    frames, sr) per buffer, enough to check timing or benchmark without a device."""
+    name = "null"
 
-class Sheet42(tk.Tk):
     def __init__(self):
+        self.t0 = time.perf_counter()
+        self.log = []
+        self.frames = 0
+        self.lock = threading.Lock()  # streams play from their own threads
+
+    def play(self, pcm, sr, t=None):
+        """PCM16 little-endian bytes, played at `t` seconds since the sink opened (default: now)."""
+        with self.lock:
+            t = time.perf_counter() - self.t0 if t is None else t
+            data = array("h", bytes(pcm))
+            if sys.byteorder != "little":
+                data.byteswap()
+            self.log.append((t, len(data), sr))
+            self.frames += len(data)
+            self._keep(t, data, sr)
+
+    def _keep(self, t, data, sr):
+        pass
+
+    def close(self):
+        pass
+
+class CaptureSink(NullSink):
+    """A NullSink that also keeps the audio: each buffer is mixed onto one timeline
+    at its timestamp, written to `path` as a WAV on close. The event log goes to
+    the same name with .log, a line per buffer as it is played."""
+    def __init__(self, path):
         super().__init__()
-        self.title(APP_TITLE)
-        self.configure(bg=BG)
-        self.geometry("1180x520")
-        self.minsize(980, 480)
+        self.name = "capture:" + path
+        self.path = path
+        self.sr = None  # the first buffer's rate; later ones are resampled to it
+        self.mix = array("i")
+        self._log = open(os.path.splitext(path)[0] + ".log", "w")
+        self._log.write("secs\tframe\tframes\tsr\n")
 
-        # State
-        self.current_tool = tk.StringVar(value="full")  # full/half/combo/rest/erase
-        self.user_name = tk.StringVar(value="You")
-        self.assistant_name = "GPT-5 Thinking"
-        self.left_clef_text = tk.StringVar(value="𝄢")
-        self.right_clef_text = tk.StringVar(value="𝄞")
-        self.left_clef_label = tk.StringVar(value="Bass")
-        self.right_clef_label = tk.StringVar(value="Treble")
-        self.active_clef_side = tk.StringVar(value="right")
-        self.BPM = tk.IntVar(value=100)
+    def _keep(self, t, data, sr):
+        if self.sr is None:
+            self.sr = sr
+        if sr != self.sr:  # nearest-sample resample, so the timeline stays in seconds
+            step = sr / self.sr
+            data = [data[int(i * step)] for i in range(int(len(data) / step))]
+        at = int(round(t * self.sr))
+        end = at + len(data)
+        if end > len(self.mix):
+            self.mix.extend(array("i", bytes(4 * (end - len(self.mix)))))
+        self.mix[at:end] = array("i", map(operator.add, self.mix[at:end], data))
+        self._log.write(f"{t:.6f}\t{at}\t{len(data)}\t{sr}\n")
+        self._log.flush()
 
-        # Timeline
-        self.is_playing = False
-        self.current_pos = 0  # beat index [0, total_beats)
-        self.after_id = None
+    def close(self):
+        with self.lock:
+            if self._log.closed:
+                return
+            self._log.close()
+            pcm = array("h", (max(-32768, min(32767, v)) for v in self.mix))
+            if sys.byteorder != "little":
+                pcm.byteswap()
+            with open(self.path, "wb") as f:
+                f.write(pcm16_to_wav(pcm.tobytes(), self.sr or AUDIO.sr))
 
-        # Metronome styling
-        self.metro_line = None
+SINK = None  # the sink all output goes to instead of a device, see open_sink
 
-        # Symbols and audio
-        self.symbols = {}  # (bar, beat, lane) -> {"id": <canvas tag or id>, "kind": str}
-        self.waveform = tk.StringVar(value="sine")
-        self.full_secs = 1.0  # 1 beat at 60 BPM baseline; actual time depends on BPM at playback
-        self.half_secs = 0.5
-        self.combo_split = (0.5, 0.5)  # two events per beat
-        self.lane_notes = DEFAULT_LANE_NOTES.copy()  # editable mapping
+def open_sink(spec=None):
+    """Route all output to the sink `spec` (default: $SHEET42_AUDIO) names, or to
+    the devices again for "". Returns the sink, or None."""
+    global SINK
+    spec = os.environ.get(AUDIO_ENV, "") if spec is None else spec
+    if SINK is not None:
+        SINK.close()
+    if spec == "null":
+        SINK = NullSink()
+    elif spec.startswith("capture:"):
+        SINK = CaptureSink(spec[len("capture:"):])
+    else:
+        SINK = None
+    return SINK
 
-        # Recording (optional)
-        self.record_secs = tk.DoubleVar(value=0.5)
-        self.record_sr = 44100
-        self.record_sample_bytes = None  # last recorded wav bytes
+def can_stream():
+    """True if output streams run: through sounddevice, or paced into a sink."""
+    return SINK is not None or HAVE_SD
 
-        self._build_ui()
-        self._draw_sheet()
+class SinkStream:
+    """Stand-in for sd.RawOutputStream that feeds SINK: a thread calls the
+    callback a block at a time, paced by the clock, and stamps each block
+    with its exact place on the stream's timeline."""
+    def __init__(self, samplerate, blocksize, callback):
+        self.sr, self.block, self.callback = samplerate, blocksize, callback
+        self._stop = threading.Event()
+        self._thread = None
 
-    # ---------- UI ----------
-    def _build_ui(self):
-        self._build_header()
-        self._build_toolbar()
-        self._build_canvas()
-        self._build_timeline()
-        self._build_footer()
+    def start(self):
+        sink = SINK
+        t0 = time.perf_counter() - sink.t0
+        def run():
+            frames, start = 0, time.perf_counter()
+            out = bytearray(2 * self.block)
+            while not self._stop.is_set():
+                self.callback(out, self.block, None, None)
+                sink.play(out, self.sr, t0 + frames / self.sr)
+                frames += self.block
+                time.sleep(max(0.0, start + frames / self.sr - time.perf_counter()))
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
 
-    def _build_header(self):
-        header = tk.Frame(self, bg=BG)
-        header.pack(fill="x", padx=12, pady=(10, 0))
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
 
-        title_font = font.Font(family="Georgia", size=20, weight="bold")
-        title = tk.Label(header, text="Four-Line Sheet (Sampler)", bg=BG, fg=INK, font=title_font)
-        title.pack(side="left")
+    def close(self):
+        self._thread = None
 
-        heart = tk.Label(header, text="♥", bg=BG, fg=ACCENT, font=font.Font(size=20))
-        heart.pack(side="left", padx=(8, 0))
+def output_stream(sr, callback):
+    """A started-on-demand PCM16 mono output stream: the sink's if one is open,
+    else sounddevice's."""
+    if SINK is not None:
+        return SinkStream(sr, AUDIO.block, callback)
+    return sd.RawOutputStream(samplerate=sr, channels=1, dtype="int16", blocksize=AUDIO.block, callback=callback)
 
-        who = tk.Label(header, text="made by ", bg=BG, fg=SUBTLE)
-        who.pack(side="left", padx=(8, 0))
-        me = tk.Label(header, text=self.assistant_name, bg=BG, fg=ACCENT, font=font.Font(weight="bold"))
-        me.pack(side="left", padx=(2, 0))
+# -------------- Render cache --------------
 
-        amp = tk.Label(header, text=" & ", bg=BG, fg=SUBTLE)
-        amp.pack(side="left")
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        base = os.environ["LOCALAPPDATA"]
+    return os.path.join(base, "sheet42", "render")
 
-        you_lbl = tk.Label(header, textvariable=self.user_name, bg=BG, fg=ACCENT, font=font.Font(weight="bold"))
-        you_lbl.pack(side="left")
+class RenderCache:
+    """Content-addressed on-disk cache of rendered buffers, shared by sessions.
 
-        name_box = tk.Frame(header, bg=BG)
-        name_box.pack(side="right")
-        tk.Label(name_box, text="Your name:", bg=BG, fg=SUBTLE).pack(side="left", padx=(0,6))
-        tk.Entry(name_box, textvariable=self.user_name, width=16).pack(side="left")
+    Keys hash everything a buffer depends on (generator settings or the
+    source sample's digest, pitch, duration, sample rate). Writes go to a temp
+    file that is renamed into place, so a crash never leaves a torn entry;
+    reads are memory-mapped. Entries are touched on use and the least
+    recently used ones are evicted once the cache outgrows `max_bytes`.
+    Any filesystem trouble just turns the cache off."""
+    SUFFIX = ".pcm"
 
-    def _build_toolbar(self):
-        bar = tk.Frame(self, bg=BG)
-        bar.pack(fill="x", padx=12, pady=8)
+    def __init__(self, root=None, max_bytes=256 * 1024 * 1024, open_maps=256):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # bytes on disk, counted lazily on the first write
+        self._open = {}    # key -> memoryview over an open mmap, most recent last
+        self._open_max = open_maps
 
-        # Clefs
-        clef_box = tk.LabelFrame(bar, text="Clef", bg=BG, fg=INK, padx=8, pady=6)
-        clef_box.pack(side="left", padx=(0, 12))
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
 
-        tk.Radiobutton(clef_box, text="Left", variable=self.active_clef_side, value="left",
-                       bg=BG, fg=INK, selectcolor=BG, command=self._redraw).grid(row=0, column=0, sticky="w")
-        tk.Entry(clef_box, textvariable=self.left_clef_text, width=5, justify="center").grid(row=0, column=1, padx=(6, 6))
-        tk.Entry(clef_box, textvariable=self.left_clef_label, width=10).grid(row=0, column=2, padx=(6, 12))
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + self.SUFFIX)
 
-        tk.Radiobutton(clef_box, text="Right", variable=self.active_clef_side, value="right",
-                       bg=BG, fg=INK, selectcolor=BG, command=self._redraw).grid(row=1, column=0, sticky="w")
-        tk.Entry(clef_box, textvariable=self.right_clef_text, width=5, justify="center").grid(row=1, column=1, padx=(6, 6))
-        tk.Entry(clef_box, textvariable=self.right_clef_label, width=10).grid(row=1, column=2, padx=(6, 12))
+    def get(self, key):
+        """Memory-mapped contents for a key, or None on a miss."""
+        view = self._open.pop(key, None)
+        if view is not None:
+            self._open[key] = view
+            self.hits += 1
+            try:
+                os.utime(self._path(key))  # keep hot entries last in line for eviction
+            except OSError:
+                pass  # evicted while mapped; the view stays valid
+            return view
+        if not self.root:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    view = memoryview(b"")
+                else:
+                    view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            os.utime(path)  # mtime doubles as the LRU clock
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, view)
+        return view
 
-        ttk.Button(clef_box, text="Apply", command=self._redraw).grid(row=0, column=3, rowspan=2, padx=4)
+    def put(self, key, data):
+        if not self.root:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            self.root = None
+            return
+        if self._size is None:
+            self._size = sum(size for _p, size, _m in self._entries())
+        else:
+            self._size += memoryview(data).nbytes  # bytes, also for array('f')
+        if self._size > self.max_bytes:
+            self.evict()
 
-        # Tools
-        tools = tk.LabelFrame(bar, text="Tools", bg=BG, fg=INK, padx=8, pady=6)
-        tools.pack(side="left", padx=(0, 12))
-        for label, kind in [("Full ●", "full"), ("Half ○", "half"), ("Combo ◍", "combo"), ("Rest ⟂", "rest"), ("Erase ⨯", "erase")]:
-            ttk.Button(tools, text=label, command=lambda k=kind: self._set_tool(k)).pack(side="left", padx=4)
+    def get_or_render(self, key, render, typecode=None):
+        """Cached buffer for key, rendering and storing it on a miss. With a
+        typecode, hits come back as a memoryview cast to it (e.g. "f")."""
+        view = self.get(key)
+        if view is not None:
+            return view.cast(typecode) if typecode else view
+        data = render()
+        self.put(key, data)
+        return data
 
-        # Synth / sample controls
-        synth = tk.LabelFrame(bar, text="Sample Engine", bg=BG, fg=INK, padx=8, pady=6)
-        synth.pack(side="left", padx=(0, 12))
+    def _remember(self, key, view):
+        self._open[key] = view
+        if len(self._open) > self._open_max:
+            del self._open[next(iter(self._open))]
 
-        tk.Label(synth, text="Wave", bg=BG).pack(side="left", padx=(0,4))
-        ttk.Combobox(synth, width=7, textvariable=self.waveform, values=("sine","square","saw"), state="readonly").pack(side="left", padx=(0,10))
+    def _entries(self):
+        try:
+            subdirs = [e.path for e in os.scandir(self.root) if e.is_dir()]
+        except OSError:
+            return []
+        out = []
+        for d in subdirs:
+            for e in os.scandir(d):
+                if e.name.endswith(self.SUFFIX):
+                    st = e.stat()
+                    out.append((e.path, st.st_size, st.st_mtime))
+        return out
 
-        ttk.Button(synth, text="Test Tone", command=self._test_tone).pack(side="left", padx=4)
+    def evict(self, target=None):
+        """Drop least recently used entries until the cache is below target bytes."""
+        target = int(self.max_bytes * 0.9) if target is None else target
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        size = sum(e[1] for e in entries)
+        for path, nbytes, _mtime in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)  # open maps stay valid until released
+            except OSError:
+                continue
+            size -= nbytes
+        self._size = size
 
-        if HAVE_SD:
-            rec_btn = ttk.Button(synth, text="Record Mic", command=self._record_sample)
-            rec_btn.pack(side="left", padx=(10,4))
-            tk.Label(synth, text="sec", bg=BG).pack(side="left", padx=(6,2))
-            ttk.Spinbox(synth, from_=0.2, to=3.0, increment=0.1, textvariable=self.record_secs, width=5).pack(side="left")
-            ttk.Button(synth, text="Test Recording", command=self._play_recording).pack(side="left", padx=4)
+    def clear(self):
+        self._open.clear()
+        self.evict(0)
+
+RENDER_CACHE = RenderCache()
+
+# -------------- Sample store --------------
+
+class SampleStore:
+    """Raw sample buffers (array('h') PCM16 or float32) with shared metadata,
+    deduplicated by content and reference-counted.
+
+    The same buffer added twice is kept once. Holders pin an entry with add()
+    or acquire() and unpin it with release(). Unpinned entries stay on as a
+    cache until the store outgrows its byte budget; then the least recently
+    used of them are dropped. Pinned entries are never evicted. Memory is
+    tracked per category ("generated", "recorded", "cached"), current and
+    peak."""
+    CATEGORIES = ("generated", "recorded", "cached")
+
+    def __init__(self, budget=64 * 1024 * 1024):
+        self.budget = budget
+        self._entries = {}  # digest -> {"data", "sr", "category", "refs", "nbytes", "names"}, oldest use first
+        self._names = {}    # alias (e.g. a render-cache key) -> digest
+        self.current = dict.fromkeys(self.CATEGORIES, 0)
+        self.peak = dict.fromkeys(self.CATEGORIES, 0)
+        self.peak_total = 0
+        self.deduped = 0
+        self.evicted = 0
+
+    @staticmethod
+    def digest(data, sr):
+        code = getattr(data, "typecode", None) or data.format
+        h = hashlib.sha1(f"{code}:{sr}:".encode())
+        h.update(data)
+        return h.hexdigest()
+
+    def total(self):
+        return sum(self.current.values())
+
+    def add(self, data, sr, category, name=None, pin=True):
+        """Store a buffer (or find its twin) and return its digest handle."""
+        key = self.digest(data, sr)
+        e = self._entries.pop(key, None)
+        if e is None:
+            nbytes = len(data) * data.itemsize
+            e = {"data": data, "sr": sr, "category": category, "refs": 0, "nbytes": nbytes, "names": set()}
+            self.current[category] += nbytes
+            self.peak[category] = max(self.peak[category], self.current[category])
+            self.peak_total = max(self.peak_total, self.total())
         else:
-            tk.Label(synth, text="(Mic record unavailable)", bg=BG, fg=SUBTLE).pack(side="left", padx=6)
+            self.deduped += 1
+        self._entries[key] = e  # most recently used last
+        if pin:
+            e["refs"] += 1
+        if name is not None:
+            e["names"].add(name)
+            self._names[name] = key
+        self._enforce()
+        return key
 
-        # Pitch mapping
-        pitch = tk.LabelFrame(bar, text="Lane→Pitch (low→high)", bg=BG, fg=INK, padx=8, pady=6)
-        pitch.pack(side="left", padx=(0, 12))
-        self.pitch_entries = []
-        for i in range(LANES):
-            e = tk.Entry(pitch, width=4, justify="center")
-            e.insert(0, self.lane_notes[i])
-            e.pack(side="left", padx=2)
-            self.pitch_entries.append(e)
-        ttk.Button(pitch, text="Apply", command=self._apply_pitch_map).pack(side="left", padx=6)
+    def get(self, key):
+        """(data, sr) for a handle, or None if it was evicted."""
+        e = self._entries.pop(key, None)
+        if e is None:
+            return None
+        self._entries[key] = e
+        return e["data"], e["sr"]
 
-        # Help
-        ttk.Button(bar, text="Help", command=self._show_help).pack(side="right")
+    def find(self, name):
+        """(data, sr) stored under an alias, or None."""
+        key = self._names.get(name)
+        return None if key is None else self.get(key)
 
-    def _build_canvas(self):
-        wrap = tk.Frame(self, bg=BG)
-        wrap.pack(fill="both", expand=True, padx=12)
+    def acquire(self, key):
+        self._entries[key]["refs"] += 1
 
-        self.canvas = tk.Canvas(wrap, bg=BG, highlightthickness=0, height=CANVAS_H)
-        self.hscroll = ttk.Scrollbar(wrap, orient="horizontal", command=self.canvas.xview)
-        self.canvas.configure(xscrollcommand=self.hscroll.set)
+    def release(self, key):
+        e = self._entries.get(key)
+        if e is not None and e["refs"] > 0:
+            e["refs"] -= 1
+            if not e["refs"]:
+                self._enforce()
 
-        self.canvas.pack(fill="both", expand=True, side="top")
-        self.hscroll.pack(fill="x", side="bottom")
+    def rekey(self, key):
+        """New handle for an entry whose buffer was edited in place (trimmed,
+        normalized). Pins carry over; aliases are dropped, as they named the old
+        content."""
+        e = self._entries.pop(key)
+        self.current[e["category"]] -= e["nbytes"]
+        for name in e["names"]:
+            if self._names.get(name) == key:
+                del self._names[name]
+        new = self.add(e["data"], e["sr"], e["category"])
+        self._entries[new]["refs"] += e["refs"] - 1
+        self._enforce()
+        return new
 
-        total_w = MARGIN_X*2 + BAR_W*BARS
-        self.canvas.config(scrollregion=(0, 0, total_w, CANVAS_H))
+    def set_budget(self, nbytes):
+        self.budget = max(0, int(nbytes))
+        self._enforce()
 
-        self.canvas.bind("<Button-1>", self.on_click_place)
-        self.canvas.bind("<Button-3>", self.on_right_click_erase)
-        self.canvas.bind("<Configure>", lambda e: self._redraw())
+    def _enforce(self):
+        if self.total() <= self.budget:
+            return
+        for key in [k for k, e in self._entries.items() if not e["refs"]]:
+            self._drop(key)
+            if self.total() <= self.budget:
+                break
 
-    def _build_timeline(self):
-        tl = tk.Frame(self, bg=BG)
-        tl.pack(fill="x", padx=12, pady=(6, 10))
+    def _drop(self, key):
+        e = self._entries.pop(key)
+        self.current[e["category"]] -= e["nbytes"]
+        for name in e["names"]:
+            if self._names.get(name) == key:
+                del self._names[name]
+        self.evicted += 1
 
-        ttk.Button(tl, text="⟲ Stop", command=self.stop).pack(side="left", padx=4)
-        self.play_btn = ttk.Button(tl, text="▶ Play", command=self.play_pause)
-        self.play_btn.pack(side="left", padx=4)
+    def stats(self):
+        """{category: {"count", "bytes", "peak"}} plus a "total" row."""
+        out = {c: {"count": 0, "bytes": self.current[c], "peak": self.peak[c]} for c in self.CATEGORIES}
+        for e in self._entries.values():
+            out[e["category"]]["count"] += 1
+        out["total"] = {"count": len(self._entries), "bytes": self.total(), "peak": self.peak_total}
+        return out
 
-        tk.Label(tl, text="BPM", bg=BG).pack(side="left", padx=(12,4))
-        self.bpm_label = tk.Label(tl, text=str(self.BPM.get()), bg=BG, fg=SUBTLE)
-        self.bpm_label.pack(side="left", padx=(6, 6))
-        bpm_scale = ttk.Scale(tl, from_=40, to=208, orient="horizontal", variable=self.BPM, length=240, command=lambda v: self._update_bpm_label())
-        bpm_scale.pack(side="left")
-        self.BPM.trace_add("write", lambda *_: self._update_bpm_label())
+    def report(self):
+        mb = 1.0 / (1024 * 1024)
+        lines = [f"{c:<10} {s['count']:>5} buffers  {s['bytes']*mb:8.2f} MB now  {s['peak']*mb:8.2f} MB peak"
+                 for c, s in self.stats().items()]
+        lines.append(f"budget {self.budget*mb:.1f} MB; {self.deduped} duplicates shared, {self.evicted} evicted")
+        return "\n".join(lines)
 
-        tk.Label(tl, text=" Scrub:", bg=BG).pack(side="left", padx=(12,4))
-        self.scrub = ttk.Scale(tl, from_=0, to=BARS*BEATS_PER_BAR-1, orient="horizontal", length=420, command=self._on_scrub_change)
-        self.scrub.pack(side="left")
-        ttk.Button(tl, text="Go", command=self._apply_scrub).pack(side="left", padx=6)
+SAMPLES = SampleStore()
 
-        self.pos_label = tk.Label(tl, text="Beat 1 / 168", bg=BG, fg=SUBTLE)
-        self.pos_label.pack(side="right")
+# -------------- Waveform peaks --------------
 
-    def _build_footer(self):
-        footer = tk.Frame(self, bg=BG)
-        footer.pack(fill="x", padx=12, pady=(0, 10))
-        self.status_var = tk.StringVar(value="Left-click to place. Right-click to erase. Combo plays two quick hits.")
-        status = tk.Label(footer, textvariable=self.status_var, bg=BG, fg=SUBTLE, anchor="w")
-        status.pack(fill="x")
+PEAK_BASE = 64         # samples per min/max pair at the finest pyramid level
+PEAK_CHUNK = 1 << 18   # samples scanned or rewritten per step of background work
 
-    # ---------- Drawing ----------
-    def _redraw(self):
-        self._draw_sheet()
+class PeakPyramid:
+    """Min/max peaks of a sample buffer at halving resolutions, for drawing it.
 
-    def _draw_sheet(self):
-        self.canvas.delete("all")
-        top = MARGIN_Y
-        left = MARGIN_X
-        right = MARGIN_X + BAR_W*BARS
+    Level 0 holds the min and max of every PEAK_BASE samples, and each level
+    above pairs up the one below. A view is drawn from the level whose blocks
+    are just narrower than a pixel, so any zoom costs O(pixels) whatever the
+    length; closer in than PEAK_BASE samples a pixel the samples themselves are
+    read. `data` is any int or float buffer (PCM16 arrays, mmapped frames);
+    `scale` maps its values to -1..1 and `stride` picks one channel of
+    interleaved frames."""
+    def __init__(self, data, sr, scale=1.0, stride=1):
+        self.data, self.sr, self.scale, self.stride = data, sr, scale, stride
+        self.length = len(data) // stride
+        self.levels = []  # [(mins, maxs)] as array('f'), finest first; empty until built
 
-        # Staff lines
-        for i in range(STAFF_LINES):
-            y = top + i*LINE_SPACING
-            self.canvas.create_line(left, y, right, y, fill=INK, width=1.6)
+    def build(self):
+        """Scan the buffer a chunk at a time, yielding the fraction done, so a UI
+        can spread the O(n) work over idle time."""
+        data, s, scale = self.data, self.stride, self.scale
+        base = PEAK_BASE * s
+        step = max(base, PEAK_CHUNK - PEAK_CHUNK % base)
+        n = self.length * s
+        mins, maxs = array("f"), array("f")
+        for c0 in range(0, n, step):
+            chunk = data[c0:min(n, c0 + step)]
+            for i in range(0, len(chunk), base):
+                block = chunk[i:i+base:s]
+                mins.append(min(block) * scale)
+                maxs.append(max(block) * scale)
+            yield min(1.0, (c0 + step) / n)
+        levels = [(mins, maxs)]
+        while len(mins) > 1:
+            if len(mins) % 2:
+                mins, maxs = mins + mins[-1:], maxs + maxs[-1:]
+            mins = array("f", map(min, mins[0::2], mins[1::2]))
+            maxs = array("f", map(max, maxs[0::2], maxs[1::2]))
+            levels.append((mins, maxs))
+        self.levels = levels
 
-        # Lanes (gaps markers as subtle dotted guides)
-        # Lanes are interleaved: line0, gap0, line1, gap1, line2, gap2, line3, gap3
-        self.lane_ys = []
-        for i in range(STAFF_LINES):
-            self.lane_ys.append(top + i*LINE_SPACING)  # line
-            if i < STAFF_LINES-1:
-                self.lane_ys.append(top + i*LINE_SPACING + LINE_SPACING/2)  # gap
-        # Add extra gap after last line to make 8 lanes
-        self.lane_ys.append(top + (STAFF_LINES-1)*LINE_SPACING + LINE_SPACING/2)
+    def ready(self):
+        return bool(self.levels) or not self.length
 
-        # draw faint dotted guides for gaps (odd indices)
-        for idx, y in enumerate(self.lane_ys):
-            if idx % 2 == 1:  # gaps
-                self.canvas.create_line(left, y, right, y, fill=SUBTLE, dash=(2,3))
+    def peak(self):
+        """Largest absolute value, from the top level."""
+        if not self.levels:
+            return 0.0
+        mins, maxs = self.levels[-1]
+        return max(-mins[0], maxs[0])
 
-        # Bars + beat ticks + numbers
-        for b in range(BARS + 1):
-            x = MARGIN_X + b*BAR_W
-            w = 1.2 if b % 4 else 2.2
-            color = INK if b % 4 == 0 else SUBTLE
-            self.canvas.create_line(x, top, x, top + STAFF_HEIGHT, fill=color, width=w)
-            if b < BARS:
-                self.canvas.create_text(x + BAR_W/2, top + STAFF_HEIGHT + 14, text=str(b+1), fill=SUBTLE, font=("Helvetica", 9))
-            for beat in range(BEATS_PER_BAR):
-                bx = MARGIN_X + b*BAR_W + (beat+0.5)*(BAR_W/BEATS_PER_BAR)
-                self.canvas.create_line(bx, top + STAFF_HEIGHT + 2, bx, top + STAFF_HEIGHT + 8, fill=SUBTLE)
+    def rescale(self, gain):
+        """Follow a gain applied to the buffer, without rescanning it."""
+        self.levels = [(array("f", map(gain.__mul__, mins)), array("f", map(gain.__mul__, maxs)))
+                       for mins, maxs in self.levels]
 
-        # Clef
-        self._draw_clef()
+    def peaks(self, start, end, width):
+        """Per-pixel (mins, maxs) lists for samples [start, end) over `width` pixels."""
+        spp = (end - start) / max(1, width)
+        lo, hi = [], []
+        if spp < PEAK_BASE or not self.levels:
+            s = self.stride
+            for x in range(width):
+                a = int(start + x * spp)
+                b = max(a + 1, int(start + (x + 1) * spp))
+                block = self.data[a*s:min(b, self.length)*s:s]
+                if not len(block):
+                    break
+                lo.append(min(block) * self.scale)
+                hi.append(max(block) * self.scale)
+            return lo, hi
+        # Blocks at most half a pixel wide keep the overhang at the pixel edges small
+        level = max(0, min(len(self.levels) - 1, int(math.log2(spp / PEAK_BASE)) - 1))
+        size = PEAK_BASE << level
+        mins, maxs = self.levels[level]
+        for x in range(width):
+            a = int(start + x * spp) // size
+            b = max(a + 1, -(-int(start + (x + 1) * spp) // size))
+            if a >= len(mins):
+                break
+            lo.append(min(mins[a:b]))
+            hi.append(max(maxs[a:b]))
+        return lo, hi
 
-        # Repaint existing symbols (preserve dict, redraw)
-        old = self.symbols.copy()
-        self.symbols.clear()
-        for key, meta in old.items():
-            b, bt, lane = key
-            self._draw_symbol_at(b, bt, lane, meta["kind"])
+def scale_pcm16(data, gain, chunk=1 << 16):
+    """Multiply a PCM16 array in place, a chunk at a time, yielding the fraction
+    done. The gain must not push the peak past full scale (see PeakPyramid.peak)."""
+    n = len(data)
+    for i in range(0, n, chunk):
+        j = min(n, i + chunk)
+        data[i:j] = array("h", map(round, map(gain.__mul__, data[i:j])))
+        yield j / n
 
-        # Metronome line
-        self._draw_metro_line()
+# -------------- Events --------------
+
+def event_strikes(kind, dur):
+    """(offset, length) pairs in ticks for an event; rests make no sound.
+    A combo splits its length into two equal strikes."""
+    if kind in ("full", "half"):
+        return [(0, dur)]
+    if kind == "combo":
+        first = dur // 2
+        return [(0, first), (first, dur - first)]
+    return []
+
+class EventStore:
+    """Sparse, sorted note storage.
+
+    Occupied ticks live in a sorted list and each maps to {lane: event}, where
+    an event is {"kind": str, "dur": ticks, "vel": 1..127}. Range queries bisect into the
+    tick list, so playback and drawing only touch the events they ask for,
+    however fine the grid is."""
+    def __init__(self):
+        self._ticks = []
+        self._at = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def get(self, tick, lane):
+        lanes = self._at.get(tick)
+        return lanes.get(lane) if lanes else None
+
+    def put(self, tick, lane, kind, dur, vel=DEFAULT_VEL):
+        """Store an event, returning the one it replaced (or None)."""
+        lanes = self._at.get(tick)
+        if lanes is None:
+            lanes = self._at[tick] = {}
+            bisect.insort(self._ticks, tick)
+        old = lanes.get(lane)
+        if old is None:
+            self._count += 1
+        lanes[lane] = {"kind": kind, "dur": int(dur), "vel": int(vel)}
+        return old
+
+    def remove(self, tick, lane):
+        lanes = self._at.get(tick)
+        if not lanes or lane not in lanes:
+            return None
+        old = lanes.pop(lane)
+        self._count -= 1
+        if not lanes:
+            del self._at[tick]
+            del self._ticks[bisect.bisect_left(self._ticks, tick)]
+        return old
+
+    def range(self, t0, t1):
+        """Yield (tick, lane, event) for t0 <= tick < t1, in time then lane order."""
+        i = bisect.bisect_left(self._ticks, t0)
+        j = bisect.bisect_left(self._ticks, t1)
+        for tick in self._ticks[i:j]:
+            lanes = self._at[tick]
+            for lane in sorted(lanes):
+                yield tick, lane, lanes[lane]
+
+    def items(self):
+        return self.range(0, float("inf"))
+
+    def clear(self):
+        self._ticks = []
+        self._at = {}
+        self._count = 0
+
+# -------------- Tempo map --------------
+
+TEMPO_MIN, TEMPO_MAX = 20, 300
+
+class TempoMap:
+    """Tempo points by beat, each either holding its BPM or ramping linearly
+    to the next point. The seconds at every point are kept in a cumulative
+    table, so beat->time and time->beat are a bisect plus one closed-form
+    segment (O(log n) both ways). Editing a point only recomputes the table
+    from that point onwards."""
+    def __init__(self, bpm=100.0):
+        self.beats = [0.0]    # point positions, sorted; the first is always 0
+        self.bpms = [float(bpm)]
+        self.ramps = [False]  # ramp linearly towards the next point
+        self.times = [0.0]    # seconds at each point
+
+    def __len__(self):
+        return len(self.beats)
+
+    def points(self):
+        return list(zip(self.beats, self.bpms, self.ramps))
+
+    def set_point(self, beat, bpm, ramp=False):
+        beat = max(0.0, float(beat))
+        bpm = float(max(TEMPO_MIN, min(TEMPO_MAX, bpm)))
+        i = bisect.bisect_left(self.beats, beat)
+        if i < len(self.beats) and self.beats[i] == beat:
+            if self.bpms[i] == bpm and self.ramps[i] == bool(ramp):
+                return
+            self.bpms[i] = bpm
+            self.ramps[i] = bool(ramp)
+        else:
+            self.beats.insert(i, beat)
+            self.bpms.insert(i, bpm)
+            self.ramps.insert(i, bool(ramp))
+            self.times.insert(i, 0.0)
+        # The segment ending at i changes too if the previous point ramps into it
+        self._recompute(max(1, i))
+
+    def remove_point(self, beat):
+        i = bisect.bisect_left(self.beats, beat)
+        if i == 0 or i >= len(self.beats) or self.beats[i] != beat:
+            return False
+        for arr in (self.beats, self.bpms, self.ramps, self.times):
+            del arr[i]
+        self._recompute(i)
+        return True
+
+    def _recompute(self, start):
+        for j in range(start, len(self.beats)):
+            self.times[j] = self.times[j-1] + self._seg_secs(j-1, self.beats[j] - self.beats[j-1])
+
+    def _slope(self, i):
+        if self.ramps[i] and i + 1 < len(self.beats):
+            return (self.bpms[i+1] - self.bpms[i]) / (self.beats[i+1] - self.beats[i])
+        return 0.0
+
+    def _seg_secs(self, i, dx):
+        """Seconds from point i to dx beats past it."""
+        bpm0, k = self.bpms[i], self._slope(i)
+        if abs(k) < 1e-12:
+            return 60.0 * dx / bpm0
+        return 60.0 / k * math.log((bpm0 + k*dx) / bpm0)
+
+    def beat_to_time(self, beat):
+        i = max(0, bisect.bisect_right(self.beats, beat) - 1)
+        return self.times[i] + self._seg_secs(i, beat - self.beats[i])
+
+    def time_to_beat(self, secs):
+        i = max(0, bisect.bisect_right(self.times, secs) - 1)
+        dt = secs - self.times[i]
+        bpm0, k = self.bpms[i], self._slope(i)
+        if abs(k) < 1e-12:
+            return self.beats[i] + dt * bpm0 / 60.0
+        return self.beats[i] + bpm0 * (math.exp(k * dt / 60.0) - 1.0) / k
+
+    def bpm_at(self, beat):
+        i = max(0, bisect.bisect_right(self.beats, beat) - 1)
+        return self.bpms[i] + self._slope(i) * (beat - self.beats[i])
+
+    def beat_secs(self, beat):
+        """Length of the beat starting at `beat`, in seconds."""
+        return self.beat_to_time(beat + 1) - self.beat_to_time(beat)
+
+    def beat_starts(self, a, b, sr):
+        """Sample offsets of beats a..b relative to beat a (b - a + 1 entries)."""
+        t0 = self.beat_to_time(a)
+        return [int(round((self.beat_to_time(beat) - t0) * sr)) for beat in range(a, b + 1)]
+
+# -------------- WAV import --------------
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+IMPORT_BLOCK = 1 << 16  # frames decoded per chunk
+
+class WavReader:
+    """Streaming WAV decoder for 8/16/24/32-bit integer PCM and 32/64-bit
+    float, any channel count, plain or WAVE_FORMAT_EXTENSIBLE.
+
+    Only the headers are read up front; `blocks()` then decodes the data chunk
+    a piece at a time into mono float32 (channels averaged), so a file of any
+    size is converted in constant memory. `src` is a path or a binary file."""
+    def __init__(self, src):
+        self._own = not hasattr(src, "read")
+        self.f = open(src, "rb") if self._own else src
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._own and self.f:
+            self.f.close()
+        self.f = None
+
+    def _parse(self):
+        f = self.f
+        head = f.read(12)
+        if len(head) < 12 or head[:4] != b"RIFF" or head[8:] != b"WAVE":
+            raise ValueError("not a WAV file")
+        fmt = None
+        while True:
+            hdr = f.read(8)
+            if len(hdr) < 8:
+                raise ValueError("no data chunk")
+            cid, size = hdr[:4], struct.unpack("<I", hdr[4:])[0]
+            if cid == b"fmt ":
+                body = f.read(size + (size & 1))
+                if len(body) < 16:
+                    raise ValueError("short fmt chunk")
+                tag, channels, sr, _rate, align, _bits = struct.unpack("<HHIIHH", body[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    tag = struct.unpack("<H", body[24:26])[0]  # SubFormat GUID starts with the tag
+                fmt = (tag, channels, sr, align)
+            elif cid == b"data":
+                if fmt is None:
+                    raise ValueError("data chunk before fmt chunk")
+                break
+            else:
+                f.seek(size + (size & 1), 1)
+        tag, channels, sr, align = fmt
+        width = align // channels if channels else 0  # container bytes per sample
+        if not (channels and sr and align == width * channels):
+            raise ValueError("corrupt fmt chunk")
+        if not ((tag == WAVE_FORMAT_PCM and width in (1, 2, 3, 4)) or
+                (tag == WAVE_FORMAT_FLOAT and width in (4, 8))):
+            raise ValueError(f"unsupported WAV encoding (format {tag:#06x}, {8 * width}-bit)")
+        self.channels, self.sr, self.width = channels, sr, width
+        self.float = tag == WAVE_FORMAT_FLOAT
+        self.offset = f.tell()
+        f.seek(0, 2)
+        # Trust the file over the header: recorders that crash leave the size unset
+        nbytes = min(size, f.tell() - self.offset) if size else f.tell() - self.offset
+        f.seek(self.offset)
+        self.frames = nbytes // align
+
+    def blocks(self, frames=IMPORT_BLOCK):
+        """Yield the whole data chunk as successive mono array('f') blocks."""
+        align = self.width * self.channels
+        left = self.frames
+        self.f.seek(self.offset)
+        while left > 0:
+            n = min(frames, left)
+            raw = self.f.read(n * align)
+            n = len(raw) // align
+            if not n:
+                break
+            left -= n
+            yield self.decode(raw[:n * align])
+
+    def decode(self, raw):
+        w, ch = self.width, self.channels
+        if self.float:
+            vals = array("f" if w == 4 else "d")
+            scale = 1.0
+        elif w == 1:
+            vals = array("b", bytes(b ^ 0x80 for b in raw))  # unsigned -> signed
+            raw, scale = None, 1.0 / 128
+        elif w == 2:
+            vals, scale = array("h"), 1.0 / 32768
+        else:
+            if w == 3:  # widen to 32 bits: each sample lands in the top three bytes
+                wide = bytearray(len(raw) // 3 * 4)
+                wide[1::4], wide[2::4], wide[3::4] = raw[0::3], raw[1::3], raw[2::3]
+                raw = wide
+            vals, scale = array("i"), 1.0 / 2147483648
+        if raw is not None:
+            vals.frombytes(raw)
+            if sys.byteorder != "little":
+                vals.byteswap()
+        if ch == 1:
+            return array("f", [v * scale for v in vals])
+        mix = [0.0] * (len(vals) // ch)
+        for c in range(ch):
+            for i, v in enumerate(vals[c::ch]):
+                mix[i] += v
+        scale /= ch
+        return array("f", [v * scale for v in mix])
+
+class StreamResampler:
+    """Rate converter that carries its phase and the samples around it across
+    chunks, so a stream converts piecewise without seams. Interpolation follows
+    the quality tier: nearest sample ("fast"), linear, or 4-point cubic Hermite
+    ("high")."""
+    def __init__(self, src_sr, dst_sr, quality=None):
+        self.step = src_sr / dst_sr
+        self.quality = quality or AUDIO.quality
+        self._pos = 0.0           # next read position in _carry + the next chunk
+        self._carry = array("f")  # input still needed by that position
+
+    def process(self, chunk):
+        if self.step == 1.0:
+            return array("f", chunk)
+        x = self._carry
+        x.extend(chunk)
+        step, pos = self.step, self._pos
+        out = []
+        if self.quality == "high":
+            last = len(x) - 2
+            while pos < last:
+                j = int(pos)
+                t = pos - j
+                xm, x0, x1, x2 = x[j-1] if j else x[0], x[j], x[j+1], x[j+2]
+                c2 = xm - 2.5*x0 + 2.0*x1 - 0.5*x2
+                c3 = 0.5*(x2 - xm) + 1.5*(x0 - x1)
+                out.append(((c3*t + c2)*t + 0.5*(x1 - xm))*t + x0)
+                pos += step
+        elif self.quality == "fast":
+            last = len(x) - 1
+            while pos < last:
+                out.append(x[int(pos + 0.5)])
+                pos += step
+        else:
+            last = len(x) - 1
+            while pos < last:
+                j = int(pos)
+                a = x[j]
+                out.append(a + (x[j+1] - a) * (pos - j))
+                pos += step
+        keep = min(max(0, int(pos) - 1), len(x))  # one sample behind the read position, for cubic
+        self._carry = x[keep:]
+        self._pos = pos - keep
+        return array("f", out)
+
+def wav_f32(src, sr=None):
+    """Whole WAV (path, file or bytes) as mono float32 at `sr`."""
+    sr = sr or AUDIO.sr
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        src = io.BytesIO(src)
+    with WavReader(src) as r:
+        rs = StreamResampler(r.sr, sr)
+        out = array("f")
+        for block in r.blocks():
+            out.extend(rs.process(block))
+    return out
+
+def imports_dir():
+    return os.path.join(os.path.dirname(default_cache_dir()), "imports")
+
+def import_wav(src, dst=None, sr=None, progress=None, cancel=None):
+    """Convert any supported WAV to the engine's format (mono PCM16 at `sr`),
+    decoding, downmixing and resampling a block at a time and writing straight
+    to disk. `dst` defaults to a file under imports_dir() named after the
+    source, and an up-to-date conversion there is reused. `progress(fraction)`
+    is called per block; returning early when `cancel()` is true leaves no
+    file behind. Returns the destination path, or None if cancelled."""
+    sr = sr or AUDIO.sr
+    st = os.stat(src)
+    if dst is None:
+        tag = hashlib.sha1(f"{os.path.abspath(src)}\0{st.st_size}\0{st.st_mtime_ns}\0{sr}\0{AUDIO.quality}".encode()).hexdigest()
+        dst = os.path.join(imports_dir(), tag + ".wav")
+        if os.path.exists(dst):
+            return dst
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dst)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out, WavReader(src) as r:
+            out.write(wav_header(0, sr))
+            rs = StreamResampler(r.sr, sr)
+            written = done = 0
+            for block in r.blocks():
+                if cancel and cancel():
+                    raise InterruptedError
+                pcm = quantize_pcm16(rs.process(block))
+                out.write(pcm)
+                written += len(pcm)
+                done += len(block)
+                if progress:
+                    progress(done / r.frames)
+            out.seek(0)
+            out.write(wav_header(written, sr))
+        os.replace(tmp, dst)
+    except BaseException as e:
+        os.remove(tmp)
+        if isinstance(e, InterruptedError):
+            return None
+        raise
+    return dst
+
+# -------------- Instruments --------------
+
+INSTRUMENT_RELEASE = 0.03  # fade at the end of a gated sample note, seconds
+
+def wav_data_span(path):
+    """(offset, nbytes, sr, channels) of the data chunk of a 16-bit PCM WAV
+    file, reading only the headers so the samples can be mapped in place."""
+    with WavReader(path) as r:
+        if r.float or r.width != 2:
+            raise ValueError(f"{path}: only 16-bit PCM samples can be mapped (import it first)")
+        return r.offset, r.frames * 2 * r.channels, r.sr, r.channels
+
+class SampleZone:
+    """One sample of an instrument: a root pitch, the pitch and velocity range it
+    covers, and its frames, memory-mapped straight from the WAV file."""
+    def __init__(self, path, root, lo, hi, vel_lo=1, vel_hi=127):
+        self.path = path
+        self.root, self.lo, self.hi = root, lo, hi  # Hz
+        self.vel_lo, self.vel_hi = vel_lo, vel_hi
+        offset, nbytes, self.sr, self.channels = wav_data_span(path)
+        self._mm = None
+        if not nbytes:
+            self.frames = array("h")
+        else:
+            with open(path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(self._mm)[offset:offset + nbytes]
+            if sys.byteorder == "little":
+                self.frames = view.cast("h")
+            else:  # WAV is little-endian; fall back to a swapped copy
+                self.frames = array("h", view.tobytes())
+                self.frames.byteswap()
+                view.release()
+        self.length = len(self.frames) // self.channels
+
+    def covers(self, freq_hz, vel):
+        return self.lo <= freq_hz <= self.hi and self.vel_lo <= vel <= self.vel_hi
+
+    def render(self, freq_hz, secs, sr=None):
+        """Float32 samples pitched from the root to freq_hz (resampled at the
+        quality tier, so the pitch shift also changes speed), gated to `secs`
+        plus a short fade."""
+        sr = sr or AUDIO.sr
+        step = (freq_hz / self.root) * (self.sr / sr)
+        frames, ch, length = self.frames, self.channels, self.length
+        n = min(int((length - 1) / step) if length > 1 else 0,
+                int((secs + INSTRUMENT_RELEASE) * sr))
+        if n <= 0:
+            return array("f")
+        fade_from = n - int(INSTRUMENT_RELEASE * sr)
+        used = min(length, int((n - 1) * step) + 3)  # source frames the read positions touch
+        mono = array("f", frames[0:used*ch:ch])
+        for c in range(1, ch):
+            mono = array("f", map(operator.add, mono, frames[c:used*ch:ch]))
+        out = resample_f32(mono, step)[:n]
+        if len(out) < n:
+            out.extend(array("f", [0.0]) * (n - len(out)))
+        scale = 1.0 / (32768.0 * ch)
+        out = array("f", map(scale.__mul__, out))
+        for i in range(max(0, fade_from + 1), n):
+            out[i] *= (n - i) / (n - fade_from)
+        return out
+
+    def close(self):
+        if isinstance(self.frames, memoryview):
+            self.frames.release()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+class Instrument:
+    """A multi-sample bank described by a JSON file:
+
+        {"name": "Piano",
+         "samples": [{"file": "c4.wav", "root": "C4", "lo": "A3", "hi": "D#4",
+                      "vel": [1, 80]}, ...]}
+
+    Pitches are note names or Hz and paths are relative to the JSON file;
+    "lo"/"hi" default to the root and "vel" to the full range. A note picks,
+    among the zones whose velocity layer includes it, one whose range covers
+    its pitch, nearest root first; if none covers it, the nearest root in that
+    layer (or overall) is used. Samples are memory-mapped, not loaded.
+    """
+    def __init__(self, name, zones, digest, path=None):
+        self.name = name
+        self.path = path  # where it was loaded from, for saving projects
+        self.zones = zones
+        self.digest = digest  # changes whenever the bank or any of its files does
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        spec = json.loads(raw.decode("utf-8"))
+        base = os.path.dirname(os.path.abspath(path))
+        h = hashlib.sha1(raw)
+        pitch = lambda v: float(v) if isinstance(v, (int, float)) else DEFAULT_TUNING.note_hz(str(v))  # Hz or a note name
+        zones = []
+        try:
+            for i, s in enumerate(spec.get("samples") or []):
+                try:
+                    root = pitch(s["root"])
+                    lo = pitch(s.get("lo", s["root"]))
+                    hi = pitch(s.get("hi", s["root"]))
+                    vel_lo, vel_hi = (int(v) for v in s.get("vel", (1, 127)))
+                    file = os.path.join(base, s["file"])
+                except (KeyError, TypeError, ValueError) as e:
+                    raise ValueError(f"sample {i + 1}: {e}") from None
+                st = os.stat(file)
+                h.update(f"{file}\0{st.st_size}\0{st.st_mtime_ns}".encode())
+                zones.append(SampleZone(file, root, min(lo, hi), max(lo, hi), vel_lo, vel_hi))
+        except Exception:
+            for z in zones:
+                z.close()
+            raise
+        if not zones:
+            raise ValueError("instrument lists no samples")
+        return cls(spec.get("name") or os.path.splitext(os.path.basename(path))[0], zones, h.hexdigest(), path)
+
+    @classmethod
+    def single(cls, path, root_hz=440.0, name=None):
+        """A one-sample bank spanning every pitch, e.g. for an imported recording."""
+        st = os.stat(path)
+        digest = hashlib.sha1(f"{os.path.abspath(path)}\0{st.st_size}\0{st.st_mtime_ns}".encode()).hexdigest()
+        zone = SampleZone(path, root_hz, 0.0, float("inf"))
+        return cls(name or os.path.splitext(os.path.basename(path))[0], [zone], digest, path)
+
+    def zone_for(self, freq_hz, vel=DEFAULT_VEL):
+        layer = [z for z in self.zones if z.vel_lo <= vel <= z.vel_hi] or self.zones
+        pool = [z for z in layer if z.lo <= freq_hz <= z.hi] or layer
+        return min(pool, key=lambda z: abs(math.log(freq_hz / z.root)))
+
+    def render(self, freq_hz, secs, vel=DEFAULT_VEL, sr=None):
+        return self.zone_for(freq_hz, vel).render(freq_hz, secs, sr)
+
+    def close(self):
+        for z in self.zones:
+            z.close()
+
+# -------------- Effects --------------
+
+FX_TRACKS = ("full", "half", "combo")  # one insert chain per sounding kind, plus "master"
+
+class Biquad:
+    """Low/high-pass biquad (RBJ cookbook, direct form I)."""
+    name = "filter"
+    PARAMS = ("mode", "cutoff", "q")
+
+    def __init__(self, sr=None, mode="lowpass", cutoff=3000.0, q=0.707):
+        self.sr = sr or AUDIO.sr
+        self.enabled = False
+        self.cpu = 0.0
+        self.set(mode, cutoff, q)
+        self.reset()
+
+    def set(self, mode=None, cutoff=None, q=None):
+        self.mode = mode or self.mode
+        self.cutoff = max(20.0, min(self.sr * 0.45, float(cutoff or self.cutoff)))
+        self.q = float(q or self.q)
+        w0 = 2 * math.pi * self.cutoff / self.sr
+        cw, alpha = math.cos(w0), math.sin(w0) / (2 * self.q)
+        if self.mode == "highpass":
+            b0, b1, b2 = (1 + cw) / 2, -(1 + cw), (1 + cw) / 2
+        else:
+            b0, b1, b2 = (1 - cw) / 2, 1 - cw, (1 - cw) / 2
+        a0 = 1 + alpha
+        self._coef = (b0/a0, b1/a0, b2/a0, -2*cw/a0, (1 - alpha)/a0)
+
+    def reset(self):
+        self._state = (0.0, 0.0, 0.0, 0.0)
+
+    def process(self, buf):
+        b0, b1, b2, a1, a2 = self._coef
+        x1, x2, y1, y2 = self._state
+        for i, x in enumerate(buf):
+            y = b0*x + b1*x1 + b2*x2 - a1*y1 - a2*y2
+            x2, x1, y2, y1 = x1, x, y1, y
+            buf[i] = y
+        self._state = (x1, x2, y1, y2)
+
+class FeedbackDelay:
+    """Single-tap delay line with feedback, mixed with the dry signal."""
+    name = "delay"
+    PARAMS = ("secs", "feedback", "mix")
+
+    def __init__(self, sr=None, secs=0.25, feedback=0.35, mix=0.3):
+        self.sr = sr or AUDIO.sr
+        self.enabled = False
+        self.cpu = 0.0
+        self.set(secs, feedback, mix)
+
+    def set(self, secs=None, feedback=None, mix=None):
+        self.secs = max(0.01, min(2.0, float(secs if secs is not None else self.secs)))
+        self.feedback = max(0.0, min(0.95, float(feedback if feedback is not None else self.feedback)))
+        self.mix = max(0.0, min(1.0, float(mix if mix is not None else self.mix)))
+        self.reset()
+
+    def reset(self):
+        self._line = array("f", [0.0]) * int(self.secs * self.sr)
+        self._idx = 0
+
+    def process(self, buf):
+        line, n, idx = self._line, len(self._line), self._idx
+        fb, wet = self.feedback, self.mix
+        dry = 1.0 - wet
+        for i, x in enumerate(buf):
+            d = line[idx]
+            line[idx] = x + d * fb
+            idx += 1
+            if idx == n:
+                idx = 0
+            buf[i] = x * dry + d * wet
+        self._idx = idx
+
+class Reverb:
+    """Small Schroeder/Freeverb-style reverb: four damped combs into two allpasses."""
+    name = "reverb"
+    PARAMS = ("room", "damp", "mix")
+    COMBS = (1116, 1188, 1277, 1356)  # tunings at 44.1 kHz
+    ALLPASSES = (556, 441)
+
+    def __init__(self, sr=None, room=0.5, damp=0.3, mix=0.25):
+        self.sr = sr or AUDIO.sr
+        self.enabled = False
+        self.cpu = 0.0
+        self.set(room, damp, mix)
+
+    def set(self, room=None, damp=None, mix=None):
+        self.room = max(0.0, min(1.0, float(room if room is not None else self.room)))
+        self.damp = max(0.0, min(0.99, float(damp if damp is not None else self.damp)))
+        self.mix = max(0.0, min(1.0, float(mix if mix is not None else self.mix)))
+        self.reset()
+
+    def reset(self):
+        scale = self.sr / 44100.0
+        self._combs = [[array("f", [0.0]) * max(1, int(n * scale)), 0, 0.0] for n in self.COMBS]
+        self._aps = [[array("f", [0.0]) * max(1, int(n * scale)), 0] for n in self.ALLPASSES]
+
+    def process(self, buf):
+        fb = 0.7 + 0.28 * self.room
+        damp, keep = self.damp, 1.0 - self.damp
+        wet, dry = self.mix, 1.0 - self.mix
+        n = len(buf)
+        acc = [0.0] * n
+        src = [x * 0.03 for x in buf]  # input gain keeps the comb sum in range
+        for comb in self._combs:
+            line, idx, filt = comb
+            size = len(line)
+            for i in range(n):
+                y = line[idx]
+                filt = y * keep + filt * damp
+                line[idx] = src[i] + filt * fb
+                idx += 1
+                if idx == size:
+                    idx = 0
+                acc[i] += y
+            comb[1], comb[2] = idx, filt
+        for ap in self._aps:
+            line, idx = ap
+            size = len(line)
+            for i in range(n):
+                b = line[idx]
+                line[idx] = acc[i] + b * 0.5
+                acc[i] = b - acc[i]
+                idx += 1
+                if idx == size:
+                    idx = 0
+            ap[1] = idx
+        for i in range(n):
+            buf[i] = buf[i] * dry + acc[i] * wet
+
+class EffectChain:
+    """Filter -> delay -> reverb insert chain; disabled effects cost nothing."""
+    def __init__(self, sr=None):
+        sr = sr or AUDIO.sr
+        self.filter = Biquad(sr)
+        self.delay = FeedbackDelay(sr)
+        self.reverb = Reverb(sr)
+        self.effects = [self.filter, self.delay, self.reverb]
+
+    def active(self):
+        return any(fx.enabled for fx in self.effects)
+
+    def process(self, buf):
+        for fx in self.effects:
+            if fx.enabled:
+                t0 = time.perf_counter()
+                fx.process(buf)
+                fx.cpu += time.perf_counter() - t0
+
+    def reset(self):
+        for fx in self.effects:
+            fx.reset()
+
+    def settings(self):
+        return {fx.name: dict({"enabled": fx.enabled}, **{p: getattr(fx, p) for p in fx.PARAMS})
+                for fx in self.effects}
+
+    def configure(self, settings):
+        for fx in self.effects:
+            s = settings.get(fx.name) or {}
+            fx.set(**{p: s[p] for p in fx.PARAMS if p in s})
+            fx.enabled = bool(s.get("enabled", fx.enabled))
+
+class EffectsRack:
+    """Per-track insert chains summed into a master chain.
+
+    Audio goes through in fixed blocks (AUDIO.block) and every effect keeps its
+    state between blocks, so a stream that pulls blocks live and an offline
+    render that loops over the same blocks produce the same samples."""
+    def __init__(self, sr=None, tracks=FX_TRACKS):
+        self.sr = sr or AUDIO.sr
+        self.chains = {t: EffectChain(self.sr) for t in tuple(tracks) + ("master",)}
+        self.audio_secs = 0.0  # audio processed while any effect was on
+
+    def active(self):
+        return any(chain.active() for chain in self.chains.values())
+
+    def reset(self):
+        for chain in self.chains.values():
+            chain.reset()
+
+    def settings(self):
+        return {track: chain.settings() for track, chain in self.chains.items()}
+
+    def configure(self, settings):
+        for track, chain in self.chains.items():
+            chain.configure(settings.get(track) or {})
+
+    def process(self, buses, n):
+        """Run one block: buses maps track -> n float samples (modified in
+        place). Returns the master output as array('f')."""
+        out = array("f", [0.0]) * n
+        for track, chain in self.chains.items():
+            if track == "master":
+                continue
+            buf = buses.get(track)
+            if buf is None:
+                if not chain.active():
+                    continue
+                buf = array("f", [0.0]) * n  # let tails ring out
+            chain.process(buf)
+            for i, v in enumerate(buf):
+                out[i] += v
+        self.chains["master"].process(out)
+        self.audio_secs += n / self.sr
+        return out
+
+    def cpu_report(self):
+        """[(track, effect, cpu seconds, share of real time)] for effects that ran."""
+        rows = []
+        for track, chain in self.chains.items():
+            for fx in chain.effects:
+                if fx.cpu:
+                    share = fx.cpu / self.audio_secs if self.audio_secs else 0.0
+                    rows.append((track, fx.name, fx.cpu, share))
+        return rows
+
+def run_blocks(rack, read, frames, block=None):
+    """Offline counterpart of a live stream: pull `read(pos, n)` bus blocks and
+    run them through the rack. Returns the master output as one float array."""
+    block = block or AUDIO.block
+    out = array("f")
+    pos = 0
+    while pos < frames:
+        n = min(block, frames - pos)
+        out.extend(rack.process(read(pos, n), n))
+        pos += n
+    return out
+
+# -------------- Loop rendering --------------
+
+def note_f32(freq_hz, dur_beats, bpm, waveform, sample=None, sr=None, cache=RENDER_CACHE,
+             instrument=None, vel=DEFAULT_VEL, store=SAMPLES):
+    """Float32 samples for one note at unit gain, served from memory (`store`,
+    as an unpinned "cached" variant) or the render cache when possible. An
+    instrument bank wins over a recording (a `store` handle), which wins over
+    the synth; velocity only picks the instrument's layer here."""
+    sr, q = sr or AUDIO.sr, AUDIO.quality
+    if instrument is not None:
+        secs = max(0.05, dur_beats * (60.0 / bpm))
+        zone = instrument.zone_for(freq_hz, vel)
+        key = cache.key("f32", "inst", instrument.digest, zone.path, round(freq_hz, 4), round(secs, 5), sr, q)
+        def render():
+            return zone.render(freq_hz, secs, sr)
+    elif sample:
+        # A recording is pitch-shifted by resampling, so its length is the sample's
+        key = cache.key("f32", "sample", q, sample, round(freq_hz, 4), sr)
+        def render():
+            data, rate = store.get(sample)
+            scale = 1.0 / 32768.0
+            return resample_f32(array("f", [v * scale for v in data]), freq_hz / 440.0 * rate / sr)
+    else:
+        secs = max(0.05, dur_beats * (60.0 / bpm))
+        key = cache.key("f32", "synth", waveform, round(freq_hz, 4), round(secs, 5), sr, 0.28, q)
+        def render():
+            return synth_f32(waveform, freq_hz, secs, sr, amp=0.28)
+    hit = store.find(key)
+    if hit is not None:
+        return hit[0]
+    data = cache.get_or_render(key, render, "f")
+    store.add(data, sr, "cached", name=key, pin=False)
+    return data
+
+FEEL_DEFAULT = {"swing": 50, "humanize_ms": 0, "flam_ms": 0}
+
+def strike_time(tempo_map, tick, lane, feel=None):
+    """Seconds at which a strike on `tick` sounds. Swing (50 = straight, 66 =
+    triplet feel) moves the off-beat eighth and stretches the beat around it;
+    humanize adds a random +-ms offset that is seeded by the strike's slot, so
+    re-renders of the same notes come out identical."""
+    if not feel:
+        return tempo_map.beat_to_time(tick / PPQ)
+    beat, frac = divmod(tick / PPQ, 1.0)
+    s = feel.get("swing", 50) / 100.0
+    if s != 0.5:
+        frac = frac * 2 * s if frac < 0.5 else s + (frac - 0.5) * 2 * (1 - s)
+    t = tempo_map.beat_to_time(beat + frac)
+    ms = feel.get("humanize_ms", 0)
+    if ms:
+        t += random.Random(tick * LANES + lane).uniform(-ms, ms) / 1000.0
+    return t
+
+def beat_buses(events, tempo_map, pos, lane_hz, waveform, sample=None, instrument=None, sr=None, feel=None):
+    """Dry mix of the strikes in beat `pos`, one float bus per kind, with sample 0
+    at the beat's downbeat. Every strike, including combo second hits, swung or
+    humanized ones and flam grace notes, is placed at its exact sample offset.
+    Live playback, loop playback and offline renders all build on this."""
+    sr = sr or AUDIO.sr
+    t0 = tempo_map.beat_to_time(pos)
+    bpm = tempo_map.bpm_at(pos)
+    flam = int((feel or {}).get("flam_ms", 0) * sr / 1000)
+    buses = {}
+    for tick, lane, ev in events.range(pos*PPQ, (pos+1)*PPQ):
+        freq = lane_to_hz(lane, lane_hz)
+        mix = buses.setdefault(ev["kind"], array("f"))
+        gain = ev["vel"] / DEFAULT_VEL
+        for offset, dur in event_strikes(ev["kind"], ev["dur"]):
+            samples = note_f32(freq, dur / PPQ, bpm, waveform, sample, sr,
+                               instrument=instrument, vel=ev["vel"])
+            start = max(0, int(round((strike_time(tempo_map, tick + offset, lane, feel) - t0) * sr)))
+            # A flam is a softer grace hit with the main stroke flam_ms behind it
+            hits = [(start, gain * 0.5), (start + flam, gain)] if flam else [(start, gain)]
+            for at, g in hits:
+                add_at(mix, at, samples if g == 1.0 else array("f", [v * g for v in samples]))
+    return {kind: mix for kind, mix in buses.items() if mix}
+
+def add_at(bus, off, samples):
+    """Mix `samples` into a float bus from sample `off`, growing it as needed.
+    Only the part overlapping what the bus already holds is summed; the rest is
+    copied on the end."""
+    if len(bus) < off:
+        bus.extend(array("f", [0.0]) * (off - len(bus)))
+    over = max(0, min(len(samples), len(bus) - off))
+    if over:
+        bus[off:off + over] = array("f", map(operator.add, bus[off:off + over], samples[:over]))
+    bus.extend(samples[over:])
+
+def bar_signature(events, tempo_map, bar, lane_hz, source, feel=None, sr=None):
+    """Fingerprint of everything a bar's audio depends on, wherever the bar sits:
+    its notes relative to the downbeat with their pitches, the beat timing and
+    tempo inside it, the sound source and the feel. None for a silent bar.
+    Humanize is seeded by absolute tick, so with it on a bar only matches itself."""
+    sr = sr or AUDIO.sr
+    b0 = bar * BEATS_PER_BAR
+    notes = tuple((tick - b0*PPQ, lane, ev["kind"], ev["dur"], ev["vel"], lane_to_hz(lane, lane_hz))
+                  for tick, lane, ev in events.range(b0*PPQ, (b0 + BEATS_PER_BAR)*PPQ)
+                  if event_strikes(ev["kind"], ev["dur"]))
+    if not notes:
+        return None
+    t0 = tempo_map.beat_to_time(b0)
+    timing = tuple((round(tempo_map.beat_to_time(b0 + i) - t0, 9), round(tempo_map.bpm_at(b0 + i), 6))
+                   for i in range(BEATS_PER_BAR + 1))
+    feel = dict(FEEL_DEFAULT, **(feel or {}))
+    return (notes, timing, source, tuple(sorted(feel.items())), bar if feel["humanize_ms"] else None, sr)
+
+def bar_buses(events, tempo_map, bar, lane_hz, waveform, sample=None, instrument=None, sr=None, feel=None):
+    """beat_buses for a whole bar, sample 0 at its downbeat. Beats are placed by
+    their time from the downbeat, so equal bars render equal buffers anywhere in
+    the score; tails run on past the bar's end."""
+    sr = sr or AUDIO.sr
+    b0 = bar * BEATS_PER_BAR
+    t0 = tempo_map.beat_to_time(b0)
+    out = {}
+    for pos in range(b0, b0 + BEATS_PER_BAR):
+        off = int(round((tempo_map.beat_to_time(pos) - t0) * sr))
+        for kind, samples in beat_buses(events, tempo_map, pos, lane_hz, waveform, sample,
+                                        instrument, sr, feel).items():
+            add_at(out.setdefault(kind, array("f")), off, samples)
+    return out
+
+class LoopRenderer:
+    """Pre-renders an A/B region of beats into one PCM16 loop buffer.
+
+    Mixing happens in float32; PCM16 is produced only when `pcm` is written.
+    Every beat is rendered on its own and cached by a signature of what it
+    contains, not by where it is, so an edit only re-synthesizes the beats whose
+    signature changed and a repeated pattern is synthesized once.
+    Beats may differ in length (tempo map), so the layout is given as sample
+    offsets of each beat.
+    The mix is kept as unclipped float sums, one dry bus per effects track; a
+    changed beat is subtracted and re-added and only the samples it covers are
+    re-quantized into `pcm`. The buses stay around so an effects rack can
+    stream them (`dry_block`) or render them wet (`render_wet`).
+    Tails that run past B wrap around to A, so the seam sounds like the middle.
+    """
+    def __init__(self, sr=None):
+        self.sr = sr or AUDIO.sr
+        self.region = None        # (a, b) in beats, b exclusive
+        self.starts = []          # sample offset of each beat in the region, plus the end
+        self.pcm = bytearray()    # PCM16 mono, patched in place on edits
+        self.buses = {}           # track -> array('f') dry mix of the loop
+        self._cache = {}          # signature -> {track: array('f')}, shared by equal beats
+        self._mixed = {}          # beat -> signature currently summed into the buses
+        self.dither = False
+
+    def frames(self):
+        return self.starts[-1] if self.starts else 0
+
+    def beat_at(self, frame):
+        """Beat playing at a frame offset into the loop."""
+        return int(self.beat_pos(frame))
+
+    def beat_pos(self, frame):
+        """Fractional beat position at a frame offset into the loop."""
+        i = max(0, min(bisect.bisect_right(self.starts, frame) - 1, len(self.starts) - 2))
+        s0, s1 = self.starts[i], self.starts[i+1]
+        return self.region[0] + i + (frame - s0) / max(1, s1 - s0)
+
+    def render(self, region, starts, signature, synth):
+        """Bring the loop buffer up to date. `starts` comes from
+        TempoMap.beat_starts; `signature(beat)` describes a beat's
+        content; `synth(beat)` renders it to {track: float samples}. Returns
+        the beats that had to be re-synthesized."""
+        a, b = region
+        rebuilt = []
+        if region != self.region or starts != self.starts:
+            self.region, self.starts = region, starts
+            self.buses = {}
+            self.pcm = bytearray(2 * starts[-1])
+            self._mixed = {}
+        dirty = []
+        for beat in range(a, b):
+            sig = signature(beat)
+            if self._mixed.get(beat) == sig:
+                continue
+            if beat in self._mixed:
+                dirty += self._mix(beat, self._cache[self._mixed[beat]], -1)
+            parts = self._cache.get(sig)
+            if parts is None:
+                parts = self._cache[sig] = synth(beat)
+                rebuilt.append(beat)
+            dirty += self._mix(beat, parts, 1)
+            self._mixed[beat] = sig
+        if len(self._cache) > 2 * (b - a) + 64:
+            # Keep what is mixed in; older edits are cheap to redo
+            live = set(self._mixed.values())
+            self._cache = {sig: parts for sig, parts in self._cache.items() if sig in live}
+        for s, e in dirty:
+            self._quantize(s, e)
+        return rebuilt
+
+    def _mix(self, beat, parts, sign):
+        """Add (or subtract) a beat's per-track samples; returns the touched (start, end) ranges."""
+        n = self.frames()
+        if not n:
+            return []
+        off = self.starts[beat - self.region[0]]
+        touched = []
+        for track, samples in parts.items():
+            if not samples:
+                continue
+            acc = self.buses.get(track)
+            if acc is None:
+                acc = self.buses[track] = array("f", [0.0]) * n
+            for i, v in enumerate(samples):
+                acc[(off + i) % n] += sign * v
+            if len(samples) >= n:
+                touched.append((0, n))
+                continue
+            end = off + len(samples)
+            if end <= n:
+                touched.append((off, end))
+            else:
+                touched += [(off, n), (0, end - n)]
+        return touched
+
+    def _dry_sum(self, s, e):
+        buses = list(self.buses.values())
+        if not buses:
+            return array("f", [0.0]) * (e - s)
+        mix = buses[0][s:e]
+        for bus in buses[1:]:
+            for i, v in enumerate(bus[s:e]):
+                mix[i] += v
+        return mix
+
+    def _quantize(self, s, e):
+        self.pcm[2*s:2*e] = quantize_pcm16(self._dry_sum(s, e), self.dither)
+
+    def dry_block(self, pos, n):
+        """{track: n dry samples} starting at frame `pos`, wrapping at the loop end."""
+        size = self.frames()
+        out = {}
+        for track, bus in self.buses.items():
+            block = array("f")
+            p, need = pos % size, n
+            while need > 0:
+                take = min(need, size - p)
+                block.extend(bus[p:p+take])
+                p, need = 0, need - take
+            out[track] = block
+        return out
+
+    def render_wet(self, rack):
+        """One pass of the loop through `rack`, as PCM16. A warm-up pass runs
+        first so delay and reverb tails from the end carry over into the start,
+        the same as they do when the loop is streamed."""
+        n = self.frames()
+        if not n:
+            return bytearray()
+        rack.reset()
+        run_blocks(rack, self.dry_block, n)
+        return bytearray(quantize_pcm16(run_blocks(rack, self.dry_block, n), self.dither))
+
+class LoopPlayer:
+    """Plays a loop buffer over and over without a gap.
+
+    With sounddevice the stream callback reads straight from the buffer and
+    wraps its read position in place, so the seam is sample-accurate and edits
+    patched into the buffer are heard on the next pass. When an effects rack is
+    active the callback instead pulls dry blocks from the renderer and runs them
+    through the rack, block by block. Without sounddevice, winsound can loop a
+    file natively; other systems re-trigger the player each pass.
+    """
+    def __init__(self, sr=None):
+        self.sr = sr or AUDIO.sr
+        self.pcm = None
+        self.renderer = None  # source of dry blocks for the effects path
+        self.rack = None
+        self.dither = False
+        self.played = 0   # frames handed to the device since start()
+        self._frame = 0   # read position in frames
+        self._stream = None
+        self._started_at = None
+        self._temp = None
+
+    @property
+    def gapless(self):
+        return can_stream() or winsound is not None
+
+    @property
+    def streams_fx(self):
+        """True if effects are applied live by the stream callback."""
+        return can_stream()
+
+    def start(self, pcm, renderer=None, rack=None):
+        self.stop()
+        self.pcm = pcm
+        self.renderer, self.rack = renderer, rack
+        self.played = 0
+        self._frame = 0
+        self._started_at = time.perf_counter()
+        if not pcm:
+            return
+        if can_stream():
+            if rack is not None:
+                rack.reset()
+            self._stream = output_stream(self.sr, self._callback)
+            self._stream.start()
+        else:
+            self._start_file()
+
+    def update(self, pcm):
+        """Swap in a re-rendered buffer; the stream keeps its place in the loop."""
+        self.pcm = pcm
+        if pcm:
+            self._frame %= len(pcm) // 2
+        if self._stream is None and winsound and self._started_at is not None:
+            self._start_file()  # the looping file has to carry the new bytes
+
+    def replay_pass(self):
+        """Re-trigger one pass on players that cannot loop by themselves."""
+        if self._stream is None and winsound is None and self.pcm:
+            play_wav_bytes(pcm16_to_wav(bytes(self.pcm), self.sr, channels=1))
+
+    def stop(self):
+        if self._stream is not None:
+            try:
+                self._stream.stop()
+                self._stream.close()
+            except Exception:
+                pass
+            self._stream = None
+        if winsound and self._temp:
+            try:
+                winsound.PlaySound(None, 0)
+            except Exception:
+                pass
+        self._started_at = None
+
+    def position(self):
+        """Frames into the loop that are playing right now."""
+        n = len(self.pcm) // 2 if self.pcm else 0
+        if not n:
+            return 0
+        if self._stream is not None:
+            return self.played % n
+        if self._started_at is None:
+            return 0
+        return int((time.perf_counter() - self._started_at) * self.sr) % n
+
+    def _callback(self, outdata, frames, time_info, status):
+        buf = self.pcm
+        if not buf:
+            outdata[:] = bytes(frames * 2)
+            return
+        n = len(buf) // 2
+        pos = self._frame % n
+        rack = self.rack
+        if rack is not None and rack.active() and self.renderer is not None:
+            wet = rack.process(self.renderer.dry_block(pos, frames), frames)
+            outdata[:] = quantize_pcm16(wet, self.dither)
+        else:
+            chunks, need, p = [], frames, pos
+            while need > 0:
+                take = min(need, n - p)
+                chunks.append(buf[2*p:2*(p+take)])
+                p, need = (p + take) % n, need - take
+            outdata[:] = b"".join(chunks)
+        self._frame = (pos + frames) % n
+        self.played += frames
+
+    def _start_file(self):
+        self._started_at = time.perf_counter()
+        if winsound:
+            if self._temp is None:
+                fd, self._temp = tempfile.mkstemp(suffix=".wav")
+                os.close(fd)
+            with open(self._temp, "wb") as f:
+                f.write(pcm16_to_wav(bytes(self.pcm), self.sr, channels=1))
+            try:
+                winsound.PlaySound(self._temp, winsound.SND_FILENAME | winsound.SND_ASYNC | winsound.SND_LOOP)
+            except Exception:
+                pass
+        else:
+            self.replay_pass()
+
+LIVE_LEAD = 0.1  # seconds between starting playback and the first beat sounding
+LIVE_AHEAD = 2   # beats handed to the stream ahead of the one playing
+
+class LiveStream:
+    """Continuous output stream for normal (non-loop) playback.
+
+    Beats are rendered a beat ahead (per-track buses from beat_buses) and
+    scheduled at an exact frame of the stream, so every strike inside a beat
+    lands on its sample however late the Tk timer fires. The callback mixes
+    whatever overlaps the current block and runs it through the effects rack;
+    stop() drops everything still pending."""
+    def __init__(self, sr=None):
+        self.sr = sr or AUDIO.sr
+        self.rack = None
+        self.dither = False
+        self.frame = 0        # frames handed to the device since start()
+        self._pending = []    # (start frame, {track: array('f')}, length)
+        self._lock = threading.Lock()
+        self._stream = None
+
+    def start(self, rack=None):
+        self.stop()
+        self.rack = rack
+        self.frame = 0
+        if rack is not None:
+            rack.reset()
+        self._stream = output_stream(self.sr, self._callback)
+        self._stream.start()
+
+    def schedule(self, at_frame, parts):
+        if parts:
+            with self._lock:
+                self._pending.append((at_frame, parts, max(len(v) for v in parts.values())))
+
+    def stop(self):
+        if self._stream is not None:
+            try:
+                self._stream.stop()
+                self._stream.close()
+            except Exception:
+                pass
+            self._stream = None
+        with self._lock:
+            self._pending = []
+
+    def _callback(self, outdata, frames, time_info, status):
+        f0, f1 = self.frame, self.frame + frames
+        with self._lock:
+            self._pending = [p for p in self._pending if p[0] + p[2] > f0]
+            active = [p for p in self._pending if p[0] < f1]
+        buses = {}
+        for at, parts, _n in active:
+            for track, samples in parts.items():
+                bus = buses.get(track)
+                if bus is None:
+                    bus = buses[track] = array("f", [0.0]) * frames
+                for i in range(max(f0, at), min(f1, at + len(samples))):
+                    bus[i - f0] += samples[i - at]
+        rack = self.rack
+        if rack is not None and rack.active():
+            out = rack.process(buses, frames)
+        else:
+            out = array("f", [0.0]) * frames
+            for bus in buses.values():
+                for i, v in enumerate(bus):
+                    out[i] += v
+        outdata[:] = quantize_pcm16(out, self.dither)
+        self.frame = f1
+
+# -------------- Audio engine process --------------
+
+ENGINE_RING_SECS = 8.0  # PCM the UI may queue ahead of the engine (a beat at the slowest tempo fits)
+ENGINE_POLL_MS = 250    # how often the UI checks the engine for underruns
+_RING_HEADER = struct.Struct("<qqqq")  # write frame, read frame, underruns, loop position
+
+class PcmRing:
+    """Single-producer, single-consumer ring of PCM16 mono frames in shared memory.
+
+    The header holds absolute frame counts, each field written by one side only:
+    the UI advances the write position, the engine the read position, the
+    underrun count and its place in a loop. So neither side ever locks."""
+    def __init__(self, frames, name=None):
+        self.frames = frames
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None,
+                                              size=_RING_HEADER.size + 2 * frames)
+        self.name = self.shm.name
+        self._short = False  # reader side: the last read came up short
+        if name is None:
+            _RING_HEADER.pack_into(self.shm.buf, 0, 0, 0, 0, 0)
+
+    def _field(self, i):
+        return struct.unpack_from("<q", self.shm.buf, 8 * i)[0]
+
+    def _set(self, i, v):
+        struct.pack_into("<q", self.shm.buf, 8 * i, v)
+
+    write_pos = property(lambda self: self._field(0), lambda self, v: self._set(0, v))
+    read_pos = property(lambda self: self._field(1), lambda self, v: self._set(1, v))
+    underruns = property(lambda self: self._field(2), lambda self, v: self._set(2, v))
+    loop_pos = property(lambda self: self._field(3), lambda self, v: self._set(3, v))
+
+    def buffered(self):
+        return self.write_pos - self.read_pos
+
+    def _span(self, pos, n):
+        """Byte ranges of n frames from absolute frame pos, split at the wrap."""
+        p = pos % self.frames
+        first = min(n, self.frames - p)
+        base = _RING_HEADER.size
+        return [(base + 2 * p, base + 2 * (p + first)), (base, base + 2 * (n - first))]
+
+    def write(self, pcm):
+        """Queue PCM16 bytes; returns how many frames fitted."""
+        w = self.write_pos
+        n = min(len(pcm) // 2, self.frames - (w - self.read_pos))
+        done = 0
+        for s, e in self._span(w, n):
+            self.shm.buf[s:e] = pcm[done:done + e - s]
+            done += e - s
+        self.write_pos = w + n
+        return n
+
+    def read(self, n):
+        """n frames as bytes; a short ring is padded with silence, and each run
+        of short reads counts as one underrun."""
+        r = self.read_pos
+        take = max(0, min(n, self.write_pos - r))
+        out = b"".join(bytes(self.shm.buf[s:e]) for s, e in self._span(r, take))
+        self.read_pos = r + take
+        if take < n:
+            if not self._short:  # count each dry spell once
+                self.underruns += 1
+            out += bytes(2 * (n - take))
+        self._short = take < n
+        return out
+
+    def close(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+def engine_main(conn, ring_name, frames, sr=SAMPLE_RATE, sink="device", block=BLOCK_SIZE):
+    """Entry point of the engine process. Commands arrive on `conn`:
+
+        ("loop", pcm)     play a buffer over and over; it lives here, so no UI stall can break it
+        ("update", pcm)   swap in a re-rendered loop, keeping the place in it
+        ("stream",)       play what the UI queues in the ring
+        ("stop", upto)    go quiet and drop what was queued before ring frame `upto`
+        ("quit",)
+
+    Ring underruns while streaming are reported as ("underrun", count, frame).
+    `sink` "null" paces output by the clock instead of a device (for tests
+    and machines without one). The process exits if the UI goes away."""
+    ring = PcmRing(frames, ring_name)
+    lock = threading.Lock()
+    state = {"mode": None, "loop": b"", "pos": 0, "played": 0}
+
+    def fill(n):
+        with lock:
+            mode, buf = state["mode"], state["loop"]
+            if mode == "loop" and buf:
+                size = len(buf) // 2
+                chunks, need, p = [], n, state["pos"] % size
+                while need > 0:
+                    take = min(need, size - p)
+                    chunks.append(buf[2*p:2*(p+take)])
+                    p, need = (p + take) % size, need - take
+                state["pos"] = p
+                ring.loop_pos = p
+                out = b"".join(chunks)
+            elif mode == "stream":
+                out = ring.read(n)
+            else:
+                out = bytes(2 * n)
+            state["played"] += n
+        return out
+
+    stop = threading.Event()
+    stream = None
+    if sink == "device" and HAVE_SD:
+        def callback(outdata, n, time_info, status):
+            outdata[:] = fill(n)
+        stream = sd.RawOutputStream(samplerate=sr, channels=1, dtype="int16",
+                                    blocksize=block, callback=callback)
+        stream.start()
+    else:
+        def clock():
+            t = time.perf_counter()
+            while not stop.is_set():
+                fill(block)
+                t += block / sr
+                time.sleep(max(0.0, t - time.perf_counter()))
+        threading.Thread(target=clock, daemon=True).start()
+
+    reported = 0
+    try:
+        while True:
+            if conn.poll(0.02):
+                cmd = conn.recv()
+                with lock:
+                    if cmd[0] == "loop":
+                        state.update(mode="loop", loop=cmd[1], pos=0)
+                        ring.loop_pos = 0
+                    elif cmd[0] == "update":
+                        size = len(cmd[1]) // 2
+                        state["loop"] = cmd[1]
+                        state["pos"] = state["pos"] % size if size else 0
+                    elif cmd[0] == "stream":
+                        state["mode"] = "stream"
+                    elif cmd[0] == "stop":
+                        state["mode"] = None
+                        ring.read_pos = max(ring.read_pos, min(cmd[1], ring.write_pos))
+                    elif cmd[0] == "quit":
+                        break
+            count = ring.underruns
+            if count != reported:
+                reported = count
+                conn.send(("underrun", count, state["played"]))
+    except (EOFError, OSError):
+        pass  # the UI has gone
+    finally:
+        stop.set()
+        if stream is not None:
+            stream.stop()
+            stream.close()
+        ring.close()
+
+class AudioEngine:
+    """UI-side handle on an engine process (see engine_main). The process is
+    spawned fresh, so it shares no interpreter state, GIL or GC pauses with Tk;
+    the UI only sends commands and fills the ring. poll() collects underrun
+    reports."""
+    def __init__(self, sr=None, sink="device", block=None):
+        self.sr, self.sink, self.block = sr or AUDIO.sr, sink, block or AUDIO.block
+        self.silent = sink != "device" or not HAVE_SD  # paced by the clock, nothing is heard
+        self.ring = None
+        self.underruns = 0
+        self.last_underrun = None  # engine frame of the latest one
+        self._proc = None
+        self._conn = None
+
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.ring = PcmRing(int(ENGINE_RING_SECS * self.sr))
+        self._conn, child = ctx.Pipe()
+        self._proc = ctx.Process(target=engine_main, args=(child, self.ring.name, self.ring.frames, self.sr, self.sink, self.block),
+                                 name="sheet42-audio", daemon=True)
+        self._proc.start()
+        child.close()
+
+    def alive(self):
+        return self._proc is not None and self._proc.is_alive()
+
+    def send(self, *cmd):
+        try:
+            self._conn.send(cmd)
+        except (OSError, AttributeError):
+            pass  # dead engine: alive() says so and the UI falls back
+
+    def poll(self):
+        """Drain reports; returns the number of new underruns."""
+        new = 0
+        try:
+            while self._conn is not None and self._conn.poll():
+                kind, count, frame = self._conn.recv()
+                if kind == "underrun":
+                    new += count - self.underruns
+                    self.underruns, self.last_underrun = count, frame
+        except (EOFError, OSError):
+            pass
+        return new
+
+    def close(self):
+        if self._proc is not None:
+            self.send("quit")
+            self._proc.join(1.0)
+            if self._proc.is_alive():
+                self._proc.terminate()
+            self._proc = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self.ring is not None:
+            self.ring.close(unlink=True)
+            self.ring = None
+
+class EngineLoopPlayer:
+    """LoopPlayer interface on the engine process. The loop buffer is copied to
+    the engine, which loops it by itself; effects are pre-rendered into it."""
+    gapless = True
+    streams_fx = False
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.sr = engine.sr
+        self.pcm = None
+        self.dither = False
+
+    def start(self, pcm, renderer=None, rack=None):
+        self.pcm = pcm
+        self.engine.send("loop", bytes(pcm or b""))
+
+    def update(self, pcm):
+        self.pcm = pcm
+        self.engine.send("update", bytes(pcm or b""))
+
+    def replay_pass(self):
+        pass
+
+    def stop(self):
+        self.engine.send("stop", 0)
+
+    def position(self):
+        n = len(self.pcm) // 2 if self.pcm else 0
+        return self.engine.ring.loop_pos % n if n else 0
+
+class EngineStream:
+    """LiveStream interface on the engine process. Scheduled beats are mixed
+    and run through the rack here; once a beat is scheduled nothing earlier can
+    change, so everything before it is queued in the ring. With the UI a beat
+    ahead, the engine keeps playing through a UI stall of about a beat."""
+    def __init__(self, engine):
+        self.engine = engine
+        self.sr = engine.sr
+        self.rack = None
+        self.dither = False
+        self._base = 0       # ring frame where this run started
+        self._written = 0    # frames queued since start()
+        self._pending = []   # (start frame, {track: array('f')}, length)
+        self._backlog = b""  # PCM that did not fit in the ring yet
+
+    @property
+    def frame(self):
+        """Frames the engine has taken from this run (underruns pause the count)."""
+        return self.engine.ring.read_pos - self._base
+
+    def start(self, rack=None):
+        self.stop()
+        self.rack = rack
+        if rack is not None:
+            rack.reset()
+        self._base = self.engine.ring.write_pos
+        self._written = 0
+        self.engine.send("stream")
+
+    def schedule(self, at_frame, parts):
+        self._flush(at_frame)
+        if parts:
+            self._pending.append((at_frame, parts, max(len(v) for v in parts.values())))
+
+    def stop(self):
+        self._pending = []
+        self._backlog = b""
+        if self.engine.ring is not None:
+            self.engine.send("stop", self.engine.ring.write_pos)
+
+    def _flush(self, upto):
+        """Mix, process and queue frames [written, upto)."""
+        f0 = self._written
+        if upto > f0:
+            self._pending = [p for p in self._pending if p[0] + p[2] > f0]
+            out = array("f")
+            block = self.engine.block
+            for b0 in range(f0, upto, block):
+                n = min(block, upto - b0)
+                buses = {}
+                for at, parts, _n in self._pending:
+                    if at >= b0 + n or at + _n <= b0:
+                        continue
+                    for track, samples in parts.items():
+                        bus = buses.get(track)
+                        if bus is None:
+                            bus = buses[track] = array("f", [0.0]) * n
+                        s = max(b0, at)
+                        e = min(b0 + n, at + len(samples))
+                        if e > s:
+                            bus[s-b0:e-b0] = array("f", map(operator.add, bus[s-b0:e-b0], samples[s-at:e-at]))
+                rack = self.rack
+                if rack is not None and rack.active():
+                    out.extend(rack.process(buses, n))
+                else:
+                    mix = array("f", [0.0]) * n
+                    for bus in buses.values():
+                        add_at(mix, 0, bus)
+                    out.extend(mix)
+            self._backlog += quantize_pcm16(out, self.dither)
+            self._written = upto
+        if self._backlog:
+            n = self.engine.ring.write(self._backlog)
+            self._backlog = self._backlog[2 * n:]
+
+# -------------- Transport sync --------------
+
+SYNC_GROUP = "239.42.42.42"  # administratively scoped multicast: stays on the site
+SYNC_PORT = 42420
+SYNC_HZ = 10        # beacons per second from every instance
+SYNC_WINDOW = 16    # round trips kept per peer; the fastest one sets the offset
+SYNC_TIMEOUT = 3.0  # seconds of silence before a peer is dropped
+SYNC_GAIN = 0.25    # share of the phase error taken out per beacon
+SYNC_SLEW = 0.004   # most seconds the clock is moved per beacon
+SYNC_JUMP = 0.25    # phase errors past this many beats re-seek instead of slewing
+
+class SyncPeer:
+    """Another instance as heard on the sync group: its last beacon, and its
+    clock offset (theirs minus ours) from NTP-style round trips."""
+    def __init__(self, node):
+        self.node = node
+        self.state = None        # its last beacon
+        self.heard = None        # (its send time, our arrival time) of that beacon, echoed back
+        self.seen = 0.0
+        self.samples = deque(maxlen=SYNC_WINDOW)  # (round-trip delay, offset)
+
+    def add_sample(self, t1, t2, t3, t4):
+        """t1 we sent, t2 it received, t3 it replied, t4 we received; t2/t3 on its clock."""
+        self.samples.append(((t4 - t1) - (t3 - t2), ((t2 - t1) + (t3 - t4)) / 2))
+
+    @property
+    def synced(self):
+        return bool(self.samples)
+
+    @property
+    def delay(self):
+        return min(self.samples)[0]
+
+    @property
+    def offset(self):
+        """From the round trip with the least delay, which queueing skewed least."""
+        return min(self.samples)[1]
+
+    @property
+    def jitter(self):
+        """RMS spread of the recent offsets around the chosen one."""
+        best = self.offset
+        return math.sqrt(sum((o - best) ** 2 for _d, o in self.samples) / len(self.samples))
+
+class TransportSync:
+    """Tempo, beat phase and start/stop shared between instances over UDP multicast.
+
+    Every instance sends a beacon SYNC_HZ times a second with its clock reading
+    and, for each peer it hears, that peer's last send time and when it arrived.
+    The peer then holds all four timestamps of a round trip, hence our clock
+    offset and the delay; SyncPeer keeps the best of a window. An instance that
+    leads adds its transport to the beacon, and followers place it on their own
+    clock (leader_beat) and slew toward it (phase_nudge). Packets are stamped on
+    arrival by a reader thread and applied by poll().
+    """
+    def __init__(self, group=SYNC_GROUP, port=SYNC_PORT, iface="0.0.0.0", node=None, clock=time.perf_counter):
+        self.group, self.port, self.clock = group, port, clock
+        self.node = node or f"{socket.gethostname()}:{os.getpid()}"
+        self.peers = {}  # node -> SyncPeer
+        self.inbox = deque()  # (arrival time, packet) from the reader thread
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):  # several instances on one host
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(("", port))
+            mreq = socket.inet_aton(group) + socket.inet_aton(iface)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(iface))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            sock.settimeout(0.2)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def _receive(self):
+        while not self._stop.is_set():
+            try:
+                data, _addr = self.sock.recvfrom(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.inbox.append((self.clock(), data))
+
+    def send(self, transport=None):
+        """Beacon now; a leader passes its transport ({"playing", "beat", "tempo"},
+        read just before) to be placed at this beacon's clock reading."""
+        msg = {"v": 1, "node": self.node, "t": self.clock(),
+               "echo": {p.node: p.heard for p in self.peers.values() if p.heard}}
+        if transport is not None:
+            msg["lead"] = transport
+        self.sock.sendto(json.dumps(msg, separators=(",", ":")).encode(), (self.group, self.port))
+
+    def poll(self):
+        """Apply what arrived since the last call and forget silent peers. Returns
+        the leader's SyncPeer once its offset is known, else None."""
+        while self.inbox:
+            t4, data = self.inbox.popleft()
+            try:
+                msg = json.loads(data)
+                node, t3 = msg["node"], float(msg["t"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if node == self.node or msg.get("v") != 1:
+                continue
+            peer = self.peers.get(node) or self.peers.setdefault(node, SyncPeer(node))
+            echo = (msg.get("echo") or {}).get(self.node)
+            if echo:
+                peer.add_sample(echo[0], echo[1], t3, t4)
+            peer.state, peer.heard, peer.seen = msg, (t3, t4), t4
+        now = self.clock()
+        for node in [n for n, p in self.peers.items() if now - p.seen > SYNC_TIMEOUT]:
+            del self.peers[node]
+        leaders = sorted(n for n, p in self.peers.items() if p.synced and "lead" in p.state)
+        return self.peers[leaders[0]] if leaders else None
+
+    def close(self):
+        self._stop.set()
+        self.sock.close()
+        self._thread.join(timeout=1.0)
+
+def leader_beat(peer, now, tempo_map):
+    """Where the leader's transport is at our clock reading `now` (unwrapped)."""
+    lead = peer.state["lead"]
+    elapsed = now + peer.offset - peer.state["t"]
+    if not lead["playing"]:
+        return float(lead["beat"])
+    return tempo_map.time_to_beat(tempo_map.beat_to_time(lead["beat"]) + elapsed)
+
+def tempo_from_points(points):
+    """A TempoMap from (beat, bpm, ramp) points as journalled or sent by a leader."""
+    tempo_map = TempoMap(points[0][1])
+    for beat, bpm, ramp in points:
+        tempo_map.set_point(beat, bpm, ramp)
+    return tempo_map
+
+def same_tempo(a, b, tol=1e-6):
+    """Whether two lists of tempo points agree, up to float noise in beats and BPM."""
+    return len(a) == len(b) and all(
+        abs(b1 - b2) <= tol and abs(t1 - t2) <= tol and bool(r1) == bool(r2)
+        for (b1, t1, r1), (b2, t2, r2) in zip(a, b))
+
+def beat_error(mine, theirs, total):
+    """mine - theirs in beats, taken the short way round a `total`-beat sheet."""
+    return (mine - theirs + total / 2) % total - total / 2
+
+def phase_nudge(err_secs):
+    """Seconds to hold a follower's clock back for one beacon (negative: move it
+    on): a share of the error, slew-limited so corrections never jump audibly."""
+    return max(-SYNC_SLEW, min(SYNC_SLEW, SYNC_GAIN * err_secs))
+
+# -------------- Transcription --------------
+
+def estimate_pitch(samples, sr, fmin=60.0, fmax=1000.0, decimate=4):
+    """Fundamental of a short window in Hz, or None if it is not clearly pitched.
+
+    The window is box-filtered and decimated first, which cuts the
+    autocorrelation cost by decimate**2. Among lags of the normalized
+    autocorrelation, the first peak within 90% of the best one wins, so the
+    true period is picked over its multiples (octave-down errors)."""
+    q = decimate
+    d = [sum(samples[i:i+q]) / q for i in range(0, len(samples) - q + 1, q)]
+    dsr = sr / q
+    if d:
+        mean = sum(d) / len(d)
+        d = [v - mean for v in d]
+    lo = max(2, int(dsr / fmax))
+    hi = int(dsr / fmin) + 1
+    n = len(d) - hi
+    if n < hi // 2 or lo >= hi:
+        return None
+    head = d[:n]
+    e0 = sum(v*v for v in head)
+    el = sum(v*v for v in d[lo:lo+n])
+    r = []
+    for lag in range(lo, hi + 1):
+        s = sum(a*b for a, b in zip(head, d[lag:lag+n]))
+        r.append(s / math.sqrt(e0 * el) if e0 > 0 and el > 0 else 0.0)
+        if lag + n < len(d):  # slide the energy of the lagged segment
+            el += d[lag+n]**2 - d[lag]**2
+    best = max(r)
+    if best < 0.6:
+        return None
+    for k in range(1, len(r) - 1):
+        if r[k] >= 0.9 * best and r[k] >= r[k-1] and r[k] >= r[k+1]:
+            break
+    else:
+        return None
+    a, b, c = r[k-1], r[k], r[k+1]
+    den = a - 2*b + c
+    shift = 0.5 * (a - c) / den if den else 0.0  # parabolic peak between lags
+    return dsr / (lo + k + shift)
+
+class Transcriber:
+    """Streaming onset and pitch detector fed one audio block at a time.
+
+    Onsets: the RMS of each HOP-sample frame is compared with a slow running
+    average and an absolute floor, with a refractory gap between onsets.
+    Pitch: once `window` seconds past an onset have arrived they go through
+    estimate_pitch. Work per block is bounded (one pass over the block plus at
+    most one fixed-size pitch window), and the time feed() takes is recorded
+    per block so latency can be checked against the block's duration."""
+    HOP = 256
+
+    def __init__(self, sr=None, threshold=0.02, ratio=1.4, gap=0.08, window=0.06,
+                 fmin=60.0, fmax=1000.0):
+        self.sr = sr or AUDIO.sr
+        self.threshold, self.ratio = threshold, ratio
+        self.gap = int(gap * self.sr)
+        self.window = int(window * self.sr)
+        self.fmin, self.fmax = fmin, fmax
+        self.pos = 0           # samples consumed so far
+        self.unpitched = 0     # onsets dropped for lack of a clear pitch
+        self.block_secs = []   # analysis time per block, most recent last
+        self._avg = 0.0
+        self._last_onset = -self.gap
+        self._pending = None   # (onset sample, level, samples since onset)
+        self._carry = array("f")
+
+    def feed(self, block):
+        """Analyse a block; returns notes [(onset_secs, freq_hz, level)] completed in it."""
+        t0 = time.perf_counter()
+        buf = self._carry + array("f", block)
+        notes = []
+        hop = self.HOP
+        i = 0
+        while i + hop <= len(buf):
+            frame = buf[i:i+hop]
+            if self._pending is not None:
+                start, level, win = self._pending
+                win.extend(frame)
+                if len(win) >= self.window:
+                    self._pending = None
+                    freq = estimate_pitch(win[:self.window], self.sr, self.fmin, self.fmax)
+                    if freq:
+                        notes.append((start / self.sr, freq, level))
+                    else:
+                        self.unpitched += 1
+            rms = math.sqrt(sum(v*v for v in frame) / hop)
+            if (self._pending is None and rms > self.threshold and rms > self.ratio * self._avg
+                    and self.pos - self._last_onset >= self.gap):
+                self._last_onset = self.pos
+                self._pending = (self.pos, rms, array("f", frame))
+            self._avg += 0.3 * (rms - self._avg)
+            self.pos += hop
+            i += hop
+        self._carry = buf[i:]
+        self.block_secs.append(time.perf_counter() - t0)
+        if len(self.block_secs) > 4096:
+            del self.block_secs[:2048]
+        return notes
+
+    def latency(self, block=None):
+        """Analysis time stats in ms against the real-time budget of one block,
+        plus the fixed decision delay from an onset to its note."""
+        block = block or AUDIO.block
+        times = sorted(self.block_secs)
+        if not times:
+            return {}
+        return {
+            "blocks": len(times),
+            "mean_ms": 1000 * sum(times) / len(times),
+            "p95_ms": 1000 * times[int(0.95 * (len(times) - 1))],
+            "max_ms": 1000 * times[-1],
+            "budget_ms": 1000 * block / self.sr,
+            "decision_ms": 1000 * (self.window + self.HOP) / self.sr,
+        }
+
+def nearest_lane(freq_hz, lane_hz, max_cents=150):
+    """Lane whose pitch is closest to freq_hz, or None if none is within max_cents."""
+    cents = [abs(1200 * math.log2(freq_hz / lane_to_hz(lane, lane_hz))) for lane in range(LANES)]
+    lane = min(range(LANES), key=cents.__getitem__)
+    return lane if cents[lane] <= max_cents else None
+
+def quantize_note(onset_secs, freq_hz, tempo_map, lane_hz, snap=PPQ, start_beat=0.0):
+    """(tick, lane) on the snap grid for a note heard onset_secs after start_beat,
+    or None if it falls off the sheet or between lanes."""
+    beat = tempo_map.time_to_beat(tempo_map.beat_to_time(start_beat) + onset_secs)
+    tick = int(round(beat * PPQ / snap)) * snap
+    lane = nearest_lane(freq_hz, lane_hz)
+    if lane is None or not 0 <= tick < TOTAL_TICKS:
+        return None
+    return tick, lane
+
+def transcribe_wav(src, tempo_map, lane_hz, snap=PPQ, start_beat=0.0, transcriber=None):
+    """Run a WAV file through the live path (engine rate and block size).
+    Returns ([(tick, lane, freq_hz, onset_secs)], transcriber)."""
+    tr = transcriber or Transcriber()
+    found = []
+    with WavReader(src) as r:
+        rs = StreamResampler(r.sr, tr.sr)
+        pending = array("f")
+        for chunk in r.blocks():
+            pending.extend(rs.process(chunk))
+            i = 0
+            while i + AUDIO.block <= len(pending):
+                for onset, freq, _level in tr.feed(pending[i:i+AUDIO.block]):
+                    slot = quantize_note(onset, freq, tempo_map, lane_hz, snap, start_beat)
+                    if slot:
+                        found.append(slot + (freq, onset))
+                i += AUDIO.block
+            pending = pending[i:]
+    return found, tr
+
+# -------------- Projects --------------
+
+PROJECT_FORMAT = "sheet42"
+PROJECT_VERSION = 1
+PROJECT_SUFFIX = ".s42"  # JSON inside
+
+def project_settings(tempo_map, lane_notes, waveform, fx, dither=False, instrument=None, feel=None, tuning=None):
+    """The non-note part of a project: small, whatever the size of the score."""
+    return {
+        "tempo": [[beat, bpm, ramp] for beat, bpm, ramp in tempo_map.points()],
+        "lane_notes": list(lane_notes),
+        "tuning": dict(TUNING_DEFAULT, **(tuning or {})),
+        "waveform": waveform,
+        "instrument": instrument.path if instrument is not None else None,
+        "effects": fx.settings(),
+        "dither": bool(dither),
+        "feel": dict(FEEL_DEFAULT, **(feel or {})),
+    }
+
+def project_dict(events, tempo_map, lane_notes, waveform, fx, dither=False, instrument=None, feel=None, tuning=None):
+    """Everything needed to re-open or render a sheet, as plain JSON data.
+    A mic recording lives only in memory and is not saved."""
+    proj = {"format": PROJECT_FORMAT, "version": PROJECT_VERSION}
+    proj.update(project_settings(tempo_map, lane_notes, waveform, fx, dither, instrument, feel, tuning))
+    proj["events"] = [[tick, lane, ev["kind"], ev["dur"], ev["vel"]] for tick, lane, ev in events.items()]
+    return proj
+
+def save_project(path, proj):
+    """Write atomically, so a crash mid-save keeps the previous file."""
+    d = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=d, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(proj, f, indent=1)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+def load_project(path):
+    """Read and check a project file; raises ValueError if it is not one.
+    A relative instrument path is resolved against the project's folder."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            proj = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{path}: not a project file ({e})") from None
+    return check_project(proj, path)
+
+def check_project(proj, path):
+    """Validate and normalise a project dict in place; `path` names it in errors
+    and anchors a relative instrument path."""
+    if not isinstance(proj, dict) or proj.get("format") != PROJECT_FORMAT:
+        raise ValueError(f"{path}: not a {PROJECT_FORMAT} project")
+    if proj.get("version", 0) > PROJECT_VERSION:
+        raise ValueError(f"{path}: written by a newer version (format {proj['version']})")
+    try:
+        proj["events"] = [(int(t), int(l), str(k), int(d), int(v)) for t, l, k, d, v in proj.get("events", [])]
+        proj["tempo"] = [(float(b), float(bpm), bool(r)) for b, bpm, r in proj.get("tempo") or [(0, 100, False)]]
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{path}: malformed project ({e})") from None
+    for lane, tick in ((e[1], e[0]) for e in proj["events"]):
+        if not (0 <= lane < LANES and 0 <= tick < TOTAL_TICKS):
+            raise ValueError(f"{path}: event out of range at tick {tick}, lane {lane}")
+    notes = proj.get("lane_notes") or DEFAULT_LANE_NOTES
+    proj["lane_notes"] = (list(notes) + DEFAULT_LANE_NOTES[len(notes):])[:LANES]
+    proj["tuning"] = dict(TUNING_DEFAULT, **(proj.get("tuning") or {}))
+    proj.setdefault("waveform", "sine")
+    proj.setdefault("effects", {})
+    proj["feel"] = dict(FEEL_DEFAULT, **(proj.get("feel") or {}))
+    inst = proj.get("instrument")
+    if inst and not os.path.isabs(inst):
+        proj["instrument"] = os.path.join(os.path.dirname(os.path.abspath(path)), inst)
+    return proj
+
+def load_instrument(path):
+    """A JSON bank, or any WAV file as a one-sample instrument."""
+    if path.lower().endswith(".json"):
+        return Instrument.load(path)
+    return Instrument.single(path)
+
+def project_model(proj, sr=None):
+    """(events, tempo_map, instrument, fx) built from a loaded project."""
+    events = EventStore()
+    for tick, lane, kind, dur, vel in proj["events"]:
+        events.put(tick, lane, kind, dur, vel)
+    tempo_map = TempoMap(proj["tempo"][0][1])
+    for beat, bpm, ramp in proj["tempo"]:
+        tempo_map.set_point(beat, bpm, ramp)
+    instrument = load_instrument(proj["instrument"]) if proj.get("instrument") else None
+    fx = EffectsRack(sr)
+    fx.configure(proj["effects"])
+    return events, tempo_map, instrument, fx
+
+def render_project(proj, sr=None, tail_secs=2.0, stats=None):
+    """Offline bounce of a whole project to mono float32: every bar that has
+    notes is mixed exactly as loop playback mixes it, then the buses run through
+    the project's effects in AUDIO.block blocks, with `tail_secs` of room for
+    delay and reverb tails. Bars are rendered once per bar_signature and repeats
+    mixed in from the same buffer, tails overlapping the next bar as they would.
+    `stats`, if given, receives the bar and unique-bar counts."""
+    sr = sr or AUDIO.sr
+    lane_hz = Tuning.from_spec(proj["tuning"]).table(proj["lane_notes"])
+    events, tempo_map, instrument, fx = project_model(proj, sr)
+    source = instrument.digest if instrument is not None else proj["waveform"]
+    try:
+        bars = sorted({tick // TICKS_PER_BAR for tick, _lane, _ev in events.items()})
+        starts = tempo_map.beat_starts(0, (bars[-1] + 1) * BEATS_PER_BAR if bars else 0, sr)
+        buses = {}
+        memo = {}
+        for bar in bars:
+            sig = bar_signature(events, tempo_map, bar, lane_hz, source, proj["feel"], sr)
+            if sig is None:
+                continue
+            parts = memo.get(sig)
+            if parts is None:
+                parts = bar_buses(events, tempo_map, bar, lane_hz, proj["waveform"],
+                                  instrument=instrument, sr=sr, feel=proj["feel"])
+                if not fx.active():
+                    # No inserts to feed, so each distinct bar is summed to one buffer once
+                    dry = array("f")
+                    for samples in parts.values():
+                        add_at(dry, 0, samples)
+                    parts = {"dry": dry}
+                memo[sig] = parts
+            for kind, samples in parts.items():
+                add_at(buses.setdefault(kind, array("f")), starts[bar * BEATS_PER_BAR], samples)
+        if stats is not None:
+            stats.update(bars=len(bars), unique_bars=len(memo))
+    finally:
+        if instrument is not None:
+            instrument.close()
+    frames = max([starts[-1]] + [len(b) for b in buses.values()])
+    if not fx.active():
+        out = buses.get("dry", array("f"))
+        out.extend(array("f", [0.0]) * (frames - len(out)))
+        return out
+    frames += int(tail_secs * sr)
+    def read(pos, n):
+        blocks = {}
+        for kind, bus in buses.items():
+            block = bus[pos:pos+n]
+            if len(block) < n:
+                block.extend(array("f", [0.0]) * (n - len(block)))
+            blocks[kind] = block
+        return blocks
+    return run_blocks(fx, read, frames)
+
+# -------------- Journal --------------
+
+JOURNAL_SYNC_SECS = 2.0  # fsync the log at most this often
+JOURNAL_COMPACT = 500    # records before the log is folded into a snapshot
+JOURNAL_KEEP = 200       # changes a snapshot keeps for undo after a restart
+JOURNAL_SLOTS = 16       # instances that can keep a journal at once
+
+def journal_dir():
+    return os.path.join(os.path.dirname(default_cache_dir()), "journal")
+
+def claim_journal_dir(base=None):
+    """The first of base, base.2, base.3, ... that no running instance holds,
+    with its lock file held open by this process until it exits. So instances
+    on one host each keep their own log, and a later one recovers the sheet of
+    one that has gone. Raises OSError if every slot is taken."""
+    base = base or journal_dir()
+    for i in range(1, JOURNAL_SLOTS + 1):
+        d = base if i == 1 else f"{base}.{i}"
+        os.makedirs(d, exist_ok=True)
+        f = open(os.path.join(d, "lock"), "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            continue
+        return d, f
+    raise OSError(f"all {JOURNAL_SLOTS} journal slots in {base} are in use")
+
+def apply_change(events, settings, ops, undo=False):
+    """Apply one journalled change to an EventStore and a settings dict, or revert
+    it. Ops are ["ev", tick, lane, old, new] with [kind, dur, vel] or None for
+    an empty slot, and ["set", key, old, new]."""
+    for op in (reversed(ops) if undo else ops):
+        val = op[-2] if undo else op[-1]
+        if op[0] == "ev":
+            if val is None:
+                events.remove(op[1], op[2])
+            else:
+                events.put(op[1], op[2], *val)
+        else:
+            settings[op[1]] = val
+
+class Journal:
+    """Append-only edit log over a snapshot: autosave, crash recovery and undo/redo.
+
+    Every change is one JSON line holding the old and new value of each slot or
+    setting it touched, so recording costs the size of the edit, not of the
+    score. Undo and redo append a one-word line that moves a cursor through the
+    change history. Lines are flushed to the OS at once and fsynced in batches
+    (every JOURNAL_SYNC_SECS, or on sync()). compact() folds everything into a
+    new snapshot, with up to JOURNAL_KEEP changes of history, and starts a new
+    log; each log is numbered after the snapshot it extends, so a crash between
+    the two steps cannot replay a change twice. The directory is claimed with
+    claim_journal_dir, so no other instance writes to it."""
+    def __init__(self, directory=None):
+        self.error = None  # first OSError; the log stops but undo keeps working
+        try:
+            self.dir, self._lock = claim_journal_dir(directory)
+        except OSError as e:
+            self.dir, self._lock, self.error = None, None, e
+        self.history = []  # changes, oldest first; each is a list of ops
+        self.cursor = 0    # history[:cursor] is applied
+        self.gen = 0       # snapshot generation, names the log that extends it
+        self.records = 0   # lines in the current log
+        self._f = None
+        self._unsynced = False
+        self._synced_at = time.monotonic()
+
+    def _log_path(self, gen):
+        return os.path.join(self.dir, f"journal-{gen}.log")
+
+    def _snap_path(self):
+        return os.path.join(self.dir, "snapshot.json")
+
+    def can_undo(self):
+        return self.cursor > 0
+
+    def can_redo(self):
+        return self.cursor < len(self.history)
+
+    def record(self, ops):
+        """A new change; it drops whatever could have been redone."""
+        if not ops:
+            return
+        del self.history[self.cursor:]
+        self.history.append(ops)
+        self.cursor += 1
+        self._append(["do", ops])
+
+    def undo(self):
+        """The change to revert (apply with undo=True), or None."""
+        if not self.can_undo():
+            return None
+        self.cursor -= 1
+        self._append(["undo"])
+        return self.history[self.cursor]
+
+    def redo(self):
+        """The change to re-apply, or None."""
+        if not self.can_redo():
+            return None
+        self.cursor += 1
+        self._append(["redo"])
+        return self.history[self.cursor - 1]
+
+    def _append(self, rec):
+        if self.error:
+            return
+        try:
+            if self._f is None:
+                os.makedirs(self.dir, exist_ok=True)
+                self._f = open(self._log_path(self.gen), "a", encoding="utf-8")
+            self._f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+            self._f.flush()  # survives the app crashing; fsync covers the OS
+        except OSError as e:
+            self.error = e
+            return
+        self.records += 1
+        self._unsynced = True
+        if time.monotonic() - self._synced_at >= JOURNAL_SYNC_SECS:
+            self.sync()
+
+    def sync(self):
+        if self._unsynced and self._f is not None and not self.error:
+            try:
+                os.fsync(self._f.fileno())
+            except OSError as e:
+                self.error = e
+        self._unsynced = False
+        self._synced_at = time.monotonic()
+
+    def needs_compact(self):
+        return self.records >= JOURNAL_COMPACT
+
+    def compact(self, state, reset=False):
+        """Write `state` (a project dict) and the history as the next snapshot, then
+        start an empty log. `reset` forgets the history, e.g. on opening a file."""
+        if reset:
+            self.history, self.cursor = [], 0
+        self.close()
+        if self.dir is None:
+            return
+        # Bounded, so a snapshot costs the score plus JOURNAL_KEEP changes however
+        # long the session; the newest undo steps win over redo steps
+        start = max(0, self.cursor - JOURNAL_KEEP)
+        snap = {"gen": self.gen + 1, "state": state, "history": self.history[start:start + JOURNAL_KEEP],
+                "cursor": self.cursor - start}
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(snap, f, separators=(",", ":"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self._snap_path())
+            except BaseException:
+                os.remove(tmp)
+                raise
+        except OSError as e:
+            self.error = e
+            return
+        self.error = None
+        old, self.gen, self.records = self.gen, self.gen + 1, 0
+        try:
+            os.remove(self._log_path(old))
+        except OSError:
+            pass
+
+    def recover(self):
+        """The project dict left by the last session (snapshot plus the replayed
+        log), or None if there is none. A torn last line from a crash ends the
+        replay; the history and cursor are restored for undo. Compact soon after,
+        so new records do not land behind a torn line."""
+        if self.dir is None:
+            return None
+        try:
+            with open(self._snap_path(), encoding="utf-8") as f:
+                snap = json.load(f)
+            state, history, cursor = snap["state"], list(snap["history"]), int(snap["cursor"])
+            self.gen = int(snap["gen"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        events = EventStore()
+        for tick, lane, kind, dur, vel in state.get("events", []):
+            events.put(tick, lane, kind, dur, vel)
+        try:
+            with open(self._log_path(self.gen), encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            lines = []
+        for line in lines:
+            try:
+                rec = json.loads(line)
+                if rec[0] == "do":
+                    apply_change(events, state, rec[1])
+                    del history[cursor:]
+                    history.append(rec[1])
+                    cursor += 1
+                elif rec[0] == "undo" and cursor > 0:
+                    apply_change(events, state, history[cursor - 1], undo=True)
+                    cursor -= 1
+                elif rec[0] == "redo" and cursor < len(history):
+                    apply_change(events, state, history[cursor])
+                    cursor += 1
+            except (ValueError, IndexError, TypeError):
+                break  # torn by a crash mid-write; the caller compacts right after
+        state["events"] = [[tick, lane, ev["kind"], ev["dur"], ev["vel"]] for tick, lane, ev in events.items()]
+        self.history, self.cursor, self.records = history, cursor, len(lines)
+        for name in os.listdir(self.dir):
+            if name.startswith("journal-") and name != f"journal-{self.gen}.log":
+                try:
+                    os.remove(os.path.join(self.dir, name))
+                except OSError:
+                    pass
+        return state
+
+    def close(self):
+        self.sync()
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+# -------------- Glyphs --------------
+
+GLYPH_SIZE = 9  # note radius in pixels; combo and rest proportions follow from it
+
+def glyph_rows(kind, size, tail=0):
+    """Rasterize a note symbol into runs: {row: [(x0, x1, ink), ...]}, x1
+    exclusive, ink "fg" or "bg" (the rest's notch). The symbol is centred in
+    a (2*(size+tail)+1)-pixel-wide box so the image's centre is the note
+    position; `tail` > 0 adds the 3-pixel length bar of a non-default
+    duration, drawn underneath the symbol out to the right."""
+    r, half = round(size * 0.6), round(size * 0.4)  # combo heads; rest height
+    w, h = round(size * 1.6), round(size * 0.6)
+    c = size + tail
+
+    def ink(dx, dy):
+        if kind == "full":
+            return "fg" if dx*dx + dy*dy < size*size else None
+        if kind == "half":
+            d = dx*dx + dy*dy
+            return "fg" if (size - 2)**2 <= d < size*size else None
+        if kind == "combo":
+            for cx in (-r, r):
+                if ((dx - cx) / half)**2 + (dy / r)**2 < 1.0:
+                    return "fg"
+            return None
+        if kind == "rest":
+            if abs(dx) > w / 2 or abs(dy) > h / 2:
+                return None
+            # the notch: the rectangle's diagonal, 2 pixels wide
+            return "bg" if abs(dy * w - dx * h) <= math.hypot(w, h) else "fg"
+        return None
+
+    rows = {}
+    for py in range(2 * size + 1):
+        dy = py - size
+        runs = []
+        for px in range(2 * c + 1):
+            dx = px - c
+            k = ink(dx, dy)
+            if k is None and tail and abs(dy) <= 1 and 0 <= dx <= tail:
+                k = "fg"
+            if runs and runs[-1][2] == k and runs[-1][1] == px:
+                runs[-1] = (runs[-1][0], px + 1, k)
+            elif k is not None:
+                runs.append((px, px + 1, k))
+        if runs:
+            rows[py] = runs
+    return rows
+
+class GlyphCache:
+    """One PhotoImage per (kind, color, size, tail), drawn on first use, so a
+    placed note is a single canvas image item however many shapes make it."""
+    def __init__(self, master):
+        self.master = master
+        self.images = {}
+
+    def get(self, kind, color, size=GLYPH_SIZE, tail=0):
+        key = (kind, color, size, tail)
+        img = self.images.get(key)
+        if img is None:
+            c = size + tail
+            img = tk.PhotoImage(master=self.master, width=2 * c + 1, height=2 * size + 1)
+            for y, runs in glyph_rows(kind, size, tail).items():
+                for x0, x1, k in runs:
+                    img.put(color if k == "fg" else BG, to=(x0, y, x1, y + 1))
+            self.images[key] = img
+        return img
+
+# -------------- Playhead --------------
+
+PLAYHEAD_FPS = (15, 30, 60, 120)
+
+class PlayheadAnimator:
+    """Glides the playhead between beats at display rate.
+
+    The playhead is a persistent canvas item; every frame asks `clock()` for
+    the transport position in beats (None once stopped) and hands it to
+    `place(beat)`, which only moves items with coords(). Frames are capped at
+    `fps`, and `place` can skip the canvas call when nothing moved a pixel."""
+    def __init__(self, widget, clock, place, fps=60):
+        self.widget = widget
+        self.clock = clock
+        self.place = place
+        self.fps = fps
+        self.frames = 0
+        self.busy_secs = 0.0  # time spent inside frames, for cost readouts
+        self._after = None
+
+    @property
+    def running(self):
+        return self._after is not None
+
+    def start(self):
+        if self._after is None:
+            self._frame()
+
+    def stop(self):
+        if self._after is not None:
+            self.widget.after_cancel(self._after)
+            self._after = None
+
+    def _frame(self):
+        t0 = time.perf_counter()
+        beat = self.clock()
+        if beat is None:
+            self._after = None
+            return
+        self.place(beat)
+        self.frames += 1
+        self.busy_secs += time.perf_counter() - t0
+        self._after = self.widget.after(max(1, int(1000 / max(1, self.fps))), self._frame)
+
+# -------------- App --------------
+
+class Sheet42(tk.Tk if tk else object):
+    def __init__(self):
+        super().__init__()
+        self.title(APP_TITLE)
+        self.configure(bg=BG)
+        self.geometry("1180x520")
+        self.minsize(980, 480)
+        load_audio_prefs()  # sample rate / block size / quality, before any audio object is built
+
+        # State
+        self.current_tool = tk.StringVar(value="full")  # full/half/combo/rest/erase
+        self.user_name = tk.StringVar(value="You")
+        self.assistant_name = "GPT-5 Thinking"
+        self.left_clef_text = tk.StringVar(value="𝄢")
+        self.right_clef_text = tk.StringVar(value="𝄞")
+        self.left_clef_label = tk.StringVar(value="Bass")
+        self.right_clef_label = tk.StringVar(value="Treble")
+        self.active_clef_side = tk.StringVar(value="right")
+        self.BPM = tk.IntVar(value=100)
+        self.tempo_map = TempoMap(self.BPM.get())  # BPM is the tempo at beat 0
+
+        # Timeline
+        self.is_playing = False
+        self.current_pos = 0  # beat index [0, total_beats)
+        self.after_id = None
+        self._play_t0 = 0.0  # perf_counter() at which current_pos started
+        self.tempo_marks = []
+
+        # A/B loop region (beats, B exclusive), played from a pre-rendered buffer
+        self.loop_on = tk.BooleanVar(value=False)
+        self.loop_a = 0
+        self.loop_b = 4 * BEATS_PER_BAR
+        self.loop_renderer = LoopRenderer()
+        self.loop_player = LoopPlayer()
+        self.loop_follow_id = None
+        self.loop_refresh_id = None
+        self._loop_last_frame = 0
+        self.loop_item = None
+
+        # Metronome styling: one persistent line, moved by the playhead animator
+        self.metro_line = None
+        self.playhead_x = None
+        self.playhead_fps = tk.IntVar(value=60)
+        self._beat_anchor = (0.0, 0)  # (perf_counter, beat) the transport clock runs from
+        self._view = (0.0, 1.0)  # canvas xview, cached from xscrollcommand
+        self.bar_w = BAR_W  # current zoom, one of ZOOM_BAR_W
+        self.density_items = {}  # bar -> block item, drawn instead of notes when zoomed out
+
+        # Symbols and audio
+        self.events = EventStore()  # the score: tick -> lane -> {"kind", "dur"}
+        self.symbols = {}  # (tick, lane) -> {"id": image item, "kind", "dur", "tail": length bar px}
+        self.glyphs = GlyphCache(self)  # note pictures, one per kind/color/length bar
+        self.snap = tk.StringVar(value="1/4")
+        self.note_len = tk.StringVar(value="auto")
+        self.velocity = tk.IntVar(value=DEFAULT_VEL)
+        self.swing = tk.IntVar(value=FEEL_DEFAULT["swing"])
+        self.humanize_ms = tk.IntVar(value=FEEL_DEFAULT["humanize_ms"])
+        self.flam_ms = tk.IntVar(value=FEEL_DEFAULT["flam_ms"])
+        self.live_stream = LiveStream() if can_stream() else None  # sample-accurate non-loop playback
+        self._beat_cache = {}  # signature -> buses for live playback, shared by equal beats
+        self._sched_next = 0   # next beat to hand to live_stream
+        self._sched_secs = 0.0  # where it starts, in stream seconds
+        self.engine_on = tk.BooleanVar(value=False)
+        self.engine = None  # AudioEngine while "Engine process" is on; players swap to it
+        self.sync_mode = tk.StringVar(value="Off")  # transport sync: Off, Lead or Follow
+        self.sync = None  # TransportSync while sync is on
+        self.sync_after = None
+        self._sync_start_id = None  # a follower's pending aligned start
+        self._sync_err = None  # follower's last phase error, seconds
+        self.grid_items = []
+        self._stroke = None  # drag-to-paint state, see _begin_stroke
+        self._drag_points = []
+        self._drag_flush_id = None
+        self.waveform = tk.StringVar(value="sine")
+        self.dither = tk.BooleanVar(value=False)  # TPDF dither at the final PCM16 step
+        self.fx = EffectsRack()  # per-kind inserts + master, applied to loop playback
+        self.fx_window = None
+        self.fx_vars = {}
+        self.fx_cpu_id = None
+        self.mem_window = None
+        self.audio_window = None
+        self.audio_vars = {}
+        self.audio_job = None  # profile_cpu runs on a worker thread, see _measure_audio
+        self.wave_window = None
+        self.wave_src = tk.StringVar(value="recording")  # recording / instrument / synth
+        self.wave_pyramid = None  # PeakPyramid of the sample on view
+        self.wave_view = (0, 0)   # samples shown, [start, end)
+        self.wave_sel = (0, 0)    # trim handles, in samples
+        self.wave_drag = None     # handle index being dragged
+        self.wave_editable = False  # only the mic recording is edited in place
+        self.wave_job = None      # (generator, on_done) pumped in idle time
+        self.journal = Journal()  # autosave + undo/redo, see _apply_edits and _journal_settings
+        self._journal_seen = None  # settings as last journalled; None while not recording
+        self._journal_warned = False
+        self._bpm_shown = False  # True while the slider only mirrors the tempo map
+        self.full_secs = 1.0  # 1 beat at 60 BPM baseline; actual time depends on BPM at playback
+        self.half_secs = 0.5
+        self.combo_split = (0.5, 0.5)  # two events per beat
+        self.lane_notes = DEFAULT_LANE_NOTES.copy()  # editable mapping
+        self.tuning = dict(TUNING_DEFAULT)  # how lane notes become Hz, saved with the project
+        self.lane_hz = DEFAULT_LANE_HZ      # lane -> Hz, rebuilt only when either changes
+        self._tuning_name = DEFAULT_TUNING.name
+        self.tuning_system = tk.StringVar(value=self.tuning["system"])
+        self.tuning_ref = tk.StringVar(value=f"{self.tuning['ref_hz']:g}")
+        self.tuning_tonic = tk.StringVar(value=self.tuning["tonic"])
+
+        # Recording (optional)
+        self.record_secs = tk.DoubleVar(value=0.5)
+        self.record_sample = None  # SAMPLES handle of the last recording (PCM16)
+        self.instrument = None  # Instrument bank, replaces synth/recording when loaded
+        self.import_job = None  # WAV import running on a worker thread, see _import_wav
+        self.project_path = None
+        self.transcribe_on = tk.BooleanVar(value=False)
+        self.transcriber = None
+        self._tx_stream = None
+        self._tx_in = deque()   # (captured at, float32 bytes) from the input callback
+        self._tx_out = deque()  # (tick, lane) found by the analysis thread
+        self._tx_stop = None
+        self._tx_lag = []       # capture -> analysed, seconds, recent blocks
+        self._tx_poll_id = None
+
+        self.BPM.trace_add("write", lambda *_: self._on_bpm_change())
+        self.waveform.trace_add("write", lambda *_: self._loop_changed())
+
+        self._build_ui()
+        self._draw_sheet()
+        if SINK is not None:
+            self.status_var.set(f"Audio goes to the {SINK.name} sink ({AUDIO_ENV}).")
+        self._recover_session()
+        self.bind("<Control-z>", lambda e: self._undo())
+        self.bind("<Control-y>", lambda e: self._redo())
+        self.bind("<Control-Shift-Z>", lambda e: self._redo())
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    # ---------- UI ----------
+    def _build_ui(self):
+        self._build_header()
+        self._build_toolbar()
+        self._build_canvas()
+        self._build_timeline()
+        self._build_footer()
+
+    def _build_header(self):
+        header = tk.Frame(self, bg=BG)
+        header.pack(fill="x", padx=12, pady=(10, 0))
+
+        title_font = font.Font(family="Georgia", size=20, weight="bold")
+        title = tk.Label(header, text="Four-Line Sheet (Sampler)", bg=BG, fg=INK, font=title_font)
+        title.pack(side="left")
+
+        heart = tk.Label(header, text="♥", bg=BG, fg=ACCENT, font=font.Font(size=20))
+        heart.pack(side="left", padx=(8, 0))
+
+        who = tk.Label(header, text="made by ", bg=BG, fg=SUBTLE)
+        who.pack(side="left", padx=(8, 0))
+        me = tk.Label(header, text=self.assistant_name, bg=BG, fg=ACCENT, font=font.Font(weight="bold"))
+        me.pack(side="left", padx=(2, 0))
+
+        amp = tk.Label(header, text=" & ", bg=BG, fg=SUBTLE)
+        amp.pack(side="left")
+
+        you_lbl = tk.Label(header, textvariable=self.user_name, bg=BG, fg=ACCENT, font=font.Font(weight="bold"))
+        you_lbl.pack(side="left")
+
+        name_box = tk.Frame(header, bg=BG)
+        name_box.pack(side="right")
+        tk.Label(name_box, text="Your name:", bg=BG, fg=SUBTLE).pack(side="left", padx=(0,6))
+        tk.Entry(name_box, textvariable=self.user_name, width=16).pack(side="left")
+        ttk.Button(header, text="Save…", command=self._save_project).pack(side="right", padx=(0, 12))
+        ttk.Button(header, text="Open…", command=self._open_project).pack(side="right", padx=(0, 4))
+        ttk.Button(header, text="Redo", command=self._redo).pack(side="right", padx=(0, 12))
+        ttk.Button(header, text="Undo", command=self._undo).pack(side="right", padx=(0, 4))
+
+    def _build_toolbar(self):
+        bar = tk.Frame(self, bg=BG)
+        bar.pack(fill="x", padx=12, pady=8)
+
+        # Clefs
+        clef_box = tk.LabelFrame(bar, text="Clef", bg=BG, fg=INK, padx=8, pady=6)
+        clef_box.pack(side="left", padx=(0, 12))
+
+        tk.Radiobutton(clef_box, text="Left", variable=self.active_clef_side, value="left",
+                       bg=BG, fg=INK, selectcolor=BG, command=self._redraw).grid(row=0, column=0, sticky="w")
+        tk.Entry(clef_box, textvariable=self.left_clef_text, width=5, justify="center").grid(row=0, column=1, padx=(6, 6))
+        tk.Entry(clef_box, textvariable=self.left_clef_label, width=10).grid(row=0, column=2, padx=(6, 12))
+
+        tk.Radiobutton(clef_box, text="Right", variable=self.active_clef_side, value="right",
+                       bg=BG, fg=INK, selectcolor=BG, command=self._redraw).grid(row=1, column=0, sticky="w")
+        tk.Entry(clef_box, textvariable=self.right_clef_text, width=5, justify="center").grid(row=1, column=1, padx=(6, 6))
+        tk.Entry(clef_box, textvariable=self.right_clef_label, width=10).grid(row=1, column=2, padx=(6, 12))
+
+        ttk.Button(clef_box, text="Apply", command=self._redraw).grid(row=0, column=3, rowspan=2, padx=4)
+
+        # Tools
+        tools = tk.LabelFrame(bar, text="Tools", bg=BG, fg=INK, padx=8, pady=6)
+        tools.pack(side="left", padx=(0, 12))
+        for label, kind in [("Full ●", "full"), ("Half ○", "half"), ("Combo ◍", "combo"), ("Rest ⟂", "rest"), ("Erase ⨯", "erase")]:
+            ttk.Button(tools, text=label, command=lambda k=kind: self._set_tool(k)).pack(side="left", padx=4)
+        tk.Label(tools, text="Snap", bg=BG).pack(side="left", padx=(8, 2))
+        snap_box = ttk.Combobox(tools, width=5, textvariable=self.snap, values=tuple(SNAPS), state="readonly")
+        snap_box.pack(side="left")
+        snap_box.bind("<<ComboboxSelected>>", lambda e: self._draw_grid())
+        tk.Label(tools, text="Len", bg=BG).pack(side="left", padx=(8, 2))
+        ttk.Combobox(tools, width=5, textvariable=self.note_len, values=tuple(NOTE_LENGTHS), state="readonly").pack(side="left")
+        tk.Label(tools, text="Vel", bg=BG).pack(side="left", padx=(8, 2))
+        ttk.Spinbox(tools, from_=1, to=127, increment=1, textvariable=self.velocity, width=4).pack(side="left")
+
+        # Synth / sample controls
+        synth = tk.LabelFrame(bar, text="Sample Engine", bg=BG, fg=INK, padx=8, pady=6)
+        synth.pack(side="left", padx=(0, 12))
+
+        tk.Label(synth, text="Wave", bg=BG).pack(side="left", padx=(0,4))
+        ttk.Combobox(synth, width=7, textvariable=self.waveform, values=("sine","square","saw"), state="readonly").pack(side="left", padx=(0,10))
+
+        ttk.Button(synth, text="Test Tone", command=self._test_tone).pack(side="left", padx=4)
+        ttk.Button(synth, text="Load Instrument…", command=self._load_instrument).pack(side="left", padx=4)
+        ttk.Button(synth, text="Import WAV…", command=self._import_wav).pack(side="left", padx=4)
+        tk.Checkbutton(synth, text="Dither", variable=self.dither, bg=BG, selectcolor=BG,
+                       command=self._on_dither_toggle).pack(side="left", padx=4)
+        ttk.Button(synth, text="Effects…", command=self._show_effects).pack(side="left", padx=4)
+        ttk.Button(synth, text="Memory…", command=self._show_memory).pack(side="left", padx=4)
+        ttk.Button(synth, text="Audio…", command=self._show_audio).pack(side="left", padx=4)
+        ttk.Button(synth, text="Waveform…", command=self._show_waveform).pack(side="left", padx=4)
+
+        if HAVE_SD:
+            rec_btn = ttk.Button(synth, text="Record Mic", command=self._record_sample)
+            rec_btn.pack(side="left", padx=(10,4))
+            tk.Label(synth, text="sec", bg=BG).pack(side="left", padx=(6,2))
+            ttk.Spinbox(synth, from_=0.2, to=3.0, increment=0.1, textvariable=self.record_secs, width=5).pack(side="left")
+            ttk.Button(synth, text="Test Recording", command=self._play_recording).pack(side="left", padx=4)
+            tk.Checkbutton(synth, text="Transcribe", variable=self.transcribe_on, bg=BG, selectcolor=BG,
+                           command=self._toggle_transcribe).pack(side="left", padx=(10, 4))
+            tk.Checkbutton(synth, text="Engine process", variable=self.engine_on, bg=BG, selectcolor=BG,
+                           command=self._toggle_engine).pack(side="left", padx=4)
+        else:
+            tk.Label(synth, text="(Mic record unavailable)", bg=BG, fg=SUBTLE).pack(side="left", padx=6)
+
+        # Pitch mapping
+        pitch = tk.LabelFrame(bar, text="Lane→Pitch (low→high)", bg=BG, fg=INK, padx=8, pady=6)
+        pitch.pack(side="left", padx=(0, 12))
+        lanes_row = tk.Frame(pitch, bg=BG)
+        lanes_row.pack(fill="x")
+        self.pitch_entries = []
+        for i in range(LANES):
+            e = tk.Entry(lanes_row, width=5, justify="center")
+            e.insert(0, self.lane_notes[i])
+            e.pack(side="left", padx=2)
+            self.pitch_entries.append(e)
+        self._entry_bg = self.pitch_entries[0].cget("bg")
+        ttk.Button(lanes_row, text="Apply", command=self._apply_pitch_map).pack(side="left", padx=6)
+        tuning_row = tk.Frame(pitch, bg=BG)
+        tuning_row.pack(fill="x", pady=(4, 0))
+        ttk.Combobox(tuning_row, textvariable=self.tuning_system, values=TUNING_SYSTEMS, width=7,
+                     state="readonly").pack(side="left", padx=2)
+        tk.Label(tuning_row, text="A4 Hz", bg=BG).pack(side="left", padx=(6, 2))
+        tk.Entry(tuning_row, textvariable=self.tuning_ref, width=6, justify="center").pack(side="left")
+        tk.Label(tuning_row, text="Tonic", bg=BG).pack(side="left", padx=(6, 2))
+        ttk.Combobox(tuning_row, textvariable=self.tuning_tonic, values=NOTE_NAMES, width=3,
+                     state="readonly").pack(side="left")
+        ttk.Button(tuning_row, text="Scala…", command=self._load_scala).pack(side="left", padx=6)
+        self.pitch_msg = tk.Label(pitch, text="", bg=BG, fg="#b3261e", anchor="w", justify="left", wraplength=420)
+        self.pitch_msg.pack(fill="x")
+
+        # Help
+        ttk.Button(bar, text="Help", command=self._show_help).pack(side="right")
+
+    def _build_canvas(self):
+        wrap = tk.Frame(self, bg=BG)
+        wrap.pack(fill="both", expand=True, padx=12)
+
+        self.canvas = tk.Canvas(wrap, bg=BG, highlightthickness=0, height=CANVAS_H)
+        self.hscroll = ttk.Scrollbar(wrap, orient="horizontal", command=self.canvas.xview)
+
+        self.canvas.pack(fill="both", expand=True, side="top")
+        self.hscroll.pack(fill="x", side="bottom")
+        self._build_minimap(wrap)
+        self.canvas.configure(xscrollcommand=self._on_xscroll)
+
+        total_w = MARGIN_X*2 + self.bar_w*BARS
+        self.canvas.config(scrollregion=(0, 0, total_w, CANVAS_H))
+
+        self.canvas.bind("<Button-1>", self.on_click_place)
+        self.canvas.bind("<Button-3>", self.on_right_click_erase)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<B3-Motion>", self._on_drag)
+        self.canvas.bind("<ButtonRelease-1>", self._end_stroke)
+        self.canvas.bind("<ButtonRelease-3>", self._end_stroke)
+        self.canvas.bind("<Shift-Button-1>", lambda e: self._set_loop_edge(e, "a"))
+        self.canvas.bind("<Shift-Button-3>", lambda e: self._set_loop_edge(e, "b"))
+        self.canvas.bind("<Configure>", lambda e: self._redraw())
+        self.canvas.bind("<Control-MouseWheel>", lambda e: self._zoom(1 if e.delta > 0 else -1, e.x))
+        self.canvas.bind("<Control-Button-4>", lambda e: self._zoom(1, e.x))
+        self.canvas.bind("<Control-Button-5>", lambda e: self._zoom(-1, e.x))
+        self.bind("<Control-equal>", lambda e: self._zoom(1))
+        self.bind("<Control-plus>", lambda e: self._zoom(1))
+        self.bind("<Control-minus>", lambda e: self._zoom(-1))
+
+    def _build_minimap(self, parent):
+        """Whole-score overview: note density per bar in a cached image, with the
+        viewport and playhead as two items on top. Click or drag to jump."""
+        w = BARS * MINIMAP_BAR_W
+        self.minimap = tk.Canvas(parent, bg=BG, highlightthickness=0, width=w, height=MINIMAP_H)
+        self.minimap.pack(side="bottom", anchor="w", pady=(4, 2))
+        self.minimap_img = tk.PhotoImage(width=w, height=MINIMAP_H)
+        self.minimap.create_image(0, 0, anchor="nw", image=self.minimap_img)
+        self.minimap_view = self.minimap.create_rectangle(0, 0, 0, MINIMAP_H - 1, outline=ACCENT, width=1)
+        self.minimap_head = self.minimap.create_line(0, 0, 0, MINIMAP_H, fill=ACCENT, width=1)
+        self.minimap_dirty = set()
+        self.minimap_patch_id = None
+        self.minimap.bind("<Button-1>", self._minimap_jump)
+        self.minimap.bind("<B1-Motion>", self._minimap_jump)
+        self._patch_minimap(range(BARS))
+
+    def _build_timeline(self):
+        tl = tk.Frame(self, bg=BG)
+        tl.pack(fill="x", padx=12, pady=(6, 10))
+
+        ttk.Button(tl, text="⟲ Stop", command=self.stop).pack(side="left", padx=4)
+        self.play_btn = ttk.Button(tl, text="▶ Play", command=self.play_pause)
+        self.play_btn.pack(side="left", padx=4)
+
+        tk.Label(tl, text="BPM", bg=BG).pack(side="left", padx=(12,4))
+        self.bpm_label = tk.Label(tl, text=str(self.BPM.get()), bg=BG, fg=SUBTLE)
+        self.bpm_label.pack(side="left", padx=(6, 6))
+        bpm_scale = ttk.Scale(tl, from_=40, to=208, orient="horizontal", variable=self.BPM, length=240, command=lambda v: self._update_bpm_label())
+        bpm_scale.pack(side="left")
+        self.BPM.trace_add("write", lambda *_: self._update_bpm_label())
+
+        tk.Label(tl, text=" Scrub:", bg=BG).pack(side="left", padx=(12,4))
+        self.scrub = ttk.Scale(tl, from_=0, to=BARS*BEATS_PER_BAR-1, orient="horizontal", length=420, command=self._on_scrub_change)
+        self.scrub.pack(side="left")
+        ttk.Button(tl, text="Go", command=self._apply_scrub).pack(side="left", padx=6)
+
+        tk.Checkbutton(tl, text="Loop", variable=self.loop_on, bg=BG, selectcolor=BG,
+                       command=self._on_loop_toggle).pack(side="left", padx=(12, 2))
+        ttk.Button(tl, text="A", width=2, command=lambda: self._set_loop(self.current_pos, None)).pack(side="left")
+        ttk.Button(tl, text="B", width=2, command=lambda: self._set_loop(None, self.current_pos + 1)).pack(side="left")
+        self.loop_label = tk.Label(tl, text="", bg=BG, fg=SUBTLE)
+        self.loop_label.pack(side="left", padx=(6, 0))
+        self._update_loop_label()
+
+        self.pos_label = tk.Label(tl, text="Beat 1 / 168", bg=BG, fg=SUBTLE)
+        self.pos_label.pack(side="right")
+        fps_box = ttk.Combobox(tl, width=4, textvariable=self.playhead_fps, values=PLAYHEAD_FPS, state="readonly")
+        fps_box.pack(side="right", padx=(2, 12))
+        fps_box.bind("<<ComboboxSelected>>", lambda e: self._set_playhead_fps())
+        tk.Label(tl, text="FPS", bg=BG).pack(side="right")
+        ttk.Button(tl, text="+", width=2, command=lambda: self._zoom(1)).pack(side="right", padx=(0, 12))
+        self.zoom_label = tk.Label(tl, text="Zoom 100%", bg=BG, fg=SUBTLE)
+        self.zoom_label.pack(side="right", padx=4)
+        ttk.Button(tl, text="−", width=2, command=lambda: self._zoom(-1)).pack(side="right")
+        self.animator = PlayheadAnimator(self, self._transport_beat, self._place_playhead, self.playhead_fps.get())
+
+        # Tempo map: changes/ramps at bar starts
+        tempo = tk.Frame(self, bg=BG)
+        tempo.pack(fill="x", padx=12, pady=(0, 6))
+        tk.Label(tempo, text="Tempo at bar", bg=BG).pack(side="left")
+        self.tempo_bar = tk.IntVar(value=1)
+        ttk.Spinbox(tempo, from_=1, to=BARS, textvariable=self.tempo_bar, width=4).pack(side="left", padx=4)
+        tk.Label(tempo, text="BPM", bg=BG).pack(side="left", padx=(6, 2))
+        self.tempo_bpm = tk.IntVar(value=self.BPM.get())
+        ttk.Spinbox(tempo, from_=TEMPO_MIN, to=TEMPO_MAX, textvariable=self.tempo_bpm, width=5).pack(side="left", padx=4)
+        self.tempo_ramp = tk.BooleanVar(value=False)
+        tk.Checkbutton(tempo, text="Ramp to next", variable=self.tempo_ramp, bg=BG, selectcolor=BG).pack(side="left", padx=4)
+        ttk.Button(tempo, text="Set", command=self._set_tempo_point).pack(side="left", padx=4)
+        ttk.Button(tempo, text="Remove", command=self._remove_tempo_point).pack(side="left", padx=4)
+        self.tempo_label = tk.Label(tempo, text="", bg=BG, fg=SUBTLE)
+        self.tempo_label.pack(side="left", padx=8)
+        for label, var, lo, hi in (("Flam ms", self.flam_ms, 0, 60), ("Human ms", self.humanize_ms, 0, 50),
+                                   ("Swing %", self.swing, 50, 75)):
+            ttk.Spinbox(tempo, from_=lo, to=hi, textvariable=var, width=4,
+                        command=self._loop_changed).pack(side="right", padx=(2, 8))
+            tk.Label(tempo, text=label, bg=BG).pack(side="right")
+        self._update_tempo_label()
+
+    def _build_footer(self):
+        footer = tk.Frame(self, bg=BG)
+        footer.pack(fill="x", padx=12, pady=(0, 10))
+        self.status_var = tk.StringVar(value="Left-click to place. Right-click to erase. Combo plays two quick hits.")
+        sync_box = ttk.Combobox(footer, width=6, textvariable=self.sync_mode, values=("Off", "Lead", "Follow"),
+                                state="readonly")
+        sync_box.pack(side="right")
+        sync_box.bind("<<ComboboxSelected>>", lambda e: self._set_sync_mode())
+        tk.Label(footer, text="Sync", bg=BG).pack(side="right", padx=(12, 2))
+        self.sync_label = tk.Label(footer, text="", bg=BG, fg=SUBTLE)
+        self.sync_label.pack(side="right")
+        status = tk.Label(footer, textvariable=self.status_var, bg=BG, fg=SUBTLE, anchor="w")
+        status.pack(fill="x")
+
+    # ---------- Drawing ----------
+    def _redraw(self):
+        self._draw_sheet()
+
+    def _draw_sheet(self):
+        self.canvas.delete("all")
+        top = MARGIN_Y
+        left = MARGIN_X
+        right = MARGIN_X + self.bar_w*BARS
+
+        # Everything tagged "zoom" is laid out along x in bars and is rescaled in
+        # place by _zoom; the clef and the playhead are not.
+        # Staff lines
+        for i in range(STAFF_LINES):
+            y = top + i*LINE_SPACING
+            self.canvas.create_line(left, y, right, y, fill=INK, width=1.6, tags="zoom")
+
+        # Lanes (gaps markers as subtle dotted guides)
+        # Lanes are interleaved: line0, gap0, line1, gap1, line2, gap2, line3, gap3
+        self.lane_ys = []
+        for i in range(STAFF_LINES):
+            self.lane_ys.append(top + i*LINE_SPACING)  # line
+            if i < STAFF_LINES-1:
+                self.lane_ys.append(top + i*LINE_SPACING + LINE_SPACING/2)  # gap
+        # Add extra gap after last line to make 8 lanes
+        self.lane_ys.append(top + (STAFF_LINES-1)*LINE_SPACING + LINE_SPACING/2)
+
+        # draw faint dotted guides for gaps (odd indices)
+        for idx, y in enumerate(self.lane_ys):
+            if idx % 2 == 1:  # gaps
+                self.canvas.create_line(left, y, right, y, fill=SUBTLE, dash=(2,3), tags="zoom")
+
+        # Bars + beat ticks + numbers. A number is tagged with the coarsest
+        # thinning step that still shows it (every 1, 2, 4 or 8 bars).
+        for b in range(BARS + 1):
+            x = MARGIN_X + b*self.bar_w
+            w = 1.2 if b % 4 else 2.2
+            color = INK if b % 4 == 0 else SUBTLE
+            self.canvas.create_line(x, top, x, top + STAFF_HEIGHT, fill=color, width=w, tags="zoom")
+            if b < BARS:
+                every = next(k for k in (8, 4, 2, 1) if b % k == 0)
+                self.canvas.create_text(x + self.bar_w/2, top + STAFF_HEIGHT + 14, text=str(b+1), fill=SUBTLE,
+                                        font=("Helvetica", 9), tags=("zoom", f"num{every}"))
+                for beat in range(BEATS_PER_BAR):
+                    bx = MARGIN_X + b*self.bar_w + (beat+0.5)*(self.bar_w/BEATS_PER_BAR)
+                    self.canvas.create_line(bx, top + STAFF_HEIGHT + 2, bx, top + STAFF_HEIGHT + 8, fill=SUBTLE,
+                                            tags=("zoom", "beattick"))
+        self.grid_items = []
+        self._draw_grid()
+
+        # Clef
+        self._draw_clef()
+
+        # Loop region shading
+        self.loop_item = None
+        self._draw_loop_region()
+
+        # Tempo markers
+        self.tempo_marks = []
+        self._draw_tempo_marks()
+
+        # Repaint the notes from the score: glyphs, or density blocks when zoomed out
+        self.symbols.clear()
+        self.density_items = {}
+        self._draw_notes()
+        self._apply_detail()
+
+        # Metronome line (recreated only here, after the canvas was cleared)
+        y0 = MARGIN_Y - 10
+        y1 = MARGIN_Y + STAFF_HEIGHT + 10
+        self.metro_line = self.canvas.create_line(0, y0, 0, y1, fill=ACCENT, width=2, dash=(3,3))
+        self.playhead_x = None
+        self._draw_metro_line()
+
+    def _blocks_lod(self):
+        return self.bar_w < LOD_BLOCKS_BELOW
+
+    def _draw_notes(self):
+        if self._blocks_lod():
+            self._draw_density(range(BARS))
+        else:
+            for tick, lane, ev in self.events.items():
+                self._draw_symbol_at(tick, lane, ev["kind"], ev["dur"])
+
+    def _draw_density(self, bars):
+        """One block per bar, as tall as the bar is busy (zoomed-out view of the notes)."""
+        full = LANES * BEATS_PER_BAR
+        bottom = MARGIN_Y + STAFF_HEIGHT
+        for bar in bars:
+            item = self.density_items.pop(bar, None)
+            if item is not None:
+                self.canvas.delete(item)
+            count = sum(1 for _ in self.events.range(bar*TICKS_PER_BAR, (bar+1)*TICKS_PER_BAR))
+            if not count:
+                continue
+            h = max(3, min(1.0, count / full) * STAFF_HEIGHT)
+            x0 = MARGIN_X + bar*self.bar_w + 1
+            self.density_items[bar] = self.canvas.create_rectangle(
+                x0, bottom - h, x0 + self.bar_w - 2, bottom, fill=ACCENT, outline="", stipple="gray50",
+                tags=("zoom", "density"))
+
+    def _apply_detail(self):
+        """Thin bar numbers, beat ticks and the snap grid to what the zoom can show."""
+        step = next((k for k in (1, 2, 4) if k * self.bar_w >= 28), 8)
+        for k in (1, 2, 4, 8):
+            self.canvas.itemconfigure(f"num{k}", state="normal" if k >= step else "hidden")
+        beat_px = self.bar_w / BEATS_PER_BAR
+        self.canvas.itemconfigure("beattick", state="normal" if beat_px >= 6 else "hidden")
+        grid_px = SNAPS.get(self.snap.get(), PPQ) * self.bar_w / TICKS_PER_BAR
+        self.canvas.itemconfigure("grid", state="normal" if grid_px >= 5 else "hidden")
+
+    def _zoom(self, step, x=None):
+        """Step through ZOOM_BAR_W, keeping the music under window x (default: the
+        view's centre) in place. Existing items are rescaled by one canvas call;
+        note images keep their size by themselves, only notes with a length
+        bar get the picture for the new width, and the note layer is
+        swapped between glyphs and density blocks when the zoom crosses
+        LOD_BLOCKS_BELOW."""
+        levels = ZOOM_BAR_W
+        i = min(range(len(levels)), key=lambda k: abs(levels[k] - self.bar_w))
+        j = max(0, min(len(levels) - 1, i + step))
+        old, new = self.bar_w, levels[j]
+        if new == old:
+            return
+        if x is None:
+            x = self.canvas.winfo_width() / 2
+        bars_at = (self.canvas.canvasx(x) - MARGIN_X) / old
+        was_blocks = self._blocks_lod()
+        if not was_blocks and new < LOD_BLOCKS_BELOW:
+            self.canvas.delete("symbol")
+            self.symbols.clear()
+        f = new / old
+        self.bar_w = new
+        self.canvas.scale("zoom", MARGIN_X, 0, f, 1)
+        if was_blocks and not self._blocks_lod():
+            self.canvas.delete("density")
+            self.density_items = {}
+            self._draw_notes()
+        elif not was_blocks and self._blocks_lod():
+            self._draw_notes()
+        elif not self._blocks_lod():
+            # Images keep their size under scale(); only length bars are redrawn
+            for (tick, _lane), meta in self.symbols.items():
+                if meta["tail"]:
+                    meta["tail"] = self._glyph_tail(tick, meta["kind"], meta["dur"])
+                    img = self.glyphs.get(meta["kind"], NOTE_COLORS[meta["kind"]], tail=meta["tail"])
+                    self.canvas.itemconfigure(meta["id"], image=img)
+        self._apply_detail()
+        total_w = MARGIN_X*2 + self.bar_w*BARS
+        self.canvas.config(scrollregion=(0, 0, total_w, CANVAS_H))
+        self.canvas.xview_moveto(max(0.0, (MARGIN_X + bars_at * new - x) / total_w))
+        self.playhead_x = None
+        self._draw_metro_line()
+        self.zoom_label.config(text=f"Zoom {new * 100 // BAR_W}%")
+
+    def _draw_grid(self):
+        """Faint sub-beat ticks for the current snap (beats already have theirs)."""
+        for item in self.grid_items:
+            self.canvas.delete(item)
+        self.grid_items = []
+        step = SNAPS.get(self.snap.get(), PPQ)
+        if step >= PPQ:
+            return
+        y = MARGIN_Y + STAFF_HEIGHT
+        for tick in range(0, TOTAL_TICKS, step):
+            if tick % PPQ:
+                x = self._tick_x(tick)
+                self.grid_items.append(self.canvas.create_line(x, y + 3, x, y + 6, fill=SUBTLE, tags=("zoom", "grid")))
+        self._apply_detail()
 
     def _draw_clef(self):
         top = MARGIN_Y
@@ -414,98 +3887,182 @@ class Sheet42(tk.Tk):
         self.status_var.set(f"Tool: {k}")
 
     def on_click_place(self, event):
-        b, bt = self._hit_bar_and_beat(event.x)
-        if b is None:
-            return
-        lane = self._nearest_lane(event.y)
         kind = self.current_tool.get()
-        if kind == "erase":
-            self._erase_at(b, bt, lane)
-        else:
-            self._place_at(b, bt, lane, kind)
+        self._begin_stroke("erase" if kind == "erase" else "paint", event)
 
     def on_right_click_erase(self, event):
-        b, bt = self._hit_bar_and_beat(event.x)
-        if b is None:
-            return
-        lane = self._nearest_lane(event.y)
-        self._erase_at(b, bt, lane)
-
-    def _hit_bar_and_beat(self, x_canvas):
-        x = self.canvas.canvasx(x_canvas)
-        area_left = MARGIN_X
-        area_right = MARGIN_X + BAR_W*BARS
-        if x < area_left or x > area_right:
-            return None, None
-        rel = x - MARGIN_X
-        bar = int(rel // BAR_W)
-        within = rel - bar*BAR_W
-        beat_w = BAR_W / BEATS_PER_BAR
-        beat = int(within // beat_w)
-        return bar, min(max(0, beat), BEATS_PER_BAR-1)
+        self._begin_stroke("erase", event)
+
+    # A click starts a stroke; motion events while the button is held only queue
+    # their points, and once per frame the queued path is turned into slot edits
+    # that are applied in a single batch. The whole stroke is journalled as one
+    # change when the button is released, so one undo takes it back.
+    def _begin_stroke(self, mode, event):
+        if self._stroke is not None:
+            self._end_stroke(event)  # the release went missing; keep its edits undoable
+        self._stroke = {"mode": mode, "kind": self.current_tool.get(), "last": None, "done": set(), "pending": [],
+                        "ops": []}
+        self._drag_points = []
+        self._stroke_to(event.x, event.y)
+        self._apply_stroke()
+
+    def _on_drag(self, event):
+        if self._stroke is None:
+            return
+        self._drag_points.append((event.x, event.y))
+        if self._drag_flush_id is None:
+            self._drag_flush_id = self.after(DRAG_FRAME_MS, self._flush_drag)
+
+    def _end_stroke(self, event):
+        if self._stroke is None:
+            return
+        if self._drag_flush_id is not None:
+            self.after_cancel(self._drag_flush_id)
+        self._flush_drag()
+        self.journal.record(self._stroke["ops"])
+        self._stroke = None
+
+    def _flush_drag(self):
+        self._drag_flush_id = None
+        points, self._drag_points = self._drag_points, []
+        if self._stroke is None or not points:
+            return
+        for x, y in points:
+            self._stroke_to(x, y)
+        self._apply_stroke()
+
+    def _stroke_to(self, x, y):
+        """Extend the stroke to a window point, visiting every snap cell along the
+        segment from the previous point so fast drags do not skip slots."""
+        st = self._stroke
+        x, y = x + self.canvas.canvasx(0), y + self.canvas.canvasy(0)
+        x0, y0 = st["last"] or (x, y)
+        st["last"] = (x, y)
+        step_px = max(1.0, SNAPS.get(self.snap.get(), PPQ) * (self.bar_w / TICKS_PER_BAR) / 2)
+        n = max(1, int(max(abs(x - x0), abs(y - y0)) / min(step_px, LINE_SPACING / 4)))
+        for i in range(1, n + 1):
+            slot = self._slot_at(x0 + (x - x0) * i / n, y0 + (y - y0) * i / n, st["mode"])
+            if slot is not None and slot not in st["done"]:
+                st["done"].add(slot)
+                st["pending"].append(slot)
+
+    def _apply_stroke(self):
+        st = self._stroke
+        slots, st["pending"] = st["pending"], []
+        if st["mode"] == "erase":
+            edits = [("erase", tick, lane) for tick, lane in slots]
+        else:
+            dur = NOTE_LENGTHS.get(self.note_len.get()) or KIND_TICKS.get(st["kind"], PPQ)
+            vel = self._velocity()
+            edits = [("place", tick, lane, st["kind"], dur, vel) for tick, lane in slots]
+        st["ops"] += self._apply_edits(edits, record=False)  # journalled at _end_stroke
+
+    def _slot_at(self, x, y, mode):
+        """(tick, lane) for a canvas point. Painting snaps to the grid; erasing picks
+        the nearest existing event on the lane. None if there is nothing there."""
+        if x < MARGIN_X or x > MARGIN_X + self.bar_w*BARS:
+            return None
+        t = (x - MARGIN_X) * (TICKS_PER_BAR / self.bar_w) - PPQ/2
+        lane = self._lane_at(y)
+        step = SNAPS.get(self.snap.get(), PPQ)
+        if mode == "erase":
+            tick = self._event_near(t, lane, max(step / 2, 6 * TICKS_PER_BAR / self.bar_w))
+            return None if tick is None else (tick, lane)
+        return max(0, min(TOTAL_TICKS - step, int(round(t / step)) * step)), lane
+
+    def _tick_x(self, tick):
+        # Beats are drawn at the centre of their cell, as the beat ticks are
+        return MARGIN_X + (tick + PPQ/2) * (self.bar_w / TICKS_PER_BAR)
+
+    def _hit_tick(self, x_canvas):
+        """Tick of the snap-grid point nearest to a window x, or None outside the staff."""
+        slot = self._slot_at(self.canvas.canvasx(x_canvas), MARGIN_Y, "paint")
+        return None if slot is None else slot[0]
+
+    def _lane_at(self, y):
+        # Lanes sit half a line apart from the top line down, so this is a rounding
+        lane = int(round((y - MARGIN_Y) / (LINE_SPACING / 2)))
+        return max(0, min(LANES - 1, lane))
 
     def _nearest_lane(self, y_canvas):
-        y = self.canvas.canvasy(y_canvas)
-        best = 0
-        best_d = 1e9
-        for i, ly in enumerate(self.lane_ys):
-            d = abs(y - ly)
-            if d < best_d:
-                best_d = d
-                best = i
+        return self._lane_at(self.canvas.canvasy(y_canvas))
+
+    def _event_near(self, t, lane, tol):
+        """Start tick of the event on `lane` closest to tick t within tol, so notes
+        entered on another grid can still be hit."""
+        best = None
+        for tick, ln, _ev in self.events.range(int(t - tol), int(t + tol) + 1):
+            if ln == lane and (best is None or abs(tick - t) < abs(best - t)):
+                best = tick
         return best
 
-    def _erase_at(self, b, bt, lane):
-        key = (b, bt, lane)
-        if key in self.symbols:
-            meta = self.symbols[key]
-            try:
-                if isinstance(meta["id"], str):  # tag group
-                    self.canvas.delete(meta["id"])
-                else:
-                    self.canvas.delete(meta["id"])
-            except Exception:
-                pass
-            del self.symbols[key]
+    def _erase_at(self, tick, lane):
+        self._apply_edits([("erase", tick, lane)])
 
-    def _place_at(self, b, bt, lane, kind):
-        self._erase_at(b, bt, lane)
-        self._draw_symbol_at(b, bt, lane, kind)
+    def _place_at(self, tick, lane, kind, dur=None):
+        if dur is None:
+            dur = NOTE_LENGTHS.get(self.note_len.get()) or KIND_TICKS.get(kind, PPQ)
+        self._apply_edits([("place", tick, lane, kind, dur, self._velocity())])
 
-    def _slot_center(self, b, bt, lane):
-        x = MARGIN_X + b*BAR_W + (bt + 0.5)*(BAR_W/BEATS_PER_BAR)
-        y = self.lane_ys[lane]
-        return x, y
+    def _velocity(self):
+        try:
+            return max(1, min(127, int(self.velocity.get())))
+        except (tk.TclError, ValueError):
+            return DEFAULT_VEL
 
-    def _draw_symbol_at(self, b, bt, lane, kind):
-        x, y = self._slot_center(b, bt, lane)
-        col = NOTE_COLORS.get(kind, INK)
-        size = 9
-        if kind == "full":
-            item = self.canvas.create_oval(x-size, y-size, x+size, y+size, fill=col, outline="")
-        elif kind == "half":
-            item = self.canvas.create_oval(x-size, y-size, x+size, y+size, outline=col, width=2)
-        elif kind == "combo":
-            r = 5
-            i1 = self.canvas.create_oval(x-r-4, y-r, x-r+4, y+r, fill=col, outline="")
-            i2 = self.canvas.create_oval(x+r-4, y-r, x+r+4, y+r, fill=col, outline="")
-            tag = f"sym_{b}_{bt}_{lane}"
-            for it in (i1, i2):
-                self.canvas.addtag_withtag(tag, it)
-            self.symbols[(b, bt, lane)] = {"id": tag, "kind": kind}
-            return
-        elif kind == "rest":
-            w, h = 14, 5
-            rect = self.canvas.create_rectangle(x-w/2, y-h/2, x+w/2, y+h/2, fill=col, outline="")
-            notch = self.canvas.create_line(x-w/2, y-h/2, x+w/2, y+h/2, fill=BG, width=2)
-            tag = f"sym_{b}_{bt}_{lane}"
-            for it in (rect, notch):
-                self.canvas.addtag_withtag(tag, it)
-            self.symbols[(b, bt, lane)] = {"id": tag, "kind": kind}
-            return
-        else:
-            return
-        self.symbols[(b, bt, lane)] = {"id": item, "kind": kind}
+    def _apply_edits(self, edits, record=True):
+        """Apply ("place", tick, lane, kind, dur, vel) / ("erase", tick, lane) edits: the
+        score first, then the canvas items of the touched slots, then one loop refresh.
+        Unless `record` is off (undo/redo, strokes), the batch is journalled as one
+        change. Returns the journal ops of what actually changed."""
+        touched = {}
+        ops = []
+        for edit in edits:
+            tick, lane = edit[1], edit[2]
+            if edit[0] == "erase":
+                old = self.events.remove(tick, lane)
+                if old is not None:
+                    touched[(tick, lane)] = None
+                    ops.append(["ev", tick, lane, [old["kind"], old["dur"], old["vel"]], None])
+            else:
+                old = self.events.get(tick, lane)
+                if old and (old["kind"], old["dur"], old["vel"]) == edit[3:6]:
+                    continue
+                self.events.put(tick, lane, *edit[3:6])
+                touched[(tick, lane)] = (edit[3], edit[4])
+                ops.append(["ev", tick, lane, old and [old["kind"], old["dur"], old["vel"]], list(edit[3:6])])
+        if not touched:
+            return ops
+        if record:
+            self.journal.record(ops)
+        for (tick, lane), new in touched.items():
+            meta = self.symbols.pop((tick, lane), None)
+            if meta:
+                self.canvas.delete(meta["id"])
+            if new:
+                self._draw_symbol_at(tick, lane, *new)
+        self._minimap_changed({tick // TICKS_PER_BAR for tick, _lane in touched})
+        self._loop_changed()
+        return ops
+
+    def _slot_center(self, tick, lane):
+        return self._tick_x(tick), self.lane_ys[lane]
+
+    def _draw_symbol_at(self, tick, lane, kind, dur):
+        """One image item per note, its picture shared through self.glyphs."""
+        if self._blocks_lod() or kind not in NOTE_COLORS:
+            return  # zoomed out: the bar's density block stands for its notes
+        x, y = self._slot_center(tick, lane)
+        tail = self._glyph_tail(tick, kind, dur)
+        img = self.glyphs.get(kind, NOTE_COLORS[kind], tail=tail)
+        item = self.canvas.create_image(x, y, image=img, tags=("zoom", "symbol"))
+        self.symbols[(tick, lane)] = {"id": item, "kind": kind, "dur": dur, "tail": tail}
+
+    def _glyph_tail(self, tick, kind, dur):
+        """Pixels of length bar a non-default duration draws at this zoom (0: none)."""
+        if dur == KIND_TICKS.get(kind):
+            return 0
+        return max(1, round(self._tick_x(tick + dur) - self._tick_x(tick)))
 
     # ---------- Timeline & Playback ----------
     def total_beats(self):
@@ -536,7 +4093,22 @@ class Sheet42(tk.Tk):
     def play(self):
         self.is_playing = True
         self.play_btn.config(text="❚❚ Pause")
-        self._tick()
+        if self.loop_on.get():
+            self._start_loop()
+        elif self.live_stream is not None:
+            # Audio runs a beat ahead on the stream; the timer only drives the view
+            self.live_stream.dither = self.dither.get()
+            self.live_stream.start(self.fx)
+            self._sched_next, self._sched_secs = self.current_pos, LIVE_LEAD
+            for _ in range(LIVE_AHEAD):
+                self._schedule_beat()
+            self._play_t0 = time.perf_counter() + LIVE_LEAD
+            self.after_id = self.after(int(LIVE_LEAD * 1000), self._tick)
+        else:
+            self._play_t0 = time.perf_counter()
+            self._tick()
+        self.animator.start()
+        self._sync_announce()
 
     def pause(self):
         self.is_playing = False
@@ -544,6 +4116,13 @@ class Sheet42(tk.Tk):
         if self.after_id:
             self.after_cancel(self.after_id)
             self.after_id = None
+        self._stop_loop()
+        if self.live_stream is not None:
+            self.live_stream.stop()  # drops strikes already scheduled
+        stop_wav_playback()
+        self.animator.stop()
+        self._draw_metro_line()
+        self._sync_announce()
 
     def stop(self):
         self.pause()
@@ -556,92 +4135,1071 @@ class Sheet42(tk.Tk):
         if not self.is_playing:
             return
         # Play any symbols at current_pos
-        self._play_symbols_at(self.current_pos)
+        self._beat_anchor = (self._play_t0, self.current_pos)
+        self._play_beat(self.current_pos)
 
-        # Advance to next beat
+        # Advance to next beat (the animator moves the line in between)
         self.current_pos = (self.current_pos + 1) % self.total_beats()
         self.scrub.set(self.current_pos)
-        self._draw_metro_line()
         self._update_pos_label()
 
-        # Schedule next tick based on BPM
-        bpm = max(40, min(208, self.BPM.get()))
-        interval_ms = int(60000 / bpm)
-        self.after_id = self.after(interval_ms, self._tick)
+        # Schedule the next tick against the tempo map rather than adding up
+        # per-beat intervals, so late timer callbacks do not accumulate drift
+        prev = self.current_pos - 1 if self.current_pos else self.total_beats() - 1
+        self._play_t0 += self.tempo_map.beat_secs(prev)
+        wait_ms = int((self._play_t0 - time.perf_counter()) * 1000)
+        self.after_id = self.after(max(1, wait_ms), self._tick)
 
     def _draw_metro_line(self):
-        if self.metro_line is not None:
-            try:
-                self.canvas.delete(self.metro_line)
-            except Exception:
-                pass
-        y0 = MARGIN_Y - 10
-        y1 = MARGIN_Y + STAFF_HEIGHT + 10
-        b = self.current_pos // BEATS_PER_BAR
-        bt = self.current_pos % BEATS_PER_BAR
-        x = MARGIN_X + b*BAR_W + (bt + 0.5)*(BAR_W/BEATS_PER_BAR)
-        self.metro_line = self.canvas.create_line(x, y0, x, y1, fill=ACCENT, width=2, dash=(3,3))
+        """Put the playhead on current_pos (used when not animating)."""
+        self._place_playhead(self.current_pos)
+
+    def _place_playhead(self, beat):
+        x = self._tick_x(beat * PPQ)
+        if self.playhead_x is not None and abs(x - self.playhead_x) < 0.5:
+            return
+        self.playhead_x = x
+        self.canvas.coords(self.metro_line, x, MARGIN_Y - 10, x, MARGIN_Y + STAFF_HEIGHT + 10)
+        mx = self._minimap_x(x)
+        self.minimap.coords(self.minimap_head, mx, 0, mx, MINIMAP_H)
+        if self.is_playing:
+            self._follow_playhead(x)
+
+    def _follow_playhead(self, x):
+        """Page the view when the playhead nears its edge, using the cached xview."""
+        total_w = MARGIN_X*2 + self.bar_w*BARS
+        left, right = self._view[0] * total_w, self._view[1] * total_w
+        if x > right - 40 or x < left:
+            self.canvas.xview_moveto(max(0.0, (x - 200) / total_w))
+
+    def _on_xscroll(self, first, last):
+        self._view = (float(first), float(last))
+        self.hscroll.set(first, last)
+        self._place_minimap_view()
+
+    # ---------- Overview minimap ----------
+    def _minimap_x(self, canvas_x):
+        return (canvas_x - MARGIN_X) / self.bar_w * MINIMAP_BAR_W
+
+    def _place_minimap_view(self):
+        total_w = MARGIN_X*2 + self.bar_w*BARS
+        x0 = max(0, self._minimap_x(self._view[0] * total_w))
+        x1 = min(BARS * MINIMAP_BAR_W - 1, self._minimap_x(self._view[1] * total_w))
+        self.minimap.coords(self.minimap_view, x0, 0, x1, MINIMAP_H - 1)
+
+    def _minimap_changed(self, bars):
+        """Queue bars whose density changed; the image is patched once things settle."""
+        self.minimap_dirty.update(bars)
+        if self.minimap_patch_id is None:
+            self.minimap_patch_id = self.after_idle(self._flush_minimap)
+
+    def _flush_minimap(self):
+        self.minimap_patch_id = None
+        bars, self.minimap_dirty = self.minimap_dirty, set()
+        self._patch_minimap(bars)
+        if self._blocks_lod():
+            self._draw_density(bars)
+
+    def _patch_minimap(self, bars):
+        """Repaint only the given bar columns of the cached overview image."""
+        img = self.minimap_img
+        full = LANES * BEATS_PER_BAR  # a bar this busy draws as a full column
+        for bar in bars:
+            x0 = bar * MINIMAP_BAR_W
+            x1 = x0 + MINIMAP_BAR_W - 1  # one pixel gap between bars
+            count = sum(1 for _ in self.events.range(bar*TICKS_PER_BAR, (bar+1)*TICKS_PER_BAR))
+            h = 0 if not count else max(2, int(round(min(1.0, count / full) * (MINIMAP_H - 4))))
+            img.put(SUBTLE if bar % 4 == 0 else BG, to=(x0, 0, x0 + MINIMAP_BAR_W, MINIMAP_H))
+            img.put(MINIMAP_TROUGH, to=(x0, 2, x1, MINIMAP_H - 2))
+            if h:
+                img.put(ACCENT, to=(x0, MINIMAP_H - 2 - h, x1, MINIMAP_H - 2))
+
+    def _minimap_jump(self, event):
+        bar_pos = max(0.0, min(BARS - 1e-6, event.x / MINIMAP_BAR_W))
+        total_w = MARGIN_X*2 + self.bar_w*BARS
+        span = self._view[1] - self._view[0]
+        x = MARGIN_X + bar_pos * self.bar_w
+        self.canvas.xview_moveto(max(0.0, x / total_w - span / 2))
+        if not self.is_playing:
+            self.scrub.set(int(bar_pos) * BEATS_PER_BAR)
+            self._on_scrub_change(int(bar_pos) * BEATS_PER_BAR)
+
+    def _transport_beat(self):
+        """Where the transport is right now, in (fractional) beats; None when stopped."""
+        if not self.is_playing:
+            return None
+        if self.loop_on.get() and self.loop_renderer.starts:
+            return self.loop_renderer.beat_pos(self.loop_player.position())
+        t0, beat = self._beat_anchor
+        tm = self.tempo_map
+        pos = tm.time_to_beat(tm.beat_to_time(beat) + time.perf_counter() - t0)
+        return max(beat, min(beat + 1, pos))
+
+    def _set_playhead_fps(self):
+        self.animator.fps = int(self.playhead_fps.get())
+        if self.animator.frames:
+            ms = self.animator.busy_secs / self.animator.frames * 1000
+            self.status_var.set(f"Playhead: {self.animator.fps} fps cap, {ms:.2f} ms per frame so far.")
 
     def _update_pos_label(self):
-        self.pos_label.config(text=f"Beat {self.current_pos+1} / {self.total_beats()}")
+        secs = self.tempo_map.beat_to_time(self.current_pos)
+        self.pos_label.config(text=f"Beat {self.current_pos+1} / {self.total_beats()}  ({int(secs // 60)}:{secs % 60:04.1f})")
+
+    # ---------- Transport sync ----------
+    def _set_sync_mode(self):
+        if self.sync_mode.get() == "Off":
+            self._stop_sync()
+            return
+        if self.sync is None:
+            try:
+                self.sync = TransportSync()
+            except OSError as e:
+                self.sync_mode.set("Off")
+                messagebox.showerror("Sync", f"Could not join {SYNC_GROUP}:{SYNC_PORT}:\n{e}")
+                return
+            self.sync_after = self.after(1000 // SYNC_HZ, self._sync_tick)
+        self._sync_err = None
+        self.status_var.set(f"Sync: {self.sync_mode.get().lower()}ing as {self.sync.node}.")
+
+    def _stop_sync(self):
+        for after_id in (self.sync_after, self._sync_start_id):
+            if after_id:
+                self.after_cancel(after_id)
+        self.sync_after = self._sync_start_id = None
+        if self.sync is not None:
+            self.sync.close()
+            self.sync = None
+        self.sync_label.config(text="")
+
+    def _sync_transport(self):
+        beat = self._transport_beat()
+        return {"playing": self.is_playing, "beat": self.current_pos if beat is None else beat,
+                "tempo": [list(p) for p in self.tempo_map.points()]}
+
+    def _sync_announce(self):
+        """Beacon at once on start/stop when leading, not at the next tick."""
+        if self.sync is not None and self.sync_mode.get() == "Lead":
+            try:
+                self.sync.send(self._sync_transport())
+            except OSError:
+                pass  # the next tick reports it
+
+    def _sync_tick(self):
+        sync = self.sync
+        leader = sync.poll()
+        try:
+            sync.send(self._sync_transport() if self.sync_mode.get() == "Lead" else None)
+        except OSError as e:
+            self.status_var.set(f"Sync: {e}")
+        if self.sync_mode.get() == "Follow" and leader is not None:
+            self._follow(leader)
+        self._show_sync(leader)
+        self.sync_after = self.after(1000 // SYNC_HZ, self._sync_tick)
+
+    def _follow(self, leader):
+        """Take the leader's tempo and start/stop, then pull our phase onto its:
+        slewed a little per beacon, or re-entered on a beat when far off."""
+        lead = leader.state["lead"]
+        if not same_tempo(lead["tempo"], self.tempo_map.points()):
+            recording, self._journal_seen = self._journal_seen is not None, None
+            try:  # the leader's tempo is not an edit of ours to undo
+                self._apply_setting("tempo", lead["tempo"])
+            finally:
+                if recording:
+                    self._journal_seen = self._settings()
+        total = self.total_beats()
+        target = leader_beat(leader, time.perf_counter(), self.tempo_map)
+        if not lead["playing"]:
+            self._sync_err = None
+            if self.is_playing:
+                self.pause()
+            if self._sync_start_id is None and int(target) != self.current_pos:
+                self.scrub.set(int(target) % total)
+                self._on_scrub_change(int(target) % total)
+            return
+        if self._sync_start_id is not None:
+            return  # already waiting to come in on a beat
+        if self.loop_on.get():
+            if not self.is_playing:
+                self.play()  # loops follow start/stop; their phase comes from the loop itself
+            return
+        mine = self._transport_beat()
+        err = None if mine is None else beat_error(mine, target % total, total)
+        if err is None or abs(err) > SYNC_JUMP:
+            self._sync_seek(target)
+            return
+        self._sync_err = err * self.tempo_map.beat_secs(int(mine))
+        d = phase_nudge(self._sync_err)
+        self._play_t0 += d  # the next tick and everything the stream gets from now on
+        self._sched_secs += d
+        t0, beat = self._beat_anchor
+        self._beat_anchor = (t0 + d, beat)
+
+    def _sync_seek(self, target):
+        """Stop, then start again on the next beat the leader reaches with room
+        for the stream's lead-in."""
+        if self.is_playing:
+            self.pause()
+        lead_in = LIVE_LEAD if self.live_stream is not None else 0.0
+        beat = math.floor(target) + 1
+        wait = self.tempo_map.beat_to_time(beat) - self.tempo_map.beat_to_time(target)
+        if wait < lead_in + 0.02:
+            wait += self.tempo_map.beat_secs(beat)
+            beat += 1
+        self.current_pos = beat % self.total_beats()
+        self.scrub.set(self.current_pos)
+        self._update_pos_label()
+        self._sync_start_id = self.after(int((wait - lead_in) * 1000), self._sync_start)
+
+    def _sync_start(self):
+        self._sync_start_id = None
+        if not self.is_playing:
+            self.play()
+
+    def _show_sync(self, leader):
+        peers = [p for p in self.sync.peers.values() if p.synced]
+        if self.sync_mode.get() == "Follow":
+            if leader is None:
+                text = "no leader yet"
+            else:
+                text = (f"{leader.node}: offset {leader.offset * 1000:+.1f} ms, rtt {leader.delay * 1000:.1f} ms, "
+                        f"jitter {leader.jitter * 1000:.2f} ms")
+                if self._sync_err is not None:
+                    text += f", phase {self._sync_err * 1000:+.1f} ms"
+        elif peers:
+            worst = max(p.jitter for p in peers)
+            text = f"{len(peers)} peer(s), jitter ≤ {worst * 1000:.2f} ms"
+        else:
+            text = "no peers yet"
+        self.sync_label.config(text=text)
+
+    # ---------- Tempo map ----------
+    def _on_bpm_change(self):
+        if self._bpm_shown:
+            return
+        self.tempo_map.set_point(0, self.BPM.get(), self.tempo_map.ramps[0])
+        self._tempo_changed()
+
+    def _show_bpm(self, bpm):
+        """Move the slider to a tempo the map already has, without writing it back:
+        the slider holds whole BPM and would round a fractional beat-0 tempo."""
+        self._bpm_shown = True
+        try:
+            self.BPM.set(max(40, min(208, int(round(bpm)))))
+        finally:
+            self._bpm_shown = False
+
+    def _set_tempo_point(self):
+        try:
+            bar = max(1, min(BARS, int(self.tempo_bar.get())))
+            bpm = int(self.tempo_bpm.get())
+        except (tk.TclError, ValueError):
+            self.status_var.set("Tempo: enter a bar number and a BPM.")
+            return
+        beat = (bar - 1) * BEATS_PER_BAR
+        if beat == 0:
+            self._show_bpm(bpm)
+        self.tempo_map.set_point(beat, bpm, self.tempo_ramp.get())
+        self._tempo_changed()
+
+    def _remove_tempo_point(self):
+        try:
+            bar = int(self.tempo_bar.get())
+        except (tk.TclError, ValueError):
+            return
+        if self.tempo_map.remove_point((bar - 1) * BEATS_PER_BAR):
+            self._tempo_changed()
+        else:
+            self.status_var.set(f"No removable tempo change at bar {bar}.")
+
+    def _tempo_changed(self):
+        self._update_tempo_label()
+        self._draw_tempo_marks()
+        self._update_pos_label()
+        self._loop_changed()
+
+    def _update_tempo_label(self):
+        parts = []
+        for beat, bpm, ramp in self.tempo_map.points():
+            parts.append(f"{int(beat) // BEATS_PER_BAR + 1}:{bpm:g}{'↗' if ramp else ''}")
+        total = self.tempo_map.beat_to_time(self.total_beats())
+        self.tempo_label.config(text="  ".join(parts) + f"   — length {int(total // 60)}:{total % 60:04.1f}")
+
+    def _draw_tempo_marks(self):
+        for item in self.tempo_marks:
+            self.canvas.delete(item)
+        self.tempo_marks = []
+        for beat, bpm, ramp in self.tempo_map.points():
+            x = MARGIN_X + beat*(self.bar_w/BEATS_PER_BAR)
+            self.tempo_marks.append(self.canvas.create_text(x + 2, MARGIN_Y - 20, anchor="w", text=f"♩={bpm:g}{' ↗' if ramp else ''}",
+                                                            fill=SUBTLE, font=("Helvetica", 8), tags="zoom"))
+
+    # ---------- Loop region ----------
+    def _set_loop_edge(self, event, edge):
+        tick = self._hit_tick(event.x)
+        if tick is None:
+            return
+        beat = tick // PPQ
+        if edge == "a":
+            self._set_loop(beat, None)
+        else:
+            self._set_loop(None, beat + 1)
+
+    def _set_loop(self, a, b):
+        a = self.loop_a if a is None else a
+        b = self.loop_b if b is None else b
+        a = max(0, min(self.total_beats()-1, a))
+        b = max(1, min(self.total_beats(), b))
+        if b <= a:
+            # Moving one edge past the other keeps at least one beat in the loop
+            if a != self.loop_a:
+                b = min(self.total_beats(), a + 1)
+            else:
+                a = b - 1
+        self.loop_a, self.loop_b = a, b
+        self._update_loop_label()
+        self._draw_loop_region()
+        self._loop_changed()
+
+    def _update_loop_label(self):
+        def fmt(beat):
+            return f"{beat // BEATS_PER_BAR + 1}.{beat % BEATS_PER_BAR + 1}"
+        self.loop_label.config(text=f"{fmt(self.loop_a)} – {fmt(self.loop_b - 1)}")
+
+    def _draw_loop_region(self):
+        if self.loop_item is not None:
+            self.canvas.delete(self.loop_item)
+            self.loop_item = None
+        if not self.loop_on.get():
+            return
+        beat_w = self.bar_w / BEATS_PER_BAR
+        x0 = MARGIN_X + self.loop_a*beat_w
+        x1 = MARGIN_X + self.loop_b*beat_w
+        self.loop_item = self.canvas.create_rectangle(x0, MARGIN_Y - 14, x1, MARGIN_Y + STAFF_HEIGHT + 10,
+                                                      fill=ACCENT, outline=ACCENT, stipple="gray12", tags="zoom")
+        self.canvas.tag_lower(self.loop_item)
+
+    def _on_loop_toggle(self):
+        self._draw_loop_region()
+        if self.is_playing:
+            # Switch playback mode on the fly
+            self.pause()
+            self.play()
+
+    def _loop_starts(self):
+        return self.tempo_map.beat_starts(self.loop_a, self.loop_b, self.loop_renderer.sr)
+
+    def _loop_signature(self, pos):
+        notes = []
+        for tick, lane, ev in self.events.range(pos*PPQ, (pos+1)*PPQ):
+            if event_strikes(ev["kind"], ev["dur"]):
+                notes.append((tick - pos*PPQ, lane, ev["kind"], ev["dur"], ev["vel"], self.lane_hz[lane]))
+        if not notes:
+            return ()
+        tm = self.tempo_map
+        source = self.instrument.digest if self.instrument else (self.waveform.get(), self.record_sample)
+        feel = self._feel()
+        if feel:
+            feel = (tuple(sorted(feel.items())), pos if feel["humanize_ms"] else None)  # humanize is seeded by tick
+        return (tuple(notes), source, round(tm.beat_secs(pos), 6), round(tm.bpm_at(pos), 3), feel)
+
+    def _render_beat(self, pos):
+        # One dry bus per kind, so each gets its own effects inserts
+        return beat_buses(self.events, self.tempo_map, pos, self.lane_hz, self.waveform.get(),
+                          self.record_sample, self.instrument, feel=self._feel())
+
+    def _beat_parts(self, pos):
+        """Rendered buses of one beat for live playback, rendered once per distinct beat."""
+        sig = self._loop_signature(pos)
+        if not sig:
+            return {}
+        parts = self._beat_cache.get(sig)
+        if parts is None:
+            if len(self._beat_cache) >= 4 * BEATS_PER_BAR * BARS:
+                self._beat_cache.clear()  # stale after many edits; cheap to refill
+            parts = self._beat_cache[sig] = self._render_beat(pos)
+        return parts
+
+    def _feel(self):
+        """Swing/humanize/flam settings, or None when playing straight."""
+        try:
+            feel = {"swing": max(50, min(75, int(self.swing.get()))),
+                    "humanize_ms": max(0, min(50, int(self.humanize_ms.get()))),
+                    "flam_ms": max(0, min(60, int(self.flam_ms.get())))}
+        except (tk.TclError, ValueError):
+            return None
+        return None if feel == FEEL_DEFAULT else feel
+
+    def _loop_pcm(self):
+        """What the player should loop: the dry buffer, or a wet pre-render when
+        effects are on and the player cannot run them live."""
+        if self.fx.active() and not self.loop_player.streams_fx:
+            return self.loop_renderer.render_wet(self.fx)
+        return self.loop_renderer.pcm
+
+    def _render_loop(self):
+        t0 = time.perf_counter()
+        rebuilt = self.loop_renderer.render((self.loop_a, self.loop_b), self._loop_starts(),
+                                           self._loop_signature, self._render_beat)
+        return rebuilt, time.perf_counter() - t0
+
+    def _start_loop(self):
+        self.current_pos = self.loop_a
+        hits = RENDER_CACHE.hits
+        rebuilt, secs = self._render_loop()
+        self.loop_player.start(self._loop_pcm(), self.loop_renderer, self.fx)
+        self._loop_last_frame = 0
+        mode = "gapless" if self.loop_player.gapless else "re-triggered each pass"
+        if self.engine is not None and self.engine.silent:
+            mode += ", silent: the engine has no output device"
+        self.status_var.set(f"Looping {self.loop_label.cget('text')} ({mode}); rendered {len(rebuilt)} beats in {secs*1000:.0f} ms"
+                            f" ({RENDER_CACHE.hits - hits} notes from the render cache).")
+        self._loop_follow()
+
+    def _stop_loop(self):
+        for attr in ("loop_follow_id", "loop_refresh_id"):
+            aid = getattr(self, attr)
+            if aid:
+                self.after_cancel(aid)
+                setattr(self, attr, None)
+        self.loop_player.stop()
+
+    def _loop_follow(self):
+        """Track the audio position for the labels; the audio itself runs on its own."""
+        if not self.is_playing:
+            return
+        frame = self.loop_player.position()
+        if frame < self._loop_last_frame:
+            self.loop_player.replay_pass()
+        self._loop_last_frame = frame
+        pos = self.loop_renderer.beat_at(frame)
+        if pos != self.current_pos:
+            self.current_pos = pos
+            self.scrub.set(pos)
+            self._update_pos_label()
+        self.loop_follow_id = self.after(15, self._loop_follow)
+
+    def _loop_changed(self):
+        """Something the loop buffer depends on changed; re-render once things settle."""
+        self._journal_settings()
+        if not (self.is_playing and self.loop_on.get()) or self.loop_refresh_id:
+            return
+        self.loop_refresh_id = self.after_idle(self._refresh_loop)
+
+    def _refresh_loop(self):
+        self.loop_refresh_id = None
+        if not (self.is_playing and self.loop_on.get()):
+            return
+        old = self.loop_renderer.pcm
+        rebuilt, secs = self._render_loop()
+        if self.loop_renderer.pcm is not old or rebuilt:
+            self.loop_player.update(self._loop_pcm())
+        if rebuilt:
+            self.status_var.set(f"Loop updated: re-rendered {len(rebuilt)} beat(s) in {secs*1000:.0f} ms.")
 
     # ---------- Audio triggering ----------
-    def _play_symbols_at(self, pos):
-        b = pos // BEATS_PER_BAR
-        bt = pos % BEATS_PER_BAR
-        # collect all lanes at this bar+beat
-        events = []
-        for lane in range(LANES):
-            key = (b, bt, lane)
-            if key in self.symbols:
-                kind = self.symbols[key]["kind"]
-                if kind == "rest":
-                    continue
-                freq = lane_to_hz(lane, self.lane_notes)
-                if kind == "full":
-                    dur_beats = 1.0
-                    events.append((freq, dur_beats))
-                elif kind == "half":
-                    dur_beats = 0.5
-                    events.append((freq, dur_beats))
-                elif kind == "combo":
-                    # two quick strikes, each 0.5 beat
-                    events.append((freq, 0.5))
-                    # and schedule another very short delayed strike
-                    self.after(self._ms_per_beat()//2, lambda f=freq: self._play_note(f, 0.5))
-        # Play gathered notes
-        for freq, dur_beats in events:
-            self._play_note(freq, dur_beats)
+    def _play_beat(self, pos):
+        """Sound beat `pos`: on the stream, keep LIVE_AHEAD beats scheduled past it;
+        otherwise play the beat's buffer now. Either way every strike sits at its
+        sample offset inside the rendered beat, not on a Tk timer."""
+        if self.live_stream is not None:
+            if self._sched_next != (pos + LIVE_AHEAD) % self.total_beats():
+                # The user scrubbed: restart the schedule from here, a lead ahead
+                self._sched_next = pos
+                self._sched_secs = self.live_stream.frame / self.live_stream.sr + LIVE_LEAD
+                for _ in range(LIVE_AHEAD - 1):
+                    self._schedule_beat()
+            self._schedule_beat()
+        else:
+            parts = self._beat_parts(pos)
+            if parts:
+                mix = array("f")
+                for bus in parts.values():
+                    add_at(mix, 0, bus)
+                play_wav_bytes(pcm16_to_wav(quantize_pcm16(mix, self.dither.get()), AUDIO.sr, channels=1))
 
         # optional click (downbeat accent)
         if winsound:
             try:
-                if bt == 0:
+                if pos % BEATS_PER_BAR == 0:
                     winsound.Beep(880, 40)
                 else:
                     winsound.Beep(660, 25)
             except Exception:
                 pass
 
-    def _ms_per_beat(self):
-        bpm = max(40, min(208, self.BPM.get()))
-        return int(60000 / bpm)
+    def _schedule_beat(self):
+        pos = self._sched_next
+        self.live_stream.schedule(int(round(self._sched_secs * self.live_stream.sr)), self._beat_parts(pos))
+        self._sched_secs += self.tempo_map.beat_secs(pos)
+        self._sched_next = (pos + 1) % self.total_beats()
+
+    # ---------- Sample Management ----------
+    def _on_dither_toggle(self):
+        self.loop_renderer.dither = self.loop_player.dither = self.dither.get()
+        self._journal_settings()
 
-    def _play_note(self, freq_hz, dur_beats):
-        secs = max(0.05, dur_beats * (60.0 / max(40, min(208, self.BPM.get()))))
-        if self.record_sample_bytes:
-            # pitch-shift naive: resample by ratio (affects duration). Keep simple & fast.
-            base_freq = 440.0  # assume recording "reference" ~A4; scale by ratio
-            ratio = freq_hz / base_freq
-            wav = naive_resample_wav(self.record_sample_bytes, ratio)
+    def _toggle_engine(self):
+        """Move playback into (or back out of) the AudioEngine child process."""
+        if self.is_playing:
+            self.pause()
+        if self.engine_on.get():
+            engine = AudioEngine(sink="device" if SINK is None else "null")  # one writer per capture file
+            try:
+                engine.start()
+            except (OSError, EOFError, RuntimeError) as e:
+                engine.close()
+                self.engine_on.set(False)
+                messagebox.showerror("Engine process", f"Could not start the audio engine:\n{e}")
+                return
+            self.engine = engine
+            self.loop_player = EngineLoopPlayer(engine)
+            self.live_stream = EngineStream(engine)
+            self.after(ENGINE_POLL_MS, self._poll_engine)
+            if SINK is not None:
+                self.status_var.set(f"Audio engine running on its own null sink; the {SINK.name} sink gets nothing from it.")
+            elif engine.silent:
+                self.status_var.set("Audio engine running, but silent: it needs 'sounddevice' for an output device.")
+            else:
+                self.status_var.set("Audio engine running in its own process.")
         else:
-            wav = synth_wave(self.waveform.get(), freq_hz, secs, amp=0.28)
-        play_wav_bytes(wav)
+            self._stop_engine()
+            self.status_var.set("Audio back in-process.")
+        self.loop_player.dither = self.dither.get()
+        if self.live_stream is not None:
+            self.live_stream.dither = self.dither.get()
+
+    def _stop_engine(self):
+        if self.engine is None:
+            return
+        self.engine.close()
+        self.engine = None
+        self.engine_on.set(False)
+        self.loop_player = LoopPlayer()
+        self.live_stream = LiveStream() if can_stream() else None
+
+    def _poll_engine(self):
+        engine = self.engine
+        if engine is None:
+            return
+        if not engine.alive():
+            if self.is_playing:
+                self.pause()
+            self._stop_engine()
+            self.status_var.set("Audio engine stopped; playback is back in-process.")
+            return
+        if engine.poll():
+            self.status_var.set(f"Audio engine underrun at {engine.last_underrun / engine.sr:.1f} s "
+                            f"({engine.underruns} so far): the UI fell behind the ring.")
+        self.after(ENGINE_POLL_MS, self._poll_engine)
+
+    # ---------- Effects ----------
+    def _show_effects(self):
+        if self.fx_window is not None:
+            self.fx_window.lift()
+            return
+        win = self.fx_window = tk.Toplevel(self, bg=BG, padx=10, pady=8)
+        win.title("Effects")
+        win.protocol("WM_DELETE_WINDOW", self._close_effects)
+        heads = ("Track", "Filter", "Type", "Cutoff Hz", "Delay", "ms", "Feedback", "Reverb", "Room", "Mix")
+        for c, h in enumerate(heads):
+            tk.Label(win, text=h, bg=BG, fg=SUBTLE).grid(row=0, column=c, padx=4, sticky="w")
+        for r, track in enumerate(self.fx.chains, start=1):
+            chain = self.fx.chains[track]
+            v = self.fx_vars.setdefault(track, {
+                "filter": tk.BooleanVar(value=chain.filter.enabled),
+                "mode": tk.StringVar(value=chain.filter.mode),
+                "cutoff": tk.DoubleVar(value=chain.filter.cutoff),
+                "delay": tk.BooleanVar(value=chain.delay.enabled),
+                "ms": tk.DoubleVar(value=round(chain.delay.secs * 1000)),
+                "feedback": tk.DoubleVar(value=chain.delay.feedback),
+                "reverb": tk.BooleanVar(value=chain.reverb.enabled),
+                "room": tk.DoubleVar(value=chain.reverb.room),
+                "mix": tk.DoubleVar(value=chain.reverb.mix),
+            })
+            apply = lambda t=track: self._apply_effects(t)
+            tk.Label(win, text=track.capitalize(), bg=BG).grid(row=r, column=0, sticky="w")
+            for c, key in ((1, "filter"), (4, "delay"), (7, "reverb")):
+                tk.Checkbutton(win, variable=v[key], bg=BG, selectcolor=BG, command=apply).grid(row=r, column=c)
+            cb = ttk.Combobox(win, width=8, textvariable=v["mode"], values=("lowpass", "highpass"), state="readonly")
+            cb.grid(row=r, column=2)
+            cb.bind("<<ComboboxSelected>>", lambda e, t=track: self._apply_effects(t))
+            for c, key, lo, hi, step in ((3, "cutoff", 20, 20000, 100), (5, "ms", 10, 2000, 10),
+                                         (6, "feedback", 0, 0.95, 0.05), (8, "room", 0, 1, 0.05), (9, "mix", 0, 1, 0.05)):
+                sb = ttk.Spinbox(win, from_=lo, to=hi, increment=step, textvariable=v[key], width=6, command=apply)
+                sb.grid(row=r, column=c, padx=2)
+                sb.bind("<Return>", lambda e, t=track: self._apply_effects(t))
+        self.fx_cpu_label = tk.Label(win, text="", bg=BG, fg=SUBTLE, justify="left", anchor="w")
+        self.fx_cpu_label.grid(row=len(self.fx.chains) + 1, column=0, columnspan=len(heads), sticky="w", pady=(8, 0))
+        self._update_fx_cpu()
+
+    def _close_effects(self):
+        if self.fx_cpu_id:
+            self.after_cancel(self.fx_cpu_id)
+            self.fx_cpu_id = None
+        self.fx_window.destroy()
+        self.fx_window = None
+
+    def _apply_effects(self, track):
+        v, chain = self.fx_vars[track], self.fx.chains[track]
+        try:
+            chain.filter.set(v["mode"].get(), v["cutoff"].get())
+            chain.delay.set(v["ms"].get() / 1000.0, v["feedback"].get())
+            chain.reverb.set(v["room"].get(), mix=v["mix"].get())
+        except (tk.TclError, ValueError):
+            messagebox.showerror("Effects", "Effect settings must be numbers.")
+            return
+        chain.filter.enabled = v["filter"].get()
+        chain.delay.enabled = v["delay"].get()
+        chain.reverb.enabled = v["reverb"].get()
+        self._journal_settings()
+        self._effects_changed()
+
+    def _effects_changed(self):
+        if self.is_playing and self.loop_on.get() and not self.loop_player.streams_fx:
+            self.loop_player.update(self._loop_pcm())
+
+    def _update_fx_cpu(self):
+        """Per-effect CPU as a share of the audio it processed; over 100% cannot keep up live."""
+        rows = self.fx.cpu_report()
+        if rows:
+            text = "   ".join(f"{t}/{name}: {share*100:.1f}%" for t, name, _, share in rows)
+        else:
+            text = "No effect has processed audio yet."
+        self.fx_cpu_label.config(text=f"CPU per audio second — {text}")
+        self.fx_cpu_id = self.after(500, self._update_fx_cpu)
+
+    def _load_instrument(self):
+        path = filedialog.askopenfilename(title="Load instrument", filetypes=[("Instrument", "*.json"), ("All files", "*")])
+        if not path:
+            return
+        try:
+            inst = Instrument.load(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Load instrument", str(e))
+            return
+        if self.instrument is not None:
+            self.instrument.close()
+        self.instrument = inst
+        self.status_var.set(f"Instrument '{inst.name}': {len(inst.zones)} samples mapped from disk.")
+        self._loop_changed()
+
+    def _import_wav(self):
+        """Convert a WAV of any supported format on a worker thread and play it as
+        a one-sample instrument; the UI only polls the job's progress."""
+        if self.import_job:
+            self.status_var.set("An import is already running.")
+            return
+        path = filedialog.askopenfilename(title="Import sample", filetypes=[("WAV audio", "*.wav *.wave"), ("All files", "*")])
+        if not path:
+            return
+        job = self.import_job = {"path": path, "progress": 0.0, "result": None, "error": None, "done": False}
+        def work():
+            try:
+                job["result"] = import_wav(path, progress=lambda p: job.__setitem__("progress", p))
+            except Exception as e:
+                job["error"] = e
+            job["done"] = True
+        threading.Thread(target=work, daemon=True).start()
+        self._poll_import()
+
+    def _poll_import(self):
+        job = self.import_job
+        name = os.path.basename(job["path"])
+        if not job["done"]:
+            self.status_var.set(f"Importing {name}: {job['progress']*100:.0f}%")
+            self.after(100, self._poll_import)
+            return
+        self.import_job = None
+        try:
+            if job["error"]:
+                raise job["error"]
+            inst = Instrument.single(job["result"], 440.0, name=name)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Import WAV", f"{name}: {e}")
+            return
+        if self.instrument is not None:
+            self.instrument.close()
+        self.instrument = inst
+        self.status_var.set(f"Imported {name}; lanes pitch it from an A4 reference.")
+        self._loop_changed()
+
+    # ---------- Sample memory ----------
+    def _show_memory(self):
+        if self.mem_window is not None:
+            self.mem_window.lift()
+            return
+        win = self.mem_window = tk.Toplevel(self, bg=BG, padx=10, pady=8)
+        win.title("Sample memory")
+        win.protocol("WM_DELETE_WINDOW", self._close_memory)
+        self.mem_label = tk.Label(win, text="", bg=BG, fg=INK, justify="left", font=("Courier", 10))
+        self.mem_label.pack(anchor="w")
+        row = tk.Frame(win, bg=BG)
+        row.pack(anchor="w", pady=(8, 0))
+        tk.Label(row, text="Budget MB", bg=BG).pack(side="left")
+        self.mem_budget = tk.IntVar(value=SAMPLES.budget // (1024 * 1024))
+        ttk.Spinbox(row, from_=0, to=4096, increment=16, textvariable=self.mem_budget, width=6).pack(side="left", padx=4)
+        ttk.Button(row, text="Apply", command=self._apply_memory_budget).pack(side="left")
+        self._update_memory()
+
+    def _close_memory(self):
+        self.mem_window.destroy()
+        self.mem_window = None
+
+    def _apply_memory_budget(self):
+        try:
+            SAMPLES.set_budget(int(self.mem_budget.get()) * 1024 * 1024)
+        except (tk.TclError, ValueError):
+            return
+        self._update_memory()
+
+    def _update_memory(self):
+        if self.mem_window is None:
+            return
+        self.mem_label.config(text=SAMPLES.report())
+        self.after(1000, self._update_memory)
+
+    # ---------- Audio profile ----------
+    def _show_audio(self):
+        if self.audio_window is not None:
+            self.audio_window.lift()
+            return
+        win = self.audio_window = tk.Toplevel(self, bg=BG, padx=10, pady=8)
+        win.title("Audio profile")
+        win.protocol("WM_DELETE_WINDOW", self._close_audio)
+        v = self.audio_vars = {key: tk.StringVar(value=str(val)) for key, val in AUDIO.settings().items()}
+        row = tk.Frame(win, bg=BG)
+        row.pack(anchor="w")
+        for key, label, values in (("sr", "Rate Hz", SAMPLE_RATES), ("block", "Block", BLOCK_SIZES),
+                                   ("quality", "Quality", QUALITIES)):
+            tk.Label(row, text=label, bg=BG).pack(side="left")
+            ttk.Combobox(row, width=8, textvariable=v[key], values=values, state="readonly").pack(side="left", padx=(4, 10))
+        ttk.Button(row, text="Apply", command=self._apply_audio_profile).pack(side="left")
+        row = tk.Frame(win, bg=BG)
+        row.pack(anchor="w", pady=(8, 0))
+        tk.Label(row, text="Presets", bg=BG, fg=SUBTLE).pack(side="left", padx=(0, 4))
+        for name in AUDIO_PROFILES:
+            ttk.Button(row, text=name, command=lambda n=name: self._pick_audio_profile(n)).pack(side="left", padx=2)
+        ttk.Button(row, text="Measure CPU", command=self._measure_audio).pack(side="left", padx=(10, 0))
+        self.audio_label = tk.Label(win, text="", bg=BG, fg=INK, justify="left", anchor="w", font=("Courier", 10))
+        self.audio_label.pack(anchor="w", pady=(8, 0))
+        self._show_audio_profile()
+
+    def _close_audio(self):
+        self.audio_window.destroy()
+        self.audio_window = None
+
+    def _show_audio_profile(self, extra=""):
+        if self.audio_window is None:
+            return
+        self.audio_label.config(text=f"Now: {AUDIO.name()}, {AUDIO.sr} Hz, {AUDIO.block} frames "
+                                     f"({AUDIO.block / AUDIO.sr * 1000:.1f} ms), {AUDIO.quality} quality" + extra)
+
+    def _pick_audio_profile(self, name):
+        for key, val in AUDIO_PROFILES[name].items():
+            self.audio_vars[key].set(str(val))
+        self._apply_audio_profile()
+
+    def _apply_audio_profile(self):
+        """Switch the global profile and rebuild everything that holds the old rate."""
+        v = self.audio_vars
+        try:
+            AUDIO.configure(v["sr"].get(), v["block"].get(), v["quality"].get())
+        except ValueError as e:
+            messagebox.showerror("Audio profile", str(e))
+            return
+        if self.is_playing:
+            self.pause()
+        if self.fx_window is not None:
+            self._close_effects()
+        save_audio_prefs()
+        old = self.fx
+        self.fx = EffectsRack()
+        self.fx.configure(old.settings())
+        self.loop_renderer = LoopRenderer()
+        if self.engine is not None:
+            self._stop_engine()
+            self.engine_on.set(True)
+            self._toggle_engine()  # restarts the engine process at the new rate
+        else:
+            self.loop_player = LoopPlayer()
+            self.live_stream = LiveStream() if can_stream() else None
+        self._beat_cache.clear()
+        self.loop_renderer.dither = self.loop_player.dither = self.dither.get()
+        if self.live_stream is not None:
+            self.live_stream.dither = self.dither.get()
+        self._show_audio_profile()
+        self.status_var.set(f"Audio profile: {AUDIO.name()} ({AUDIO.sr} Hz, {AUDIO.block} frames, {AUDIO.quality}).")
+        self._loop_changed()
+
+    def _measure_audio(self):
+        """Time profile_cpu for every preset and the current settings on a worker
+        thread, so the UI stays responsive while it runs."""
+        if self.audio_job:
+            return
+        profiles = dict(AUDIO_PROFILES)
+        if AUDIO.name() == "Custom":
+            profiles["Current"] = AUDIO.settings()
+        job = self.audio_job = {"rows": [], "done": False}
+        def work():
+            for name, p in profiles.items():
+                job["rows"].append((name, p, profile_cpu(p["sr"], p["block"], p["quality"])))
+            job["done"] = True
+        threading.Thread(target=work, daemon=True).start()
+        self._poll_audio_measure()
+
+    def _poll_audio_measure(self):
+        job = self.audio_job
+        lines = [f"\n{name:<9}{p['sr']:>6} Hz {p['block']:>5} {p['quality']:<9}"
+                 f"{cpu * 1000:6.0f} ms CPU per s of audio ({cpu * 100:.0f}% of a core)"
+                 for name, p, cpu in job["rows"]]
+        if not job["done"]:
+            lines.append("\nMeasuring…")
+            self.after(200, self._poll_audio_measure)
+        else:
+            self.audio_job = None
+        self._show_audio_profile("".join(lines))
+
+    # ---------- Waveform ----------
+    def _show_waveform(self):
+        if self.wave_window is not None:
+            self.wave_window.lift()
+            self._load_waveform()
+            return
+        win = self.wave_window = tk.Toplevel(self, bg=BG, padx=10, pady=8)
+        win.title("Sample waveform")
+        win.protocol("WM_DELETE_WINDOW", self._close_waveform)
+        row = tk.Frame(win, bg=BG)
+        row.pack(fill="x")
+        tk.Label(row, text="Sample", bg=BG).pack(side="left")
+        src = ttk.Combobox(row, width=10, textvariable=self.wave_src, values=("recording", "instrument", "synth"),
+                           state="readonly")
+        src.pack(side="left", padx=(4, 10))
+        src.bind("<<ComboboxSelected>>", lambda e: self._load_waveform())
+        ttk.Button(row, text="Zoom Full", command=self._wave_zoom_full).pack(side="left", padx=4)
+        ttk.Button(row, text="Play Selection", command=self._wave_play).pack(side="left", padx=4)
+        ttk.Button(row, text="Normalize", command=self._wave_normalize).pack(side="right", padx=4)
+        ttk.Button(row, text="Trim to Selection", command=self._wave_trim).pack(side="right", padx=4)
+        c = self.wave_canvas = tk.Canvas(win, width=WAVE_VIEW_W, height=WAVE_VIEW_H, bg="white", highlightthickness=0)
+        c.pack(pady=(8, 4))
+        c.bind("<MouseWheel>", lambda e: self._wave_wheel(e.x, e.delta > 0, e.state & 1))
+        c.bind("<Button-4>", lambda e: self._wave_wheel(e.x, True, e.state & 1))
+        c.bind("<Button-5>", lambda e: self._wave_wheel(e.x, False, e.state & 1))
+        c.bind("<Button-1>", self._wave_press)
+        c.bind("<B1-Motion>", self._wave_motion)
+        c.bind("<ButtonRelease-1>", self._wave_release)
+        self.wave_info = tk.Label(win, text="", bg=BG, fg=SUBTLE, anchor="w", justify="left")
+        self.wave_info.pack(fill="x")
+        self._load_waveform()
+
+    def _close_waveform(self):
+        self.wave_job = None
+        self.wave_window.destroy()
+        self.wave_window = None
+        self.wave_pyramid = None
+
+    def _wave_source(self):
+        """(buffer, sr, scale, stride, editable) for the chosen sample, or None."""
+        src = self.wave_src.get()
+        if src == "recording":
+            got = SAMPLES.get(self.record_sample) if self.record_sample else None
+            return got and (got[0], got[1], 1 / 32768, 1, True)
+        if src == "instrument":
+            if self.instrument is None or not self.instrument.zones:
+                return None
+            zone = self.instrument.zones[0]
+            return zone.frames, zone.sr, 1 / 32768, zone.channels, False
+        f = lane_to_hz(4, self.lane_hz)
+        return note_f32(f, 1.0, self.tempo_map.bpm_at(0), self.waveform.get()), AUDIO.sr, 1.0, 1, False
+
+    def _load_waveform(self):
+        """Show the chosen sample; its peak pyramid is built in idle time, so a
+        long take does not stall the UI."""
+        got = self._wave_source()
+        if got is None:
+            self.wave_pyramid = None
+            self.wave_job = None
+            self._draw_waveform(f"No {self.wave_src.get()} sample yet.")
+            return
+        data, sr, scale, stride, editable = got
+        pyr = self.wave_pyramid = PeakPyramid(data, sr, scale, stride)
+        self.wave_editable = editable
+        self.wave_view = (0, pyr.length)
+        self.wave_sel = (0, pyr.length)
+        self._wave_run(pyr.build(), "Scanning", self._draw_waveform)
+
+    def _wave_run(self, steps, what, on_done):
+        self.wave_job = (steps, what, on_done)
+        self._wave_pump()
+
+    def _wave_pump(self):
+        """Advance the background job for up to ~30 ms, then yield to Tk."""
+        if self.wave_job is None or self.wave_window is None:
+            return
+        steps, what, on_done = self.wave_job
+        deadline = time.perf_counter() + 0.03
+        try:
+            while time.perf_counter() < deadline:
+                done = next(steps)
+        except StopIteration:
+            self.wave_job = None
+            on_done()
+            return
+        self._draw_waveform(f"{what}… {done*100:.0f}%")
+        self.after(1, self._wave_pump)
+
+    def _wave_x(self, sample):
+        start, end = self.wave_view
+        return (sample - start) * WAVE_VIEW_W / max(1, end - start)
+
+    def _wave_sample(self, x):
+        start, end = self.wave_view
+        pyr = self.wave_pyramid
+        return max(0, min(pyr.length, int(round(start + x * (end - start) / WAVE_VIEW_W))))
+
+    def _draw_waveform(self, message=None):
+        c = self.wave_canvas
+        c.delete("all")
+        mid = WAVE_VIEW_H / 2
+        pyr = self.wave_pyramid
+        if message or pyr is None or not pyr.ready():
+            c.create_text(WAVE_VIEW_W / 2, mid, text=message or "", fill=SUBTLE)
+            self.wave_info.config(text="")
+            return
+        a, b = self.wave_sel
+        c.create_rectangle(self._wave_x(a), 0, self._wave_x(b), WAVE_VIEW_H, fill=WAVE_SELECTION, outline="")
+        c.create_line(0, mid, WAVE_VIEW_W, mid, fill=SUBTLE)
+        start, end = self.wave_view
+        lo, hi = pyr.peaks(start, end, WAVE_VIEW_W)
+        half = mid - 4
+        coords = []
+        for x, (l, h) in enumerate(zip(lo, hi)):
+            # One zigzag line through every column's min and max: a single canvas item
+            coords += (x, mid - h * half, x, mid - l * half - 1)
+        if len(coords) >= 4:
+            c.create_line(*coords, fill=ACCENT)
+        for handle in self.wave_sel:
+            x = self._wave_x(handle)
+            c.create_line(x, 0, x, WAVE_VIEW_H, fill=INK, width=2)
+        peak = pyr.peak()
+        db = f"{20 * math.log10(peak):.1f} dBFS" if peak > 0 else "silent"
+        sr = pyr.sr
+        self.wave_info.config(text=(
+            f"{pyr.length / sr:.2f} s at {sr} Hz, peak {db}.  View {start / sr:.3f}–{end / sr:.3f} s "
+            f"({(end - start) / WAVE_VIEW_W:.1f} samples/px); selection {a / sr:.3f}–{b / sr:.3f} s.\n"
+            "Wheel zooms, Shift+wheel scrolls, drag to select or move a handle."
+            + ("" if self.wave_editable else "  (View only: trim and normalize edit the mic recording.)")))
+
+    def _wave_zoom_full(self):
+        if self.wave_pyramid is not None and self.wave_job is None:
+            self.wave_view = (0, self.wave_pyramid.length)
+            self._draw_waveform()
+
+    def _wave_wheel(self, x, up, shift):
+        pyr = self.wave_pyramid
+        if pyr is None or self.wave_job is not None:
+            return
+        start, end = self.wave_view
+        span = end - start
+        if shift:
+            move = int(span * 0.1) * (-1 if up else 1)
+            start = max(0, min(pyr.length - span, start + move))
+            self.wave_view = (start, start + span)
+        else:
+            at = self._wave_sample(x)
+            new = max(32, min(pyr.length, int(span * (0.8 if up else 1.25))))
+            start = max(0, min(pyr.length - new, int(at - (at - start) * new / max(1, span))))
+            self.wave_view = (start, start + new)
+        self._draw_waveform()
+
+    def _wave_press(self, e):
+        if self.wave_pyramid is None or self.wave_job is not None:
+            return
+        near = [i for i, h in enumerate(self.wave_sel) if abs(self._wave_x(h) - e.x) <= 5]
+        if near:
+            self.wave_drag = near[0]
+        else:
+            at = self._wave_sample(e.x)
+            self.wave_sel, self.wave_drag = (at, at), 1
+        self._draw_waveform()
+
+    def _wave_motion(self, e):
+        if self.wave_drag is None:
+            return
+        sel = list(self.wave_sel)
+        sel[self.wave_drag] = self._wave_sample(e.x)
+        if sel[0] > sel[1]:
+            sel.reverse()
+            self.wave_drag = 1 - self.wave_drag
+        self.wave_sel = tuple(sel)
+        self._draw_waveform()
+
+    def _wave_release(self, _e):
+        self.wave_drag = None
+
+    def _wave_play(self):
+        pyr = self.wave_pyramid
+        if pyr is None:
+            return
+        a, b = self.wave_sel
+        if b <= a:
+            a, b = 0, pyr.length
+        s = pyr.stride
+        if pyr.scale == 1.0:  # float synth note
+            pcm = quantize_pcm16(pyr.data[a:b], self.dither.get())
+        else:
+            ints = array("h", pyr.data[a*s:b*s:s])
+            if sys.byteorder != "little":
+                ints.byteswap()
+            pcm = ints.tobytes()
+        play_wav_bytes(pcm16_to_wav(pcm, pyr.sr, channels=1))
+
+    def _wave_editable(self):
+        pyr = self.wave_pyramid
+        if pyr is None or self.wave_job is not None:
+            return None
+        if not self.wave_editable:
+            self.status_var.set("Only the mic recording can be trimmed or normalized.")
+            return None
+        return pyr
+
+    def _wave_trim(self):
+        """Cut the recording down to the selection, in place."""
+        pyr = self._wave_editable()
+        if pyr is None:
+            return
+        a, b = self.wave_sel
+        if b - a < 2 or (a, b) == (0, pyr.length):
+            self.status_var.set("Drag across the waveform to select what to keep.")
+            return
+        del pyr.data[b:]
+        del pyr.data[:a]
+        self._wave_edited(f"Trimmed the recording to {(b - a) / pyr.sr:.2f} s.")
+        self._load_waveform()
+
+    def _wave_normalize(self):
+        """Scale the recording so its peak sits just under full scale, in place."""
+        pyr = self._wave_editable()
+        if pyr is None:
+            return
+        peak = pyr.peak()
+        if peak <= 0:
+            return
+        gain = 0.98 / peak
+        def done():
+            pyr.rescale(gain)
+            self._wave_edited(f"Normalized the recording ({20 * math.log10(gain):+.1f} dB).")
+            self._draw_waveform()
+        self._wave_run(scale_pcm16(pyr.data, gain), "Normalizing", done)
+
+    def _wave_edited(self, note):
+        self.record_sample = SAMPLES.rekey(self.record_sample)
+        self.status_var.set(note)
+        self._loop_changed()
 
-    # ---------- Sample Management ----------
     def _test_tone(self):
-        f = lane_to_hz(4, self.lane_notes)  # mid
-        wav = synth_wave(self.waveform.get(), f, 0.4, amp=0.3)
+        f = lane_to_hz(4, self.lane_hz)  # mid
+        wav = synth_wave(self.waveform.get(), f, 0.4, amp=0.3, dither=self.dither.get())
         play_wav_bytes(wav)
 
     def _record_sample(self):
@@ -650,103 +5208,668 @@ class Sheet42(tk.Tk):
             return
         secs = float(self.record_secs.get())
         try:
-            fs = self.record_sr
+            fs = AUDIO.sr
             messagebox.showinfo("Recording", "Recording will start now. Speak/sing/play...")
             data = sd.rec(int(secs*fs), samplerate=fs, channels=1, dtype='int16')
             sd.wait()
-            pcm = data.tobytes()
-            self.record_sample_bytes = pcm16_to_wav(pcm, fs, channels=1)
+            pcm = array("h")
+            pcm.frombytes(data.tobytes())
+            if self.record_sample:
+                SAMPLES.release(self.record_sample)
+            self.record_sample = SAMPLES.add(pcm, fs, "recorded")
+            self._loop_changed()
+            if self.wave_window is not None and self.wave_src.get() == "recording":
+                self._load_waveform()
             messagebox.showinfo("Recording", "Sample captured! The metronome will now use your recording (pitch-shifted).")
         except Exception as e:
             messagebox.showerror("Recording failed", str(e))
 
+    # ---------- Live transcription ----------
+    def _toggle_transcribe(self):
+        if self.transcribe_on.get():
+            self._start_transcribe()
+        else:
+            self._stop_transcribe()
+
+    def _start_transcribe(self):
+        """Stream the mic through a Transcriber on a worker thread and place what it
+        hears on the snap grid, counting from the playhead (or the scrub position)."""
+        tr = self.transcriber = Transcriber()
+        start = self._transport_beat()
+        start = self.current_pos if start is None else start
+        snap = SNAPS.get(self.snap.get(), PPQ)
+        tempo_map, lane_hz = self.tempo_map, self.lane_hz
+        self._tx_in.clear()
+        self._tx_out.clear()
+        self._tx_lag = []
+        stop = self._tx_stop = threading.Event()
+
+        def capture(indata, frames, time_info, status):
+            self._tx_in.append((time.perf_counter(), bytes(indata)))
+
+        def analyse():
+            while not stop.is_set():
+                try:
+                    captured, raw = self._tx_in.popleft()
+                except IndexError:
+                    time.sleep(0.002)
+                    continue
+                block = array("f")
+                block.frombytes(raw)
+                for onset, freq, _level in tr.feed(block):
+                    slot = quantize_note(onset, freq, tempo_map, lane_hz, snap, start)
+                    if slot:
+                        self._tx_out.append(slot)
+                self._tx_lag.append(time.perf_counter() - captured)
+                if len(self._tx_lag) > 512:
+                    del self._tx_lag[:256]
+
+        try:
+            self._tx_stream = sd.InputStream(samplerate=tr.sr, channels=1, dtype="float32",
+                                             blocksize=AUDIO.block, callback=capture)
+            self._tx_stream.start()
+        except Exception as e:
+            self._tx_stream = None
+            self.transcribe_on.set(False)
+            messagebox.showerror("Transcribe", str(e))
+            return
+        threading.Thread(target=analyse, daemon=True).start()
+        self._poll_transcribe()
+
+    def _stop_transcribe(self):
+        if self._tx_stream is not None:
+            try:
+                self._tx_stream.stop()
+                self._tx_stream.close()
+            except Exception:
+                pass
+            self._tx_stream = None
+        if self._tx_stop is not None:
+            self._tx_stop.set()
+        if self._tx_poll_id:
+            self.after_cancel(self._tx_poll_id)
+            self._tx_poll_id = None
+        self._drain_transcribe()
+
+    def _poll_transcribe(self):
+        self._drain_transcribe()
+        lat = self.transcriber.latency()
+        if lat:
+            lag = sorted(self._tx_lag) or [0.0]
+            self.status_var.set(f"Transcribing: analysis {lat['mean_ms']:.2f} ms mean / {lat['max_ms']:.1f} ms max "
+                                f"per {lat['budget_ms']:.1f} ms block; mic→grid {1000 * lag[-1]:.0f} ms "
+                                f"+ {lat['decision_ms']:.0f} ms pitch window.")
+        self._tx_poll_id = self.after(50, self._poll_transcribe)
+
+    def _drain_transcribe(self):
+        """Place the notes the analysis thread found since the last poll, as one edit."""
+        slots = []
+        while self._tx_out:
+            slots.append(self._tx_out.popleft())
+        if not slots:
+            return
+        kind = self.current_tool.get()
+        kind = kind if kind in ("full", "half", "combo") else "full"
+        dur = NOTE_LENGTHS.get(self.note_len.get()) or KIND_TICKS.get(kind, PPQ)
+        vel = self._velocity()
+        self._apply_edits([("place", tick, lane, kind, dur, vel) for tick, lane in slots])
+
     def _play_recording(self):
-        if not self.record_sample_bytes:
+        if not self.record_sample:
             messagebox.showinfo("Recording", "No recording yet.")
             return
-        play_wav_bytes(self.record_sample_bytes)
+        data, sr = SAMPLES.get(self.record_sample)
+        if sys.byteorder != "little":
+            data = array("h", data)
+            data.byteswap()
+        play_wav_bytes(pcm16_to_wav(data.tobytes(), sr, channels=1))
 
     def _apply_pitch_map(self):
-        new_map = []
-        for e in self.pitch_entries:
-            s = e.get().strip()
-            if not s:
-                s = "A4"
-            new_map.append(s)
-        if len(new_map) == LANES:
-            self.lane_notes = new_map
-            self.status_var.set("Updated lane→pitch map.")
+        """Take the lane entries and tuning controls; a bad note or tuning is shown in
+        the panel and leaves the sound as it was."""
+        spec = dict(self.tuning, system=self.tuning_system.get(), ref_hz=self.tuning_ref.get().strip(),
+                    tonic=self.tuning_tonic.get())
+        try:
+            spec["ref_hz"] = float(spec["ref_hz"])
+        except ValueError:
+            pass  # from_spec reports it
+        notes = [e.get().strip() for e in self.pitch_entries]
+        if self._retune(spec, notes):
+            self.status_var.set(f"Updated lane→pitch map ({self._tuning_name}).")
+            self._loop_changed()
+
+    def _retune(self, spec, notes):
+        """Rebuild lane_hz from `spec` and `notes`, marking what fails in the panel.
+        Lanes that fail keep their previous pitch. True if anything was applied."""
+        try:
+            tuning = Tuning.from_spec(spec)
+        except TuningError as e:
+            self.pitch_msg.configure(text=f"Tuning: {e}")
+            return False
+        freqs, errors = tuning.lane_hz(notes)
+        for lane, e in enumerate(self.pitch_entries):
+            e.configure(bg="#f6d5d1" if lane in errors else self._entry_bg)
+        self.pitch_msg.configure(text="\n".join(f"Lane {lane + 1}: {msg} (keeps {self.lane_hz[lane]:.1f} Hz)"
+                                                for lane, msg in errors.items()))
+        self.tuning, self.lane_notes = spec, notes
+        self.lane_hz = tuple(self.lane_hz[lane] if f is None else f for lane, f in enumerate(freqs))
+        self._tuning_name = tuning.name
+        return True
+
+    def _show_tuning(self):
+        """Put the model's lane notes and tuning back in the panel and rebuild lane_hz."""
+        for e, note in zip(self.pitch_entries, self.lane_notes):
+            e.delete(0, "end")
+            e.insert(0, note)
+        self.tuning_system.set(self.tuning["system"])
+        ref = self.tuning["ref_hz"]
+        self.tuning_ref.set(f"{ref:g}" if isinstance(ref, (int, float)) else str(ref))
+        self.tuning_tonic.set(self.tuning["tonic"])
+        self._retune(self.tuning, self.lane_notes)
+
+    def _load_scala(self):
+        """Read a .scl scale, plus an optional .kbm keyboard map, into the tuning."""
+        paths = filedialog.askopenfilenames(title="Scala scale (.scl) and optional keyboard map (.kbm)",
+                                            filetypes=[("Scala files", "*.scl *.kbm"), ("All files", "*.*")])
+        if not paths:
+            return
+        spec = dict(self.tuning, system="Scala", kbm=None)
+        for path in paths:
+            key = "kbm" if path.lower().endswith(".kbm") else "scl"
+            try:
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    spec[key] = f.read()
+            except OSError as e:
+                self.pitch_msg.configure(text=f"Scala: {e}")
+                return
+        try:
+            Tuning.from_spec(spec)
+        except TuningError as e:
+            self.pitch_msg.configure(text=f"Scala: {e}")
+            return
+        self.tuning = spec
+        self.tuning_system.set("Scala")
+        self._apply_pitch_map()
+
+    # ---------- Projects ----------
+    def _save_project(self):
+        path = filedialog.asksaveasfilename(title="Save project", defaultextension=PROJECT_SUFFIX,
+                                            initialfile=os.path.basename(self.project_path or "sheet" + PROJECT_SUFFIX),
+                                            filetypes=[("Sheet42 project", "*" + PROJECT_SUFFIX)])
+        if not path:
+            return
+        proj = project_dict(self.events, self.tempo_map, self.lane_notes, self.waveform.get(),
+                            self.fx, self.dither.get(), self.instrument, self._feel(), self.tuning)
+        try:
+            save_project(path, proj)
+        except OSError as e:
+            messagebox.showerror("Save project", str(e))
+            return
+        self.project_path = path
+        self.journal.compact(self._journal_state())
+        note = " (the mic recording is not saved)" if self.record_sample and not self.instrument else ""
+        self.status_var.set(f"Saved {os.path.basename(path)}{note}.")
+
+    def _open_project(self):
+        path = filedialog.askopenfilename(title="Open project", filetypes=[("Sheet42 project", "*" + PROJECT_SUFFIX), ("All files", "*")])
+        if not path:
+            return
+        try:
+            proj = load_project(path)
+            events, tempo_map, instrument, _fx = project_model(proj)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Open project", str(e))
+            return
+        self._load_model(proj, events, tempo_map, instrument)
+        self.project_path = path
+        self._journal_seen = self._settings()
+        self.journal.compact(self._journal_state(), reset=True)  # undo stops at the opened file
+        self.status_var.set(f"Opened {os.path.basename(path)}: {len(events)} notes.")
+
+    def _load_model(self, proj, events, tempo_map, instrument):
+        """Replace the whole sheet with a checked project and its model."""
+        self._journal_seen = None  # loading is not an edit
+        self.stop()
+        if self.fx_window is not None:
+            self._close_effects()
+        self.fx_vars = {}
+        self.fx.configure(proj["effects"])  # the player holds on to this rack
+        if self.instrument is not None:
+            self.instrument.close()
+        self.events, self.tempo_map, self.instrument = events, tempo_map, instrument
+        self._show_bpm(tempo_map.bpms[0])
+        self.lane_notes, self.tuning = proj["lane_notes"], proj["tuning"]
+        self._show_tuning()
+        self.waveform.set(proj["waveform"])
+        self.dither.set(bool(proj.get("dither")))
+        self.swing.set(proj["feel"]["swing"])
+        self.humanize_ms.set(proj["feel"]["humanize_ms"])
+        self.flam_ms.set(proj["feel"]["flam_ms"])
+        self._on_dither_toggle()
+        self._redraw()
+        self._minimap_changed(range(BARS))
+        self._tempo_changed()
+
+    # ---------- Journal ----------
+    def _settings(self):
+        return project_settings(self.tempo_map, self.lane_notes, self.waveform.get(), self.fx,
+                                self.dither.get(), self.instrument, self._feel(), self.tuning)
+
+    def _journal_state(self):
+        proj = project_dict(self.events, self.tempo_map, self.lane_notes, self.waveform.get(),
+                            self.fx, self.dither.get(), self.instrument, self._feel(), self.tuning)
+        proj["path"] = self.project_path
+        return proj
+
+    def _journal_settings(self):
+        """Journal the settings that differ from the last recorded ones, as one change."""
+        if self._journal_seen is None:
+            return
+        cur = self._settings()
+        self.journal.record([["set", key, self._journal_seen.get(key), val]
+                             for key, val in cur.items() if self._journal_seen.get(key) != val])
+        self._journal_seen = cur
+
+    def _recover_session(self):
+        """Bring back the sheet the last session left, saved or not, then start
+        a fresh log over it and keep it synced and compacted in the background."""
+        state = self.journal.recover()
+        if state is not None:
+            path = state.pop("path", None)
+            try:
+                proj = check_project(state, self.journal.dir)
+                try:
+                    model = project_model(proj)
+                except (OSError, ValueError):
+                    proj["instrument"] = None  # the sample bank has gone; keep the notes
+                    model = project_model(proj)
+            except (OSError, ValueError) as e:
+                self.status_var.set(f"Could not recover the last session: {e}")
+                self.journal.history, self.journal.cursor = [], 0
+            else:
+                self._load_model(proj, *model[:3])
+                self.project_path = path
+                if len(self.events) or self.journal.history:
+                    name = os.path.basename(path) if path else "unsaved sheet"
+                    self.status_var.set(f"Recovered {name}: {len(self.events)} notes (Ctrl+Z undoes edits).")
+        self._journal_seen = self._settings()
+        self.journal.compact(self._journal_state())
+        self._journal_tick()
+
+    def _journal_tick(self):
+        self.journal.sync()
+        if self.journal.needs_compact():
+            self.journal.compact(self._journal_state())
+        if self.journal.error and not self._journal_warned:
+            self._journal_warned = True
+            self.status_var.set(f"Autosave is off: {self.journal.error}")
+        self.after(int(JOURNAL_SYNC_SECS * 1000), self._journal_tick)
+
+    def _undo(self):
+        self._end_stroke(None)  # a stroke in progress becomes the change to undo
+        ops = self.journal.undo()
+        if ops is None:
+            self.status_var.set("Nothing to undo.")
+            return
+        self._replay(ops, undo=True)
+
+    def _redo(self):
+        self._end_stroke(None)
+        ops = self.journal.redo()
+        if ops is None:
+            self.status_var.set("Nothing to redo.")
+            return
+        self._replay(ops)
+
+    def _replay(self, ops, undo=False):
+        """Apply a journalled change (or revert it) to the sheet without journalling it again."""
+        edits, settings = [], {}
+        for op in (reversed(ops) if undo else ops):
+            val = op[-2] if undo else op[-1]
+            if op[0] == "ev":
+                edits.append(("erase", op[1], op[2]) if val is None else ("place", op[1], op[2], *val))
+            else:
+                settings[op[1]] = val
+        self._journal_seen = None
+        try:
+            self._apply_edits(edits, record=False)
+            for key, val in settings.items():
+                self._apply_setting(key, val)
+        finally:
+            self._journal_seen = self._settings()
+        what = f"{len(edits)} note edit(s)" if edits else ", ".join(settings)
+        self.status_var.set(f"{'Undid' if undo else 'Redid'} {what}.")
+
+    def _apply_setting(self, key, val):
+        if key == "tempo":
+            tempo_map = self.tempo_map = tempo_from_points(val)
+            self._show_bpm(tempo_map.bpms[0])
+            self._tempo_changed()
+        elif key in ("lane_notes", "tuning"):
+            if key == "tuning":
+                self.tuning = dict(TUNING_DEFAULT, **val)
+            else:
+                self.lane_notes = list(val)
+            self._show_tuning()
+            self._loop_changed()
+        elif key == "waveform":
+            self.waveform.set(val)
+        elif key == "dither":
+            self.dither.set(bool(val))
+            self._on_dither_toggle()
+        elif key == "feel":
+            self.swing.set(val["swing"])
+            self.humanize_ms.set(val["humanize_ms"])
+            self.flam_ms.set(val["flam_ms"])
+            self._loop_changed()
+        elif key == "effects":
+            if self.fx_window is not None:
+                self._close_effects()
+            self.fx_vars = {}
+            self.fx.configure(val)
+            self._effects_changed()
+        elif key == "instrument":
+            if self.instrument is not None:
+                self.instrument.close()
+            self.instrument = None
+            if val:
+                try:
+                    self.instrument = load_instrument(val)
+                except (OSError, ValueError) as e:
+                    self.status_var.set(f"Instrument not restored: {e}")
+            self._loop_changed()
+
+    def _on_close(self):
+        self._end_stroke(None)
+        self.journal.close()
+        self._stop_engine()
+        self._stop_sync()
+        self.destroy()
 
     # ---------- Help ----------
     def _show_help(self):
         tip = (
             "Quick guide:\n"
             "• 42 bars × 4 beats; 4 lines + 4 gaps = 8 lanes (pitch lanes low→high).\n"
-            "• Tools: Full(●) = 1 beat, Half(○) = 1/2 beat, Combo(◍) = 2×1/2 within the beat, Rest(⟂).\n"
-            "• Left-click to place on the nearest lane at that bar/beat; Right-click to erase.\n"
-            "• Timeline: Play/Pause/Stop and scrub to any beat.\n"
+            "• Tools: Full(●) = 1 beat, Half(○) = 1/2 beat, Combo(◍) = two equal strikes over its length\n"
+            "  (1 beat unless Len says otherwise), Rest(⟂).\n"
+            "• Snap picks the grid (quarters down to 16th triplets); Len overrides the tool's length.\n"
+            "• Left-click to place on the nearest lane at that grid point; Right-click to erase.\n"
+            "  Drag with either button to paint or erase across many slots.\n"
+            "• Timeline: Play/Pause/Stop and scrub to any beat. The strip under the sheet shows the\n"
+            "  whole score; click or drag it to jump there.\n"
+            "• Zoom with −/+ (or Ctrl+wheel, Ctrl+-/=). Zoomed out, bars show as density blocks and\n"
+            "  labels thin out; note glyphs come back as you zoom in.\n"
+            "• Tempo: the BPM slider is the starting tempo; add changes or ramps at any bar in the Tempo row.\n"
+            "  Swing %, Human ms and Flam ms on the same row shape the feel; every strike is placed\n"
+            "  sample-accurately inside its rendered beat.\n"
+            "• Loop: tick Loop and set A/B (buttons use the current beat, or Shift+Left/Right-click a beat).\n"
+            "  The region is pre-rendered once and played back gaplessly; edits re-render only the changed beats.\n"
             "• Sample Engine: choose sine/square/saw (or record mic if available). Lane decides pitch.\n"
-            "  Edit the Lane→Pitch row to set note names (e.g., G3, G#3, A3, ...).\n"
+            "• Lane→Pitch takes note names (C4, F#3, A4+14c for cents) or key numbers, tuned by 12-TET at\n"
+            "  any A4, just intonation on a tonic, or a Scala .scl scale with optional .kbm map (Scala…).\n"
+            "  Entries that don't fit are marked in the panel and keep their old pitch.\n"
             "• Recording is optional and depends on 'sounddevice'. Without it, the synth is used.\n"
+            "• Load Instrument… reads a JSON bank of WAV samples with root/lo/hi pitches and vel layers;\n"
+            "  each lane plays its nearest sample. Vel (Tools) sets the velocity of new notes.\n"
+            "• Import WAV… takes 8/16/24/32-bit or float WAVs, any rate or channel count, of any size;\n"
+            "  it is converted in the background and played like a recording (A4 reference).\n"
+            "• Transcribe (with 'sounddevice') listens to the mic and places the notes it hears on the\n"
+            "  snap grid and nearest lane, from the playhead; `sheet42.py transcribe FILE.wav` does the same offline.\n"
+            "• Sync (Lead/Follow) locks tempo, beat phase and start/stop across instances on the local\n"
+            "  network by UDP multicast; followers show the leader's clock offset, jitter and phase error.\n"
+            "  `sheet42.py sync lead|follow --iface 127.0.0.1` runs headless peers to test it on one machine.\n"
+            "• Engine process moves audio output into its own process, fed through shared memory, so\n"
+            "  a busy UI no longer makes the sound stutter. Underruns, if any, show in the status bar.\n"
+            "• Audio… picks the sample rate, block size and quality (Kiosk/Light/Standard/Studio presets);\n"
+            "  lower tiers cut CPU on slow machines. Measure CPU times each preset here; the choice is\n"
+            "  remembered, and `sheet42.py profiles` prints the same table without a display.\n"
+            "• Every edit is journalled as you go (a drag is one edit): Undo/Redo (Ctrl+Z / Ctrl+Y) have\n"
+            "  no limit while the app runs, and the sheet comes back as you left it after closing the\n"
+            f"  window or a crash, with its last {JOURNAL_KEEP} edits still undoable. Each open window keeps its own.\n"
+            "• Open…/Save… keep a sheet as a .s42 project; `sheet42.py render DIR_OR_FILES` bounces\n"
+            "  projects to WAV from the command line, in parallel and without a display.\n"
+            "• Waveform… shows the recording, the instrument's sample or the synth note; zoom with the wheel,\n"
+            "  drag a selection, then Trim to Selection or Normalize to edit the recording in place.\n"
+            "• Effects…: filter, delay and reverb inserts per kind (Full/Half/Combo) and on the master.\n"
+            "  With 'sounddevice' (or the engine process) they run live on all playback, loop or not;\n"
+            "  without it they apply to loops only, pre-rendered into the loop buffer.\n"
+            "• Headless: SHEET42_AUDIO=null discards sound but timestamps it; SHEET42_AUDIO=capture:out.wav\n"
+            "  writes everything played to out.wav, with a timing log in out.log (not the engine process).\n"
             "\n"
             "Note: Playback uses simple built-in methods; on some systems a system player (afplay/aplay/ffplay) may be used.\n"
         )
         messagebox.showinfo("Help", tip)
 
-# --------- Simple resampler for recorded wav (very naive) ---------
-def read_wav_params(wav_bytes):
-    # Minimal parser assuming PCM16 mono
-    f = io.BytesIO(wav_bytes)
-    if f.read(4) != b"RIFF":
-        return None
-    f.read(4)  # size
-    if f.read(4) != b"WAVE":
-        return None
-    sr = 44100
-    channels = 1
-    bits = 16
-    data = None
-    # parse chunks
-    while True:
-        hdr = f.read(4)
-        if not hdr:
-            break
-        size_bytes = f.read(4)
-        if len(size_bytes) < 4:
-            break
-        size = struct.unpack("<I", size_bytes)[0]
-        if hdr == b"fmt ":
-            fmt = f.read(size)
-            (audio_fmt, channels, sr, br, ba, bits) = struct.unpack("<HHIIHH", fmt[:16])
-        elif hdr == b"data":
-            data = f.read(size)
-        else:
-            f.seek(size, 1)
-    return {"sr": sr, "channels": channels, "bits": bits, "data": data}
-
-def naive_resample_wav(wav_bytes, ratio):
-    p = read_wav_params(wav_bytes)
-    if not p or not p["data"]:
-        return wav_bytes
-    data = p["data"]
-    sr = p["sr"]
-    # Unpack int16 mono
-    n = len(data)//2
-    ints = struct.unpack("<%dh" % n, data)
-    # Resample by skipping/duplicating (nearest neighbor)
-    out = []
-    i = 0.0
-    step = 1.0/ratio if ratio > 0 else 1.0
-    while int(i) < n:
-        out.append(ints[int(i)])
-        i += step
-    # Pack back
-    out_bytes = struct.pack("<%dh" % len(out), *out)
-    return pcm16_to_wav(out_bytes, sr, channels=1)
+# -------------- Batch render (CLI) --------------
 
-if __name__ == "__main__":
-    app = Sheet42()
+def render_job(path, out_dir=None, sr=None, block=None, quality=None):
+    """Render one project to a WAV next to it (or into out_dir). Runs in a pool
+    worker, so it returns a plain result dict instead of raising."""
+    AUDIO.configure(sr, block, quality)  # the worker's own copy of the profile
+    sr = AUDIO.sr
+    out = os.path.join(out_dir or os.path.dirname(os.path.abspath(path)),
+                       os.path.splitext(os.path.basename(path))[0] + ".wav")
+    result = {"project": path, "output": out, "ok": False}
+    t0 = time.perf_counter()
+    try:
+        proj = load_project(path)
+        stats = {}
+        samples = render_project(proj, sr, stats=stats)
+        with open(out, "wb") as f:
+            f.write(pcm16_to_wav(quantize_pcm16(samples, proj.get("dither")), sr, channels=1))
+        result.update(stats, ok=True, audio_secs=len(samples) / sr)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["render_secs"] = time.perf_counter() - t0
+    return result
+
+def find_projects(paths):
+    """Expand directories to the project files directly inside them."""
+    found = []
+    for p in paths:
+        if os.path.isdir(p):
+            found += sorted(os.path.join(p, name) for name in os.listdir(p) if name.endswith(PROJECT_SUFFIX))
+        else:
+            found.append(p)
+    return found
+
+def render_cli(argv):
+    """`sheet42.py render ...`: bounce projects to WAV on a process pool, with
+    no display needed. Prints a line per file, then the totals; exit status 1
+    if any project failed."""
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    ap = argparse.ArgumentParser(prog="sheet42.py render", description="Render projects to WAV.")
+    ap.add_argument("projects", nargs="+", help=f"project files or directories of *{PROJECT_SUFFIX} files")
+    ap.add_argument("-o", "--out-dir", help="write WAVs here instead of next to each project")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes (default: CPUs)")
+    ap.add_argument("--profile", choices=list(AUDIO_PROFILES), default="Standard",
+                    help="audio profile preset; --sr/--block/--quality override its parts")
+    ap.add_argument("--sr", type=int, choices=SAMPLE_RATES, help="output sample rate")
+    ap.add_argument("--block", type=int, choices=BLOCK_SIZES, help="effects block size in frames")
+    ap.add_argument("--quality", choices=QUALITIES, help="resampling and oscillator quality")
+    ap.add_argument("--json", metavar="PATH", help="write a JSON summary here ('-' for stdout)")
+    args = ap.parse_args(argv)
+    profile = dict(AUDIO_PROFILES[args.profile])
+    profile.update({k: getattr(args, k) for k in profile if getattr(args, k) is not None})
+
+    paths = find_projects(args.projects)
+    if not paths:
+        ap.error("no project files found")
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    log = sys.stderr if args.json == "-" else sys.stdout
+    results = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = [pool.submit(render_job, p, args.out_dir, profile["sr"], profile["block"],
+                               profile["quality"]) for p in paths]
+        for fut in as_completed(futures):
+            r = fut.result()
+            results.append(r)
+            if r["ok"]:
+                rtf = r["audio_secs"] / r["render_secs"] if r["render_secs"] else 0.0
+                print(f"ok    {r['project']} -> {r['output']}  {r['audio_secs']:.1f} s audio in "
+                      f"{r['render_secs']:.2f} s ({rtf:.1f}x real time, "
+                      f"{r['unique_bars']}/{r['bars']} bars unique)", file=log)
+            else:
+                print(f"FAIL  {r['project']}: {r['error']}", file=log)
+    wall = time.perf_counter() - t0
+    audio = sum(r.get("audio_secs", 0.0) for r in results)
+    failed = [r for r in results if not r["ok"]]
+    summary = {
+        "files": len(results),
+        "failed": len(failed),
+        "jobs": args.jobs,
+        "profile": profile,
+        "wall_secs": round(wall, 3),
+        "audio_secs": round(audio, 3),
+        "realtime_factor": round(audio / wall, 2) if wall else None,
+        "results": sorted(results, key=lambda r: r["project"]),
+    }
+    print(f"{len(results) - len(failed)}/{len(results)} rendered; {audio:.1f} s of audio in {wall:.2f} s "
+          f"({summary['realtime_factor']}x real time, {args.jobs} jobs)", file=log)
+    if args.json == "-":
+        json.dump(summary, sys.stdout, indent=1)
+        print()
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
+    return 1 if failed else 0
+
+def transcribe_cli(argv):
+    """`sheet42.py transcribe FILE.wav`: run a recording through the live
+    transcription path and print the notes found and the per-block latency."""
+    import argparse
+    ap = argparse.ArgumentParser(prog="sheet42.py transcribe", description="Transcribe a WAV onto the grid.")
+    ap.add_argument("wav")
+    ap.add_argument("--bpm", type=float, default=100.0)
+    ap.add_argument("--snap", choices=tuple(SNAPS), default="1/8")
+    ap.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = ap.parse_args(argv)
+    try:
+        found, tr = transcribe_wav(args.wav, TempoMap(args.bpm), DEFAULT_LANE_HZ, SNAPS[args.snap])
+    except (OSError, ValueError) as e:
+        print(f"{args.wav}: {e}", file=sys.stderr)
+        return 1
+    lat = tr.latency()
+    if args.json:
+        json.dump({"notes": [{"tick": t, "lane": l, "note": DEFAULT_LANE_NOTES[l], "hz": round(f, 2),
+                              "onset_secs": round(o, 4)} for t, l, f, o in found],
+                   "unpitched": tr.unpitched, "latency": lat}, sys.stdout, indent=1)
+        print()
+    else:
+        for tick, lane, freq, onset in found:
+            bar, beat = divmod(tick / PPQ, BEATS_PER_BAR)
+            print(f"{onset:8.3f} s  bar {int(bar) + 1} beat {beat + 1:<6g} {DEFAULT_LANE_NOTES[lane]:<4} ({freq:.1f} Hz)")
+        if lat:
+            print(f"{len(found)} notes; analysis {lat['mean_ms']:.2f} ms mean, {lat['p95_ms']:.2f} ms p95, "
+                  f"{lat['max_ms']:.2f} ms max per {lat['budget_ms']:.1f} ms block")
+    return 0
+
+def sync_cli(argv):
+    """`sheet42.py sync lead|follow`: a headless transport on the sync protocol.
+    Prints peer offset, round trip and jitter (and, following, the phase error)
+    once a second; several on one machine with --iface 127.0.0.1 test the whole
+    protocol without a network or sound card."""
+    import argparse
+    ap = argparse.ArgumentParser(prog="sheet42.py sync", description="Run a headless sync peer.")
+    ap.add_argument("role", choices=("lead", "follow"))
+    ap.add_argument("--bpm", type=float, default=120.0)
+    ap.add_argument("--secs", type=float, default=10.0, help="how long to run")
+    ap.add_argument("--group", default=SYNC_GROUP)
+    ap.add_argument("--port", type=int, default=SYNC_PORT)
+    ap.add_argument("--iface", default="0.0.0.0", help="interface address to join on, e.g. 127.0.0.1")
+    ap.add_argument("--skew", type=float, default=0.0, help="seconds added to this peer's clock, to check the offset estimate")
+    ap.add_argument("--start-beat", type=float, default=0.0, help="initial phase, to watch a follower pull in")
+    ap.add_argument("--json", action="store_true", help="print a JSON summary at the end")
+    args = ap.parse_args(argv)
+    clock = lambda: time.perf_counter() + args.skew
+    try:
+        sync = TransportSync(args.group, args.port, args.iface, clock=clock)
+    except OSError as e:
+        print(f"sync: {e}", file=sys.stderr)
+        return 1
+    tempo_map, total = TempoMap(args.bpm), BARS * BEATS_PER_BAR
+    anchor = [clock(), args.start_beat]  # (clock, beat) the transport runs from
+    beat_at = lambda now: tempo_map.time_to_beat(tempo_map.beat_to_time(anchor[1]) + now - anchor[0])
+    err = None
+    seeks = 0
+    end = next_report = clock()
+    end += args.secs
     try:
-        app.mainloop()
+        while clock() < end:
+            leader = sync.poll()
+            now = clock()
+            lead = {"playing": True, "beat": beat_at(now) % total, "tempo": [list(p) for p in tempo_map.points()]}
+            sync.send(lead if args.role == "lead" else None)
+            if args.role == "follow" and leader is not None:
+                if not same_tempo(leader.state["lead"]["tempo"], tempo_map.points()):
+                    anchor[:] = [now, beat_at(now)]  # keep our place across the change
+                    tempo_map = tempo_from_points(leader.state["lead"]["tempo"])
+                target = leader_beat(leader, now, tempo_map)
+                err = beat_error(beat_at(now), target, total)
+                if abs(err) > SYNC_JUMP:
+                    anchor[:] = [now, target % total]
+                    seeks += 1
+                else:
+                    anchor[0] += phase_nudge(err * tempo_map.beat_secs(int(target)))
+            if now >= next_report:
+                next_report += 1.0
+                peers = "  ".join(f"{p.node} offset {p.offset * 1000:+.3f} ms rtt {p.delay * 1000:.3f} ms "
+                                  f"jitter {p.jitter * 1000:.3f} ms" for p in sync.peers.values() if p.synced)
+                phase = f"phase {err * tempo_map.beat_secs(0) * 1000:+.3f} ms  " if err is not None else ""
+                print(f"{args.role} {sync.node}: {phase}{peers or 'no peers yet'}", flush=True)
+            time.sleep(1.0 / SYNC_HZ)
     except KeyboardInterrupt:
         pass
+    finally:
+        sync.close()
+    if args.json:
+        json.dump({"node": sync.node, "role": args.role, "seeks": seeks,
+                   "tempo": [list(p) for p in tempo_map.points()],
+                   "phase_ms": None if err is None else err * tempo_map.beat_secs(0) * 1000,
+                   "peers": {p.node: {"offset_ms": p.offset * 1000, "rtt_ms": p.delay * 1000, "jitter_ms": p.jitter * 1000}
+                             for p in sync.peers.values() if p.synced}}, sys.stdout, indent=1)
+        print()
+    return 0
+
+def profiles_cli(argv):
+    """`sheet42.py profiles`: measure each audio profile's CPU cost on this
+    machine, to pick one a slow computer can play without dropouts."""
+    import argparse
+    ap = argparse.ArgumentParser(prog="sheet42.py profiles", description="Measure CPU per audio profile.")
+    ap.add_argument("--secs", type=float, default=4.0, help="seconds of audio per measurement")
+    args = ap.parse_args(argv)
+    for name, p in AUDIO_PROFILES.items():
+        cpu = profile_cpu(p["sr"], p["block"], p["quality"], args.secs)
+        print(f"{name:<9}{p['sr']:>6} Hz {p['block']:>5} frames {p['quality']:<9}"
+              f"{cpu * 1000:6.0f} ms CPU per s of audio ({cpu * 100:.0f}% of a core)")
+    return 0
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "render":
+        return render_cli(argv[1:])
+    if argv and argv[0] == "transcribe":
+        return transcribe_cli(argv[1:])
+    if argv and argv[0] == "sync":
+        return sync_cli(argv[1:])
+    if argv and argv[0] == "profiles":
+        return profiles_cli(argv[1:])
+    if tk is None:
+        sys.exit("tkinter is not available; only the 'render', 'transcribe', 'sync' and 'profiles' commands work here.")
+    open_sink()  # $SHEET42_AUDIO, before any player is built
+    try:
+        app = Sheet42()
+        try:
+            app.mainloop()
+        except KeyboardInterrupt:
+            pass
+    finally:
+        open_sink("")  # a capture writes its WAV here
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,8 +5,9 @@
 
 import tkinter as tk
 from tkinter import ttk, font, messagebox
-import sys, math, time, struct, io, os, tempfile, subprocess, threading
+import sys, math, time, io, os, hashlib, tempfile, subprocess, threading, operator
 import wave
+from array import array
 
 APP_TITLE = "Four-Line Sheet — 42 Bars (Sampler)"
 BARS = 42
@@ -70,38 +71,134 @@ WAV_FORMS = {
     "click": None,  # special
 }
 
-def synth_wave_bytes(waveform="click", freq=880.0, dur_ms=120, volume=0.6, sr=44100):
+SAMPLE_RATE = 44100
+BLOCK_SIZE = 512  # frames per mic read
+SAMPLE_RATES = (22050, 32000, 44100, 48000)
+BLOCK_SIZES = (128, 256, 512, 1024, 2048)
+QUALITIES = ("fast", "standard", "high")  # wavetable / computed / band-limited oscillators
+AUDIO_PROFILES = {  # named presets, the same as sheet42.py's; any combination can be set
+    "Kiosk": {"sr": 22050, "block": 1024, "quality": "fast"},
+    "Light": {"sr": 32000, "block": 1024, "quality": "standard"},
+    "Standard": {"sr": SAMPLE_RATE, "block": BLOCK_SIZE, "quality": "standard"},
+    "Studio": {"sr": 48000, "block": 256, "quality": "high"},
+}
+
+class AudioConfig:
+    """Output rate, block size and quality tier, read from the one instance,
+    AUDIO, by the synth, the mic and the sinks whenever no value is passed."""
+    def __init__(self, sr=SAMPLE_RATE, block=BLOCK_SIZE, quality="standard"):
+        self.sr, self.block, self.quality = sr, block, quality
+
+    def configure(self, sr=None, block=None, quality=None):
+        sr, block = int(sr or self.sr), int(block or self.block)
+        quality = quality or self.quality
+        if sr not in SAMPLE_RATES or block not in BLOCK_SIZES or quality not in QUALITIES:
+            raise ValueError(f"unsupported audio profile: {sr} Hz, {block} frames, {quality}")
+        self.sr, self.block, self.quality = sr, block, quality
+
+    def settings(self):
+        return {"sr": self.sr, "block": self.block, "quality": self.quality}
+
+    def name(self):
+        return next((k for k, v in AUDIO_PROFILES.items() if v == self.settings()), "Custom")
+
+AUDIO = AudioConfig()
+
+WAVETABLE_SIZE = 1024
+_WAVETABLES = {}  # waveform -> one cycle, built on first "fast" use
+
+def _wavetable(waveform):
+    table = _WAVETABLES.get(waveform)
+    if table is None:
+        osc = WAV_FORMS.get(waveform) or _sine
+        table = _WAVETABLES[waveform] = [osc(i / WAVETABLE_SIZE, 1.0) for i in range(WAVETABLE_SIZE)]
+    return table
+
+def _blep(t, dt):
+    """PolyBLEP residual at phase t for a step at phase 0; dt is the phase step per sample."""
+    if t < dt:
+        t /= dt
+        return t + t - t*t - 1.0
+    if t > 1.0 - dt:
+        t = (t - 1.0) / dt
+        return t*t + t + t + 1.0
+    return 0.0
+
+def synth_wave_bytes(waveform="click", freq=880.0, dur_ms=120, volume=0.6, sr=None, quality=None):
     """Return 16-bit mono WAV bytes for a short tone/click."""
+    sr = sr or AUDIO.sr
+    return pcm16_wav_bytes(synth_wave_pcm(waveform, freq, dur_ms, volume, sr, quality), sr)
+
+def synth_wave_pcm(waveform="click", freq=880.0, dur_ms=120, volume=0.6, sr=None, quality=None):
+    """Same tone as synth_wave_bytes, as a native int16 array for the sample store.
+    "fast" reads a one-cycle wavetable, "high" band-limits square and saw."""
+    sr = sr or AUDIO.sr
+    quality = quality or AUDIO.quality
     n_samples = max(1, int(sr * (dur_ms/1000.0)))
-    frames = bytearray()
+    vals = []  # float samples; quantized once at the end
     if waveform == "click":
         # short decaying noise burst
         import random
         for i in range(n_samples):
             env = math.exp(-6.0 * i / n_samples)  # fast decay
-            v = (random.random()*2 - 1) * env * volume
-            val = max(-1.0, min(1.0, v))
-            frames += struct.pack("<h", int(val * 32767))
+            vals.append((random.random()*2 - 1) * env * volume)
+    elif quality == "fast":
+        table, step = _wavetable(waveform), freq * WAVETABLE_SIZE / sr
+        vals = [table[int(i * step) % WAVETABLE_SIZE] * volume for i in range(n_samples)]
     else:
         osc = WAV_FORMS.get(waveform, _sine)
+        blep = quality == "high" and waveform in ("square", "saw")
+        dt = freq / sr
         for i in range(n_samples):
             t = i / sr
-            env = 1.0
-            # quick fade to avoid clicks
-            if i < 32:
-                env *= i/32.0
-            if i > n_samples-32:
-                env *= (n_samples - i)/32.0
-            v = osc(t, freq) * volume * env
-            val = max(-1.0, min(1.0, v))
-            frames += struct.pack("<h", int(val * 32767))
-    # build wav
+            v = osc(t, freq)
+            if blep:
+                ph = (t*freq) % 1.0
+                v -= _blep(ph, dt)
+                if waveform == "square":
+                    v += _blep((ph + 0.5) % 1.0, dt)
+            vals.append(v * volume)
+    if waveform != "click":  # quick fade to avoid clicks
+        for i in range(min(32, n_samples)):
+            vals[i] *= i/32.0
+        for i in range(max(0, n_samples-31), n_samples):
+            vals[i] *= (n_samples - i)/32.0
+    return quantize_i16(vals)
+
+def profile_cpu(sr, block, quality, secs=1.0):
+    """CPU seconds per second of audio for a profile: a tone per beat in every
+    waveform (at 120 BPM), mixed onto one timeline in blocks the way
+    CaptureSink mixes what is played."""
+    t0 = time.process_time()
+    beat = sr // 2
+    mix = array("i", bytes(4 * int(secs * sr + sr)))
+    for b in range(max(1, int(secs * 2))):
+        for wf in ("sine", "square", "triangle", "saw", "click"):
+            data = synth_wave_pcm(wf, 440.0 + 110 * b, 120, 0.3, sr, quality)
+            for s in range(0, len(data), block):
+                at = b * beat + s
+                chunk = data[s:s + block]
+                mix[at:at + len(chunk)] = array("i", map(operator.add, mix[at:at + len(chunk)], chunk))
+    return (time.process_time() - t0) / secs
+
+def quantize_i16(samples):
+    """Float samples -> native int16 array, clipped; the only int16 step."""
+    return array("h", (int(max(-1.0, min(1.0, v)) * 32767) for v in samples))
+
+def pcm16_le_bytes(data):
+    """A native int16 array as little-endian bytes (what WAV and the players want)."""
+    if sys.byteorder != "little":
+        data = array("h", data)
+        data.byteswap()
+    return data.tobytes()
+
+def pcm16_wav_bytes(data, sr):
     bio = io.BytesIO()
     with wave.open(bio, "wb") as wf:
         wf.setnchannels(1)
         wf.setsampwidth(2)
         wf.setframerate(sr)
-        wf.writeframes(bytes(frames))
+        wf.writeframes(pcm16_le_bytes(data))
     return bio.getvalue()
 
 def write_wav_to_temp(wav_bytes, name_hint="sample"):
@@ -111,11 +208,77 @@ def write_wav_to_temp(wav_bytes, name_hint="sample"):
         f.write(wav_bytes)
     return path
 
-class AudioOut:
-    """Tiny audio dispatcher; uses simpleaudio if present, else winsound, else system player."""
+AUDIO_ENV = "SHEET42_AUDIO"  # "null" or "capture:PATH.wav" picks a headless sink
+
+class NullSink:
+    """Discards what is played but timestamps it: `log` holds (secs since start,
+    frames, sr) per buffer, enough to check timing or benchmark without a device."""
     def __init__(self):
+        self.t0 = time.perf_counter()
+        self.log = []
+        self.frames = 0
+        self.lock = threading.Lock()  # mic recordings play from their own thread
+
+    def play(self, data, sr):
+        with self.lock:
+            t = time.perf_counter() - self.t0
+            self.log.append((t, len(data), sr))
+            self.frames += len(data)
+            self._keep(t, data, sr)
+
+    def _keep(self, t, data, sr):
+        pass
+
+    def close(self):
+        pass
+
+class CaptureSink(NullSink):
+    """A NullSink that also keeps the audio: each buffer is mixed onto one timeline
+    at its timestamp, written to `path` as a WAV on close. The event log goes to
+    the same name with .log, a line per buffer as it is played."""
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.sr = None  # the first buffer's rate; later ones are resampled to it
+        self.mix = array("i")
+        self._log = open(os.path.splitext(path)[0] + ".log", "w")
+        self._log.write("secs\tframe\tframes\tsr\n")
+
+    def _keep(self, t, data, sr):
+        if self.sr is None:
+            self.sr = sr
+        if sr != self.sr:  # nearest-sample resample, so the timeline stays in seconds
+            step = sr / self.sr
+            data = [data[int(i * step)] for i in range(int(len(data) / step))]
+        at = int(round(t * self.sr))
+        end = at + len(data)
+        if end > len(self.mix):
+            self.mix.extend(array("i", bytes(4 * (end - len(self.mix)))))
+        self.mix[at:end] = array("i", map(operator.add, self.mix[at:end], data))
+        self._log.write(f"{t:.6f}\t{at}\t{len(data)}\t{sr}\n")
+        self._log.flush()
+
+    def close(self):
+        with self.lock:
+            if self._log.closed:
+                return
+            self._log.close()
+            pcm = array("h", (max(-32768, min(32767, v)) for v in self.mix))
+            with open(self.path, "wb") as f:
+                f.write(pcm16_wav_bytes(pcm, self.sr or AUDIO.sr))
+
+class AudioOut:
+    """Tiny audio dispatcher; uses simpleaudio if present, else winsound, else system player.
+    `sink` (default: $SHEET42_AUDIO) of "null" or "capture:PATH.wav" replaces all of them."""
+    def __init__(self, sink=None):
         self.backend = "none"
-        if sa is not None:
+        self.sink = None
+        sink = os.environ.get(AUDIO_ENV, "") if sink is None else sink
+        if sink == "null":
+            self.backend, self.sink = "null", NullSink()
+        elif sink.startswith("capture:"):
+            self.backend, self.sink = sink, CaptureSink(sink[len("capture:"):])
+        elif sa is not None:
             self.backend = "simpleaudio"
         elif winsound is not None and os.name == "nt":
             self.backend = "winsound"
@@ -137,7 +300,28 @@ class AudioOut:
                 pass
         return None
 
+    def play_samples(self, data, sr):
+        """Play a native int16 array; simpleaudio takes it without a WAV wrapper."""
+        if self.sink is not None:
+            self.sink.play(data, sr)
+            return
+        if self.backend == "simpleaudio":
+            try:
+                sa.play_buffer(pcm16_le_bytes(data), 1, 2, sr)
+                return
+            except Exception:
+                pass
+        self.play_wav_bytes(pcm16_wav_bytes(data, sr))
+
     def play_wav_bytes(self, wav_bytes):
+        if self.sink is not None:
+            with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
+                data = array("h", wf.readframes(wf.getnframes()))
+                sr = wf.getframerate()
+            if sys.byteorder != "little":
+                data.byteswap()
+            self.sink.play(data, sr)
+            return
         if self.backend == "simpleaudio":
             try:
                 with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
@@ -167,6 +351,11 @@ class AudioOut:
                 pass
         return
 
+    def close(self):
+        """Finish the sink (a capture writes its WAV here)."""
+        if self.sink is not None:
+            self.sink.close()
+
 def safe_remove(path):
     try:
         os.remove(path)
@@ -174,6 +363,225 @@ def safe_remove(path):
         pass
 
 
+# ---------------- Sample store ----------------
+
+SAMPLE_BUDGET = 32 * 1024 * 1024  # bytes of samples kept before unpinned ones are evicted
+
+class SampleStore:
+    """Raw sample buffers (array('h') PCM16 or float32) with shared metadata,
+    deduplicated by content and reference-counted.
+
+    The same buffer added twice is kept once. Holders pin an entry with add()
+    or acquire() and unpin it with release(). Unpinned entries stay on as a
+    cache until the store outgrows its byte budget; then the least recently
+    used of them are dropped. Pinned entries are never evicted. Memory is
+    tracked per category ("generated", "recorded", "cached"), current and
+    peak."""
+    CATEGORIES = ("generated", "recorded", "cached")
+
+    def __init__(self, budget=SAMPLE_BUDGET):
+        self.budget = budget
+        self._entries = {}  # digest -> {"data", "sr", "category", "refs", "nbytes", "names"}, oldest use first
+        self._names = {}    # alias (e.g. a render-cache key) -> digest
+        self.current = dict.fromkeys(self.CATEGORIES, 0)
+        self.peak = dict.fromkeys(self.CATEGORIES, 0)
+        self.peak_total = 0
+        self.deduped = 0
+        self.evicted = 0
+
+    @staticmethod
+    def digest(data, sr):
+        code = getattr(data, "typecode", None) or data.format
+        h = hashlib.sha1(f"{code}:{sr}:".encode())
+        h.update(data)
+        return h.hexdigest()
+
+    def total(self):
+        return sum(self.current.values())
+
+    def add(self, data, sr, category, name=None, pin=True):
+        """Store a buffer (or find its twin) and return its digest handle."""
+        key = self.digest(data, sr)
+        e = self._entries.pop(key, None)
+        if e is None:
+            nbytes = len(data) * data.itemsize
+            e = {"data": data, "sr": sr, "category": category, "refs": 0, "nbytes": nbytes, "names": set()}
+            self.current[category] += nbytes
+            self.peak[category] = max(self.peak[category], self.current[category])
+            self.peak_total = max(self.peak_total, self.total())
+        else:
+            self.deduped += 1
+        self._entries[key] = e  # most recently used last
+        if pin:
+            e["refs"] += 1
+        if name is not None:
+            e["names"].add(name)
+            self._names[name] = key
+        self._enforce()
+        return key
+
+    def get(self, key):
+        """(data, sr) for a handle, or None if it was evicted."""
+        e = self._entries.pop(key, None)
+        if e is None:
+            return None
+        self._entries[key] = e
+        return e["data"], e["sr"]
+
+    def find(self, name):
+        """(data, sr) stored under an alias, or None."""
+        key = self._names.get(name)
+        return None if key is None else self.get(key)
+
+    def acquire(self, key):
+        self._entries[key]["refs"] += 1
+
+    def release(self, key):
+        e = self._entries.get(key)
+        if e is not None and e["refs"] > 0:
+            e["refs"] -= 1
+            if not e["refs"]:
+                self._enforce()
+
+    def set_budget(self, nbytes):
+        self.budget = max(0, int(nbytes))
+        self._enforce()
+
+    def _enforce(self):
+        if self.total() <= self.budget:
+            return
+        for key in [k for k, e in self._entries.items() if not e["refs"]]:
+            self._drop(key)
+            if self.total() <= self.budget:
+                break
+
+    def _drop(self, key):
+        e = self._entries.pop(key)
+        self.current[e["category"]] -= e["nbytes"]
+        for name in e["names"]:
+            if self._names.get(name) == key:
+                del self._names[name]
+        self.evicted += 1
+
+    def stats(self):
+        """{category: {"count", "bytes", "peak"}} plus a "total" row."""
+        out = {c: {"count": 0, "bytes": self.current[c], "peak": self.peak[c]} for c in self.CATEGORIES}
+        for e in self._entries.values():
+            out[e["category"]]["count"] += 1
+        out["total"] = {"count": len(self._entries), "bytes": self.total(), "peak": self.peak_total}
+        return out
+
+    def report(self):
+        mb = 1.0 / (1024 * 1024)
+        lines = [f"{c:<10} {s['count']:>5} buffers  {s['bytes']*mb:8.2f} MB now  {s['peak']*mb:8.2f} MB peak"
+                 for c, s in self.stats().items()]
+        lines.append(f"budget {self.budget*mb:.1f} MB; {self.deduped} duplicates shared, {self.evicted} evicted")
+        return "\n".join(lines)
+
+# ---------------- Glyphs ----------------
+
+GLYPH_SIZE = 10  # note radius in pixels; combo and rest proportions follow from it
+
+def glyph_rows(kind, size=GLYPH_SIZE):
+    """Rasterize a note symbol centred in a (2*size+1)-pixel square into runs:
+    {row: [(x0, x1, ink), ...]}, x1 exclusive, ink "fg" or "bg" (the rest's notch)."""
+    r, half = round(size * 0.6), round(size * 0.4)  # combo heads; rest height
+    w, h = round(size * 1.6), round(size * 0.6)
+
+    def ink(dx, dy):
+        if kind == "full":
+            return "fg" if dx*dx + dy*dy < size*size else None
+        if kind == "half":
+            d = dx*dx + dy*dy
+            return "fg" if (size - 2)**2 <= d < size*size else None
+        if kind == "combo":
+            for cx in (-r, r):
+                if ((dx - cx) / half)**2 + (dy / r)**2 < 1.0:
+                    return "fg"
+            return None
+        if kind == "rest":
+            if abs(dx) > w / 2 or abs(dy) > h / 2:
+                return None
+            # the notch: the rectangle's diagonal, 2 pixels wide
+            return "bg" if abs(dy * w - dx * h) <= math.hypot(w, h) else "fg"
+        return None
+
+    rows = {}
+    for py in range(2 * size + 1):
+        runs = []
+        for px in range(2 * size + 1):
+            k = ink(px - size, py - size)
+            if runs and runs[-1][2] == k and runs[-1][1] == px:
+                runs[-1] = (runs[-1][0], px + 1, k)
+            elif k is not None:
+                runs.append((px, px + 1, k))
+        if runs:
+            rows[py] = runs
+    return rows
+
+class GlyphCache:
+    """One PhotoImage per (kind, color, size), drawn on first use, so a placed
+    symbol is a single canvas image item however many shapes make it."""
+    def __init__(self, master):
+        self.master = master
+        self.images = {}
+
+    def get(self, kind, color, size=GLYPH_SIZE):
+        key = (kind, color, size)
+        img = self.images.get(key)
+        if img is None:
+            img = tk.PhotoImage(master=self.master, width=2 * size + 1, height=2 * size + 1)
+            for y, runs in glyph_rows(kind, size).items():
+                for x0, x1, k in runs:
+                    img.put(color if k == "fg" else BG, to=(x0, y, x1, y + 1))
+            self.images[key] = img
+        return img
+
+# ---------------- Playhead ----------------
+
+PLAYHEAD_FPS = (15, 30, 60, 120)
+
+class PlayheadAnimator:
+    """Glides the playhead between beats at display rate.
+
+    The playhead is a persistent canvas item; every frame asks `clock()` for
+    the transport position in beats (None once stopped) and hands it to
+    `place(beat)`, which only moves items with coords(). Frames are capped at
+    `fps`, and `place` can skip the canvas call when nothing moved a pixel."""
+    def __init__(self, widget, clock, place, fps=60):
+        self.widget = widget
+        self.clock = clock
+        self.place = place
+        self.fps = fps
+        self.frames = 0
+        self.busy_secs = 0.0  # time spent inside frames, for cost readouts
+        self._after = None
+
+    @property
+    def running(self):
+        return self._after is not None
+
+    def start(self):
+        if self._after is None:
+            self._frame()
+
+    def stop(self):
+        if self._after is not None:
+            self.widget.after_cancel(self._after)
+            self._after = None
+
+    def _frame(self):
+        t0 = time.perf_counter()
+        beat = self.clock()
+        if beat is None:
+            self._after = None
+            return
+        self.place(beat)
+        self.frames += 1
+        self.busy_secs += time.perf_counter() - t0
+        self._after = self.widget.after(max(1, int(1000 / max(1, self.fps))), self._frame)
+
+
 # ---------------- App ----------------
 
 class Sheet42(tk.Tk):
@@ -198,18 +606,30 @@ class Sheet42(tk.Tk):
         self.metronome_after = None
         self.metronome_pos = -1  # beat index across entire sheet
         self.scrub_var = tk.IntVar(value=0)  # timeline scrubber
+        self.fps_var = tk.IntVar(value=60)  # playhead frame-rate cap
+        self._beat_anchor = (0.0, 0)  # (perf_counter, beat) of the last metronome tick
+        self._view = (0.0, 1.0)  # canvas xview, cached from xscrollcommand
+        self.flash_after = None
         self.total_beats = BARS * BEATS_PER_BAR
 
         # Symbols placed: (bar, beat, line_index) -> {"id": tag/int, "kind": str}
-        self.symbols = {}
+        self.symbols = {}  # (bar, beat, line) -> {"id": image item, "kind": str}
+        self.glyphs = GlyphCache(self)  # one picture per symbol kind, shared by every placement
 
         # Audio + samples per symbol kind
         self.audio = AudioOut()
-        self.samples = {}  # kind -> wav_bytes
+        self.store = SampleStore()
+        self.samples = {}  # kind -> store handle
+        self.sample_specs = {}  # kind -> synth args of a generated sample, re-made when the profile changes
+        self.profile_var = tk.StringVar(value=AUDIO.name())
         self._init_default_samples()
 
         self._build_ui()
         self._draw_sheet()
+        if self.audio.backend == "none":
+            self.status_var.set(f"No audio backend found: sound is off (set {AUDIO_ENV}=null or capture:FILE.wav for headless runs).")
+        elif self.audio.sink is not None:
+            self.status_var.set(f"Audio goes to the {self.audio.backend} sink.")
 
     # ---------- UI ----------
     def _build_ui(self):
@@ -288,6 +708,11 @@ class Sheet42(tk.Tk):
 
         self.metro_btn = ttk.Button(metro, text="Start", command=self.toggle_metronome)
         self.metro_btn.pack(side="left", padx=6)
+        tk.Label(metro, text="FPS", bg=BG).pack(side="left")
+        fps_box = ttk.Combobox(metro, values=PLAYHEAD_FPS, textvariable=self.fps_var, width=4, state="readonly")
+        fps_box.pack(side="left", padx=(4, 0))
+        fps_box.bind("<<ComboboxSelected>>", lambda e: setattr(self.animator, "fps", int(self.fps_var.get())))
+        self.animator = PlayheadAnimator(self, self._transport_beat, self._place_playhead, self.fps_var.get())
 
         # Sampler
         sampler = tk.LabelFrame(bar, text="Sample (Synth or Mic)", bg=BG, fg=INK, padx=8, pady=6)
@@ -313,6 +738,11 @@ class Sheet42(tk.Tk):
         ttk.Separator(sampler, orient="vertical").grid(row=0, column=8, sticky="ns", padx=6)
 
         ttk.Button(sampler, text="Record Mic", command=self.record_mic).grid(row=0, column=9, padx=4)
+        ttk.Button(sampler, text="Memory", command=self.show_memory).grid(row=0, column=10, padx=4)
+        prof = ttk.Combobox(sampler, values=list(AUDIO_PROFILES), textvariable=self.profile_var, width=8, state="readonly")
+        prof.grid(row=0, column=11, padx=(10, 4))
+        prof.bind("<<ComboboxSelected>>", lambda e: self.set_audio_profile(self.profile_var.get()))
+        ttk.Button(sampler, text="CPU", command=self.show_cpu).grid(row=0, column=12, padx=4)
 
         # Help
         help_box = tk.Frame(bar, bg=BG)
@@ -332,7 +762,7 @@ class Sheet42(tk.Tk):
 
         self.canvas = tk.Canvas(wrap, bg=BG, highlightthickness=0, height=CANVAS_H-80)
         self.hscroll = ttk.Scrollbar(wrap, orient="horizontal", command=self.canvas.xview)
-        self.canvas.configure(xscrollcommand=self.hscroll.set)
+        self.canvas.configure(xscrollcommand=self._on_xscroll)
 
         self.canvas.pack(fill="both", expand=True, side="top")
         self.hscroll.pack(fill="x", side="bottom")
@@ -346,6 +776,8 @@ class Sheet42(tk.Tk):
         self.canvas.bind("<Configure>", lambda e: self._draw_sheet())
 
         self.metro_line = None
+        self.flash_item = None
+        self.playhead_x = None
 
     def _build_timeline(self):
         tl = tk.Frame(self, bg=BG)
@@ -414,7 +846,10 @@ class Sheet42(tk.Tk):
         for (b, bt, ln), meta in old.items():
             self._draw_symbol_at(b, bt, ln, meta["kind"])
 
-        # Metronome line & place at current position
+        # Metronome line and beat flash: created once per full redraw, then only moved
+        self.metro_line = self.canvas.create_line(0, MARGIN_Y - 10, 0, MARGIN_Y + STAFF_HEIGHT + 10, fill=ACCENT, width=2, dash=(3,3))
+        self.flash_item = self.canvas.create_oval(0, 0, 0, 0, outline=ACCENT, width=2, state="hidden")
+        self.playhead_x = None
         self._draw_metronome_line()
 
     def _draw_clef(self):
@@ -500,51 +935,37 @@ class Sheet42(tk.Tk):
         return x, y
 
     def _draw_symbol_at(self, b, bt, ln, kind):
-        x, y = self._slot_center(b, bt, ln)
-        col = NOTE_COLORS.get(kind, INK)
-        size = 10
-
-        if kind == "full":
-            item = self.canvas.create_oval(x-size, y-size, x+size, y+size, fill=col, outline="")
-        elif kind == "half":
-            item = self.canvas.create_oval(x-size, y-size, x+size, y+size, outline=col, width=2)
-        elif kind == "combo":
-            r = 6
-            item1 = self.canvas.create_oval(x-r-4, y-r, x-r+4, y+r, fill=col, outline="")
-            item2 = self.canvas.create_oval(x+r-4, y-r, x+r+4, y+r, fill=col, outline="")
-            item = (item1, item2)
-        elif kind == "rest":
-            w, h = 16, 6
-            rect = self.canvas.create_rectangle(x-w/2, y-h/2, x+w/2, y+h/2, fill=col, outline="")
-            notch = self.canvas.create_line(x-w/2, y-h/2, x+w/2, y+h/2, fill=BG, width=2)
-            item = (rect, notch)
-        else:
+        if kind not in NOTE_COLORS:
             return
-
-        if isinstance(item, tuple):
-            tag = f"sym_{b}_{bt}_{ln}"
-            for it in item:
-                self.canvas.addtag_withtag(tag, it)
-            group_id = self.canvas.create_rectangle(0,0,0,0, outline="", fill="")
-            self.canvas.addtag_withtag(tag, group_id)
-            self.symbols[(b, bt, ln)] = {"id": tag, "kind": kind}
-        else:
-            self.symbols[(b, bt, ln)] = {"id": item, "kind": kind}
+        x, y = self._slot_center(b, bt, ln)
+        item = self.canvas.create_image(x, y, image=self.glyphs.get(kind, NOTE_COLORS[kind]))
+        self.symbols[(b, bt, ln)] = {"id": item, "kind": kind}
 
     # ---------- Timeline / Scrubbing ----------
     def _draw_metronome_line(self):
-        if self.metro_line is not None:
-            try:
-                self.canvas.delete(self.metro_line)
-            except:
-                pass
-        y0 = MARGIN_Y - 10
-        y1 = MARGIN_Y + STAFF_HEIGHT + 10
         pos = self.metronome_pos if self.metronome_pos >= 0 else 0
-        b = pos // BEATS_PER_BAR
-        bt = pos % BEATS_PER_BAR
-        x = MARGIN_X + b*BAR_W + (bt + 0.5)*(BAR_W/BEATS_PER_BAR)
-        self.metro_line = self.canvas.create_line(x, y0, x, y1, fill=ACCENT, width=2, dash=(3,3))
+        self._place_playhead(pos)
+
+    def _place_playhead(self, beat):
+        x = MARGIN_X + (beat + 0.5)*(BAR_W/BEATS_PER_BAR)
+        if self.playhead_x is not None and abs(x - self.playhead_x) < 0.5:
+            return
+        self.playhead_x = x
+        self.canvas.coords(self.metro_line, x, MARGIN_Y - 10, x, MARGIN_Y + STAFF_HEIGHT + 10)
+        if self.metronome_running:
+            self._ensure_line_visible()
+
+    def _transport_beat(self):
+        """Beat position (fractional) between metronome ticks; None when stopped."""
+        if not self.metronome_running:
+            return None
+        t0, pos = self._beat_anchor
+        interval = 60.0 / max(40, min(208, self.BPM.get()))
+        return max(0, pos) + min(1.0, (time.perf_counter() - t0) / interval)
+
+    def _on_xscroll(self, first, last):
+        self._view = (float(first), float(last))
+        self.hscroll.set(first, last)
 
     def scrub_to(self, new_pos):
         new_pos = max(0, min(self.total_beats-1, new_pos))
@@ -563,11 +984,9 @@ class Sheet42(tk.Tk):
         self._ensure_line_visible()
 
     def _ensure_line_visible(self):
-        if self.metro_line is None: return
-        coords = self.canvas.coords(self.metro_line)
-        if not coords: return
-        x = coords[0]
-        vx0, vx1 = self.canvas.xview()
+        if self.playhead_x is None: return
+        x = self.playhead_x
+        vx0, vx1 = self._view
         total_w = MARGIN_X*2 + BAR_W*BARS
         view_left = vx0 * total_w
         view_right = vx1 * total_w
@@ -598,6 +1017,7 @@ class Sheet42(tk.Tk):
         self.metronome_running = True
         self.metro_btn.config(text="Stop")
         self._tick_metronome()
+        self.animator.start()
 
     def _stop_metronome(self):
         self.metronome_running = False
@@ -605,6 +1025,8 @@ class Sheet42(tk.Tk):
         if self.metronome_after:
             self.after_cancel(self.metronome_after)
             self.metronome_after = None
+        self.animator.stop()
+        self._draw_metronome_line()
 
     def _current_symbol_kind_for_pos(self, pos):
         # Prioritize: combo > full > half > rest ; if none return None
@@ -626,12 +1048,11 @@ class Sheet42(tk.Tk):
         if not self.metronome_running:
             return
 
-        # advance
+        # advance (the animator glides the line from here to the next beat)
         self.metronome_pos = (self.metronome_pos + 1) % self.total_beats
+        self._beat_anchor = (time.perf_counter(), self.metronome_pos)
         self.scrub_var.set(self.metronome_pos)
         self.scrub_label.config(text="{} / {}".format(self.metronome_pos, self.total_beats-1))
-        self._draw_metronome_line()
-        self._ensure_line_visible()
 
         # play sample for this beat (placeholder sound defined by symbol kind)
         kind = self._current_symbol_kind_for_pos(self.metronome_pos)
@@ -645,30 +1066,53 @@ class Sheet42(tk.Tk):
         b = self.metronome_pos // BEATS_PER_BAR
         bt = self.metronome_pos % BEATS_PER_BAR
         x, y = self._slot_center(b, bt, STAFF_LINES//2)
-        flash = self.canvas.create_oval(x-6, y-6, x+6, y+6, outline=ACCENT, width=2)
-        self.after(80, lambda: self.canvas.delete(flash))
+        self.canvas.coords(self.flash_item, x-6, y-6, x+6, y+6)
+        self.canvas.itemconfigure(self.flash_item, state="normal")
+        if self.flash_after:
+            self.after_cancel(self.flash_after)
+        self.flash_after = self.after(80, self._hide_flash)
 
         # schedule next tick
         bpm = max(40, min(208, self.BPM.get()))
         interval_ms = int(60000 / bpm)
         self.metronome_after = self.after(interval_ms, self._tick_metronome)
 
+    def _hide_flash(self):
+        self.flash_after = None
+        self.canvas.itemconfigure(self.flash_item, state="hidden")
+
     def _play_click(self, downbeat=False):
         hz = 1200 if downbeat else 900
-        wav = synth_wave_bytes("click", hz, dur_ms=60, volume=0.6)
-        self.audio.play_wav_bytes(wav)
+        name = f"click:{hz}:{AUDIO.sr}:{AUDIO.quality}"
+        hit = self.store.find(name)  # generated once per profile, kept while the budget allows
+        if hit is None:
+            self.store.add(synth_wave_pcm("click", hz, dur_ms=60, volume=0.6), AUDIO.sr, "generated", name=name, pin=False)
+            hit = self.store.find(name)
+        self.audio.play_samples(*hit)
 
     def _play_kind(self, kind):
-        wav = self.samples.get(kind)
-        if wav:
-            self.audio.play_wav_bytes(wav)
+        handle = self.samples.get(kind)
+        if handle:
+            self.audio.play_samples(*self.store.get(handle))
 
     # ---------- Samples ----------
+    def _set_sample(self, kind, data, sr, category):
+        old = self.samples.get(kind)
+        self.samples[kind] = self.store.add(data, sr, category)
+        if old:
+            self.store.release(old)
+
+    def _synth_sample(self, kind, *spec):
+        self.sample_specs[kind] = spec
+        pcm = synth_wave_pcm(*spec)
+        self._set_sample(kind, pcm, AUDIO.sr, "generated")
+        return pcm
+
     def _init_default_samples(self):
-        self.samples["full"]  = synth_wave_bytes("sine",     660, 120, 0.55)
-        self.samples["half"]  = synth_wave_bytes("triangle", 520, 110, 0.55)
-        self.samples["combo"] = synth_wave_bytes("square",   800, 130, 0.55)
-        self.samples["rest"]  = synth_wave_bytes("click",    300,  40, 0.10)
+        self._synth_sample("full",  "sine",     660, 120, 0.55)
+        self._synth_sample("half",  "triangle", 520, 110, 0.55)
+        self._synth_sample("combo", "square",   800, 130, 0.55)
+        self._synth_sample("rest",  "click",    300,  40, 0.10)
 
     def generate_sample(self):
         try:
@@ -679,17 +1123,16 @@ class Sheet42(tk.Tk):
         except Exception:
             messagebox.showerror("Sample", "Invalid synth settings.")
             return
-        wav = synth_wave_bytes(wf, hz, ms, 0.6)
         target = self.sample_target.get()
-        self.samples[target] = wav
+        pcm = self._synth_sample(target, wf, hz, ms, 0.6)
         self.status_var.set(f"Set {target} sample: {wf}, {int(hz)} Hz, {ms} ms")
-        self.audio.play_wav_bytes(wav)
+        self.audio.play_samples(pcm, AUDIO.sr)
 
     def preview_sample(self):
         target = self.sample_target.get()
-        wav = self.samples.get(target)
-        if wav:
-            self.audio.play_wav_bytes(wav)
+        handle = self.samples.get(target)
+        if handle:
+            self.audio.play_samples(*self.store.get(handle))
         else:
             messagebox.showinfo("Sample", f"No sample set for {target}.")
 
@@ -703,7 +1146,7 @@ class Sheet42(tk.Tk):
 
         def _record_thread():
             try:
-                sr = 44100
+                sr, block = AUDIO.sr, AUDIO.block
                 frames = int(sr * (dur_ms/1000.0))
                 if 'sounddevice' in str(_sounddevice):
                     import sounddevice as sd
@@ -713,31 +1156,49 @@ class Sheet42(tk.Tk):
                 else:
                     import pyaudio
                     p = pyaudio.PyAudio()
-                    stream = p.open(format=pyaudio.paInt16, channels=1, rate=sr, input=True, frames_per_buffer=1024)
+                    stream = p.open(format=pyaudio.paInt16, channels=1, rate=sr, input=True, frames_per_buffer=block)
                     buf = bytearray()
                     to_read = frames
                     while to_read > 0:
-                        chunk = min(1024, to_read)
+                        chunk = min(block, to_read)
                         buf.extend(stream.read(chunk))
                         to_read -= chunk
                     stream.stop_stream(); stream.close(); p.terminate()
                     pcm = bytes(buf)
 
-                bio = io.BytesIO()
-                with wave.open(bio, "wb") as wf:
-                    wf.setnchannels(1)
-                    wf.setsampwidth(2)
-                    wf.setframerate(sr)
-                    wf.writeframes(pcm)
-                wav = bio.getvalue()
-                self.samples[target] = wav
+                data = array("h")
+                data.frombytes(pcm)
+                self.sample_specs.pop(target, None)
+                self.after(0, lambda: self._set_sample(target, data, sr, "recorded"))
                 self.status_var.set(f"Recorded mic sample for {target} ({dur_ms} ms).")
-                self.audio.play_wav_bytes(wav)
+                self.audio.play_samples(data, sr)
             except Exception as e:
                 messagebox.showerror("Mic record", f"Failed to record mic: {e}")
 
         threading.Thread(target=_record_thread, daemon=True).start()
 
+    def show_memory(self):
+        messagebox.showinfo("Sample memory", self.store.report())
+
+    def set_audio_profile(self, name):
+        """Switch presets and re-make the generated samples at the new rate and
+        quality; mic recordings keep the rate they were made at."""
+        AUDIO.configure(**AUDIO_PROFILES[name])
+        for kind, spec in list(self.sample_specs.items()):
+            self._synth_sample(kind, *spec)
+        self.status_var.set(f"Audio profile {name}: {AUDIO.sr} Hz, {AUDIO.block}-frame blocks, {AUDIO.quality} quality.")
+
+    def show_cpu(self):
+        self.status_var.set("Measuring CPU per audio profile…")
+        self.update_idletasks()
+        lines = []
+        for name, p in AUDIO_PROFILES.items():
+            cpu = profile_cpu(p["sr"], p["block"], p["quality"], secs=0.5)
+            mark = "*" if name == AUDIO.name() else " "
+            lines.append(f"{mark} {name:<9} {p['sr']} Hz, {p['quality']:<8} {cpu*1000:5.0f} ms CPU per s of audio")
+        self.status_var.set("")
+        messagebox.showinfo("Audio profiles", "\n".join(lines))
+
     # ---------- Misc ----------
     def _show_help(self):
         tip = (
@@ -748,10 +1209,13 @@ class Sheet42(tk.Tk):
             "• Metronome: Start/Stop at chosen BPM. It moves a timeline line.\n"
             "• Timeline scrubbing: drag the slider or use the buttons (Beat/Bar, Rewind). 'Play From Here' starts at the slider.\n"
             "• Sampler: assign a placeholder sound to each symbol kind via a small in-built synth (click/sine/square/triangle/saw),\n"
-            "  or use 'Record Mic' (optional; needs 'sounddevice' or 'pyaudio').\n"
+            "  or use 'Record Mic' (optional; needs 'sounddevice' or 'pyaudio'). 'Memory' shows what samples take.\n"
+            "• Profile sets sample rate and synth quality (Kiosk is cheapest); 'CPU' measures each profile here.\n"
             "Notes:\n"
             "• This is intentionally lightweight and single-file. Audio backends are best-effort.\n"
-            "• On some systems you may need 'simpleaudio' or a system player (afplay/aplay)."
+            "• On some systems you may need 'simpleaudio' or a system player (afplay/aplay).\n"
+            "• Headless: SHEET42_AUDIO=null discards sound but timestamps it; SHEET42_AUDIO=capture:out.wav\n"
+            "  writes everything played to out.wav, with a timing log in out.log."
         )
         messagebox.showinfo("Help", tip)
 
@@ -762,3 +1226,5 @@ if __name__ == "__main__":
         app.mainloop()
     except KeyboardInterrupt:
         pass
+    finally:
+        app.audio.close()
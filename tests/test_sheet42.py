@@ -0,0 +1,264 @@
+"""Headless checks for sheet42.py (run with `python -m pytest tests`)."""
+import math
+import os
+import sys
+from array import array
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sheet42
+
+
+def _stub_engine(frames=4096, block=64):
+    ring = sheet42.PcmRing(frames)
+    return SimpleNamespace(sr=8000, block=block, ring=ring, send=lambda *cmd: None)
+
+
+def test_engine_stream_flushes_many_blocks_without_effects():
+    engine = _stub_engine()
+    try:
+        for rack in (None, sheet42.EffectsRack(8000)):  # no rack, and a rack with nothing on
+            stream = sheet42.EngineStream(engine)
+            stream.start(rack)
+            base = engine.ring.write_pos
+            stream.schedule(0, {"full": array("f", [0.5]) * 300})
+            stream.schedule(300, {})  # queues frames [0, 300): five blocks of 64
+            assert engine.ring.write_pos - base == 300
+            pcm = array("h", engine.ring.read(300))
+            if sys.byteorder != "little":
+                pcm.byteswap()
+            assert all(abs(v - 16383) <= 1 for v in pcm)
+    finally:
+        engine.ring.close(unlink=True)
+
+
+def test_transcribe_wav_with_default_transcriber(tmp_path):
+    freqs = (196.0, 220.0, 261.63, 293.66, 246.94)  # G3 A3 C4 D4 B3
+    mix = array("f")
+    for f in freqs:
+        mix.extend(sheet42.synth_f32("sine", f, 0.4, 44100, amp=0.5))
+        mix.extend(array("f", [0.0]) * 4410)
+    path = tmp_path / "notes.wav"
+    path.write_bytes(sheet42.pcm16_to_wav(sheet42.quantize_pcm16(mix, False), 44100, channels=1))
+    found, _tr = sheet42.transcribe_wav(str(path), sheet42.TempoMap(120), sheet42.DEFAULT_LANE_HZ)
+    assert [sheet42.NOTE_NAMES[(round(12 * math.log2(f / 440.0)) + 9) % 12] for _t, _l, f, _s in found] == \
+        ["G", "A", "C", "D", "B"]
+
+
+def test_journal_dirs_are_claimed_per_instance(tmp_path):
+    base = str(tmp_path / "journal")
+    first, second = sheet42.Journal(base), sheet42.Journal(base)
+    assert first.dir == base and second.dir == base + ".2"
+    first.record([["set", "waveform", "sine", "saw"]])
+    first.compact({"events": [], "waveform": "saw"})
+    second.compact({"events": [], "waveform": "square"})
+    first.close()
+    first._lock.close()  # as if that instance exited
+    again = sheet42.Journal(base)
+    assert again.dir == base and again.recover()["waveform"] == "saw"
+
+
+def test_journal_snapshot_keeps_bounded_history(tmp_path):
+    j = sheet42.Journal(str(tmp_path / "journal"))
+    for i in range(sheet42.JOURNAL_KEEP + 50):
+        j.record([["set", "bpm", i, i + 1]])
+    j.compact({"events": [], "bpm": sheet42.JOURNAL_KEEP + 50})
+    j.close()
+    j._lock.close()
+    back = sheet42.Journal(str(tmp_path / "journal"))
+    state = back.recover()
+    assert len(back.history) == back.cursor == sheet42.JOURNAL_KEEP
+    assert back.history[-1] == [["set", "bpm", sheet42.JOURNAL_KEEP + 49, sheet42.JOURNAL_KEEP + 50]]
+    assert state["bpm"] == sheet42.JOURNAL_KEEP + 50
+
+
+def test_audio_profiles_match_sheet42_plus():
+    import sheet42_plus
+    assert sheet42_plus.AUDIO_PROFILES == sheet42.AUDIO_PROFILES
+    assert sheet42_plus.BLOCK_SIZES == sheet42.BLOCK_SIZES
+
+
+class _Slider:
+    """Stands in for the BPM IntVar: set() runs the write trace straight away."""
+
+    def __init__(self, on_write):
+        self.value, self.on_write = 0, on_write
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+        self.on_write()
+
+
+def test_bpm_slider_mirrors_a_fractional_tempo_without_rounding_it():
+    app = SimpleNamespace(tempo_map=sheet42.TempoMap(99.5), _bpm_shown=False, changed=0)
+    app._tempo_changed = lambda: setattr(app, "changed", app.changed + 1)
+    app.BPM = _Slider(lambda: sheet42.Sheet42._on_bpm_change(app))
+    sheet42.Sheet42._show_bpm(app, app.tempo_map.bpms[0])
+    assert app.BPM.get() == 100
+    assert app.tempo_map.points() == [(0.0, 99.5, False)] and app.changed == 0
+    app.BPM.set(120)  # the user dragging the slider still edits the map
+    assert app.tempo_map.points() == [(0.0, 120.0, False)] and app.changed == 1
+
+
+def test_render_cache_counts_bytes_and_touches_hits(tmp_path):
+    cache = sheet42.RenderCache(str(tmp_path), max_bytes=1 << 20)
+    cache.put(cache.key("a"), array("f", [0.0]) * 100)
+    cache.put(cache.key("b"), array("f", [0.0]) * 100)
+    assert cache._size == 800
+    path = cache._path(cache.key("a"))
+    assert cache.get(cache.key("a")) is not None  # mapped and kept open
+    os.utime(path, (1, 1))
+    assert cache.get(cache.key("a")) is not None  # served from the open map
+    assert os.stat(path).st_mtime > 1
+
+
+def test_capture_sink_records_loop_live_and_one_shot_playback(tmp_path):
+    import time
+    import wave
+    path = str(tmp_path / "out.wav")
+    sink = sheet42.open_sink("capture:" + path)
+    try:
+        assert sheet42.can_stream()
+        sr = 8000
+        loop = sheet42.LoopPlayer(sr)
+        loop.start(sheet42.quantize_pcm16(array("f", [0.25]) * 400, False))
+        live = sheet42.LiveStream(sr)
+        live.start()
+        live.schedule(0, {"full": array("f", [0.25]) * 800})
+        time.sleep(0.3)
+        loop.stop()
+        live.stop()
+        assert sheet42.play_wav_bytes(sheet42.synth_wave("sine", 440.0, 0.05, sr))
+        assert sink.frames >= 0.2 * sr * 2  # both streams kept up with the clock
+        assert loop.played and live.frame
+    finally:
+        sheet42.open_sink("")
+    with wave.open(path) as wf:
+        assert wf.getframerate() == 8000
+        pcm = array("h", wf.readframes(wf.getnframes()))
+    assert max(pcm) >= 2 * 8191  # loop and live stream overlap on the timeline
+    assert os.path.exists(str(tmp_path / "out.log"))
+
+
+def _paint(rows, width):
+    grid = [[" "] * width for _ in range(2 * sheet42.GLYPH_SIZE + 1)]
+    for y, runs in rows.items():
+        for x0, x1, ink in runs:
+            for x in range(x0, x1):
+                grid[y][x] = "#" if ink == "fg" else "."
+    return ["".join(r) for r in grid]
+
+
+def test_sync_follower_recovers_offset_and_takes_the_leaders_tempo(capsys):
+    import json
+    import random
+    import threading
+    import time
+    port = random.randrange(40000, 50000)
+    skew = 5.0
+    clock = lambda: time.perf_counter() + skew
+    try:
+        lead = sheet42.TransportSync(port=port, iface="127.0.0.1", node="leader", clock=clock)
+    except OSError as e:
+        pytest.skip(f"no multicast on loopback: {e}")
+    tempo, start, stop = sheet42.TempoMap(97.5), clock(), threading.Event()
+
+    def beacon():
+        while not stop.is_set():
+            lead.poll()
+            beat = tempo.time_to_beat(clock() - start)
+            lead.send({"playing": True, "beat": beat, "tempo": [list(p) for p in tempo.points()]})
+            time.sleep(1.0 / sheet42.SYNC_HZ)
+
+    thread = threading.Thread(target=beacon, daemon=True)
+    thread.start()
+    try:
+        assert sheet42.sync_cli(["follow", "--iface", "127.0.0.1", "--port", str(port), "--bpm", "120",
+                                 "--skew", "-2", "--start-beat", "7", "--secs", "2", "--json"]) == 0
+    finally:
+        stop.set()
+        thread.join()
+        lead.close()
+    out = capsys.readouterr().out
+    summary = json.loads(out[out.index("{"):])
+    assert summary["tempo"] == [[0.0, 97.5, False]]
+    assert abs(summary["peers"]["leader"]["offset_ms"] - 7000.0) < 5.0
+    assert summary["seeks"] == 1 and abs(summary["phase_ms"]) < 5.0
+
+
+def test_glyph_rows_shapes():
+    size = sheet42.GLYPH_SIZE
+    for kind in ("full", "half", "combo", "rest"):
+        rows = sheet42.glyph_rows(kind, size)
+        assert rows and all(0 <= y <= 2 * size for y in rows)
+        for runs in rows.values():  # sorted, disjoint, inside the box
+            assert all(0 <= x0 < x1 <= 2 * size + 1 for x0, x1, _ in runs)
+            assert all(a[1] <= b[0] for a, b in zip(runs, runs[1:]))
+        pic = _paint(rows, 2 * size + 1)
+        if kind != "rest":  # symmetric about the note position
+            assert pic == [r[::-1] for r in pic]
+            assert pic == pic[::-1]
+    full = _paint(sheet42.glyph_rows("full", size), 2 * size + 1)
+    half = _paint(sheet42.glyph_rows("half", size), 2 * size + 1)
+    assert full[size][size] == "#" and half[size][size] == " "  # filled vs hollow head
+    assert "." in "".join(_paint(sheet42.glyph_rows("rest", size), 2 * size + 1))  # the notch
+    assert sheet42.glyph_rows("nope", size) == {}
+
+
+def test_glyph_rows_tail_keeps_the_note_centred():
+    size, tail = sheet42.GLYPH_SIZE, 30
+    rows = sheet42.glyph_rows("half", size, tail)
+    pic = _paint(rows, 2 * (size + tail) + 1)
+    c = size + tail
+    assert pic[size][c + tail] == "#" and pic[size][c + tail + 1:].strip() == ""  # bar ends at the note's end
+    assert pic[size][:c - size].strip() == ""  # nothing left of the head: the centre is the note
+    assert [r[c - size:c + size + 1] for r in pic][0] == _paint(sheet42.glyph_rows("half", size), 2 * size + 1)[0]
+
+
+def test_glyph_cache_draws_each_picture_once(monkeypatch):
+    made = []
+
+    class FakeImage:
+        def __init__(self, master=None, width=0, height=0):
+            self.size, self.puts = (width, height), []
+            made.append(self)
+
+        def put(self, color, to):
+            self.puts.append((color, to))
+
+    monkeypatch.setattr(sheet42.tk, "PhotoImage", FakeImage)
+    cache = sheet42.GlyphCache(None)
+    a = cache.get("combo", "#ff7f0e")
+    assert cache.get("combo", "#ff7f0e") is a and len(made) == 1
+    assert cache.get("combo", "#000000") is not a  # another colour is another picture
+    b = cache.get("full", "#00a6a6", tail=12)
+    assert b.size == (2 * (sheet42.GLYPH_SIZE + 12) + 1, 2 * sheet42.GLYPH_SIZE + 1)
+    runs = sum(len(r) for r in sheet42.glyph_rows("combo", sheet42.GLYPH_SIZE).values())
+    assert len(a.puts) == runs and {c for c, _ in a.puts} == {"#ff7f0e"}
+    assert {c for c, _ in cache.get("rest", "#555555").puts} == {"#555555", sheet42.BG}
+
+
+def test_glyph_images_on_a_real_canvas():
+    try:
+        root = sheet42.tk.Tk()
+    except sheet42.tk.TclError:
+        pytest.skip("no display")
+    try:
+        canvas = sheet42.tk.Canvas(root)
+        cache = sheet42.GlyphCache(root)
+        img = cache.get("half", "#c51d8a")
+        assert (img.width(), img.height()) == (2 * sheet42.GLYPH_SIZE + 1,) * 2
+        assert img.transparency_get(0, 0) and not img.transparency_get(sheet42.GLYPH_SIZE, 1)
+        items = [canvas.create_image(100 + 20 * i, 50, image=img, tags=("zoom", "symbol")) for i in range(50)]
+        assert len(canvas.find_withtag("symbol")) == len(items)  # one item per note
+        canvas.scale("zoom", 60, 0, 2.0, 1)  # zoom: images move, their size stays
+        assert canvas.coords(items[1]) == [60 + 2.0 * (120 - 60), 50.0]
+        x0, y0, x1, y1 = canvas.bbox(items[1])
+        assert x1 - x0 == img.width()
+    finally:
+        root.destroy()